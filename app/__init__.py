@@ -0,0 +1,10 @@
+"""
+The app shares the loaders' building blocks (record readers, schema policy, replica routing,
+load scheduling, slow-query capture) with ``template/webapp`` rather than keeping copies of them.
+"""
+import sys
+from pathlib import Path
+
+_TEMPLATE = Path(__file__).resolve().parent.parent / "template"
+if str(_TEMPLATE) not in sys.path:
+    sys.path.append(str(_TEMPLATE))  # Makes ``webapp`` importable
@@ -1,23 +1,111 @@
 from dotenv import load_dotenv
 import os
+import threading
 
-# Load environment variables from .env file
-load_dotenv()
+_settings = None
+_settings_lock = threading.Lock()
 
-class Settings:
-    DB_USER = os.getenv("DB_USER")
-    DB_PASSWORD = os.getenv("DB_PASSWORD")
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    DB_NAME = os.getenv("DB_NAME")
 
-    # Construct DATABASE_URL dynamically
-    DATABASE_URL = (
-        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    )
+def load_settings():
+    """
+    Read .env and the environment into a Settings object, once per process.
+    Importing this module does neither; the first attribute access on ``settings`` does.
+    """
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = _build_settings()
+    return _settings
 
-    # Other environment variables
-    APP_ENV = os.getenv("APP_ENV", "production")
-    DEBUG = os.getenv("DEBUG", False)
 
-settings = Settings()
+def _build_settings():
+    # Load environment variables from .env file
+    load_dotenv()
+
+    class Settings:
+        DB_USER = os.getenv("DB_USER")
+        DB_PASSWORD = os.getenv("DB_PASSWORD")
+        DB_HOST = os.getenv("DB_HOST", "localhost")
+        DB_PORT = os.getenv("DB_PORT", "5432")
+        DB_NAME = os.getenv("DB_NAME")
+
+        # Construct DATABASE_URL dynamically
+        DATABASE_URL = (
+            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        )
+
+        # Storage backend: postgres (default) or duckdb (embedded columnar file, see webapp/backends.py)
+        DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+        # DuckDB database file, and whether this process opens it read-only (lets API and dashboard share it)
+        DUCKDB_PATH = os.getenv("DUCKDB_PATH", "sundaes.duckdb")
+        DUCKDB_READ_ONLY = os.getenv("DUCKDB_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+        # Read replicas: comma-separated SQLAlchemy URLs; empty means every read goes to the primary
+        DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+        # Seconds between replica health checks
+        DB_REPLICA_HEALTH_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_INTERVAL", "5"))
+        # Replicas lagging further behind than this (seconds) are treated as unhealthy
+        DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))
+        # After a load, route reads to the primary for this many seconds (0 disables read-your-writes)
+        DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "0"))
+        # File touched by the loaders after every commit. Only readers that see the same file get read-your-writes:
+        # processes on one host, or hosts sharing it on a network filesystem
+        DB_WRITE_MARKER = os.getenv("DB_WRITE_MARKER", "/tmp/sundae_db_last_write")
+
+        # Schema evolution: new keys present in at least this fraction of rows become real columns
+        SCHEMA_DENSE_THRESHOLD = float(os.getenv("SCHEMA_DENSE_THRESHOLD", "0.5"))
+        # JSONB column holding the sparser keys
+        SCHEMA_EXTRAS_COLUMN = os.getenv("SCHEMA_EXTRAS_COLUMN", "extras")
+        # GIN-index the extras column (speeds up extras ? 'key' and extras @> '{...}' filters and promotion)
+        SCHEMA_EXTRAS_GIN_INDEX = os.getenv("SCHEMA_EXTRAS_GIN_INDEX", "false").lower() in ("1", "true", "yes")
+        # Fail a schema change rather than wait longer than this for its table lock
+        SCHEMA_LOCK_TIMEOUT = os.getenv("SCHEMA_LOCK_TIMEOUT", "5s")
+
+        # Validation: where rejected rows go (table, file or both), and the file used for file quarantine
+        QUARANTINE_TO = os.getenv("QUARANTINE_TO", "table").lower()
+        QUARANTINE_PATH = os.getenv("QUARANTINE_PATH", "quarantine.ndjson")
+
+        # Resumable loads: records committed (with a checkpoint) per transaction
+        LOAD_CHUNK_ROWS = int(os.getenv("LOAD_CHUNK_ROWS", "50000"))
+        # Tables without a foreign-key dependency between them load concurrently, this many at once
+        LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "4"))
+        # Drop non-unique indexes (and foreign keys on PostgreSQL) during multi-table loads, rebuilding them after
+        LOAD_DEFER_CHECKS = os.getenv("LOAD_DEFER_CHECKS", "false").lower() in ("1", "true", "yes")
+
+        # Slow-query capture: statements at least this slow are recorded (GET /admin/slow-queries)
+        SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+        # Slowest (and most recent) statements kept in memory
+        SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "50"))
+        # Fraction of captured SELECTs re-run under EXPLAIN (ANALYZE, BUFFERS), and the time allowed for it
+        SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+        SLOW_QUERY_EXPLAIN_TIMEOUT = os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT", "10s")
+        # Token expected in the X-Admin-Token header of /admin/slow-queries; unset keeps the endpoints closed
+        SLOW_QUERY_ADMIN_TOKEN = os.getenv("SLOW_QUERY_ADMIN_TOKEN", "")
+        # Log every SQL statement (SQLAlchemy echo); noisy, off by default
+        SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+        # Identical concurrent GET requests share one database computation (GET /admin/coalescing)
+        API_COALESCE_REQUESTS = os.getenv("API_COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+        # Other environment variables
+        APP_ENV = os.getenv("APP_ENV", "production")
+        DEBUG = os.getenv("DEBUG", False)
+
+    return Settings()
+
+
+class _LazySettings:
+    """Stands in for the Settings object until first use; reads and writes go to ``load_settings()``."""
+
+    def __getattr__(self, name):
+        return getattr(load_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(load_settings(), name, value)
+
+    def __delattr__(self, name):
+        delattr(load_settings(), name)
+
+
+settings = _LazySettings()
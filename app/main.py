@@ -1,11 +1,31 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from app.database import dispose_engines
 from app.routes.sundae_routes import router as sundae_router
+from app.routes.admin_routes import router as admin_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engines are created lazily by the first request; release their pools on shutdown
+    yield
+    dispose_engines()
+
+
+def create_app():
+    """Build the API application (no database work happens until a request needs it)."""
+    app = FastAPI(title="Sundae API", version="1.0", lifespan=lifespan)
+
+    # Register the sundae routes
+    app.include_router(sundae_router)
+    app.include_router(admin_router)  # Slow-query capture
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Welcome to the Sundae API!"}
 
-app = FastAPI(title="Sundae API", version="1.0")
+    return app
 
-# Register the sundae routes
-app.include_router(sundae_router)
 
-@app.get("/")
-def read_root():
-    return {"message": "Welcome to the Sundae API!"}
+app = create_app()
@@ -1,80 +1,64 @@
-import json
 import os
+from itertools import chain, islice
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column, Integer, String, Float, inspect
+    create_engine, MetaData, Table, Column, Integer, inspect
 )
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
-from app.database import engine
+from app.database import get_engine
+from webapp.readers import iter_batches, iter_records
+from webapp.schema_policy import evolve_schema, group_by_keys, split_extras
+
+BATCH_SIZE = 5000
 
 # Initialize MetaData
 metadata = MetaData()
 
-def infer_column_type(value):
-    """
-    Infer SQLAlchemy column type based on the value's Python type.
-    """
-    if isinstance(value, int):
-        return Integer
-    elif isinstance(value, float):
-        return Float
-    else:
-        return String
-
 def update_table_schema(table_name, json_file):
     """
-    Update the table schema based on changes in the JSON file.
+    Update the table schema based on changes in the data file.
+    The file may be a JSON array, NDJSON or CSV, optionally gzip/zstd compressed.
+    Dense new fields become columns in a single ALTER TABLE; sparse ones are kept
+    in the JSONB extras column (see template/webapp/schema_policy.py).
     Args:
         table_name (str): The name of the table.
-        json_file (str): Path to the JSON file.
+        json_file (str): Path to the data file.
     """
     try:
-        with open(json_file, "r") as file:
-            data = json.load(file)
+        records = iter_records(json_file)
 
-        if not data or not isinstance(data, list):
+        # Extract the first batch to measure how often each field is set
+        data_sample = list(islice(records, BATCH_SIZE))
+        if not data_sample or not isinstance(data_sample[0], dict):
             print(f"No valid data found in {json_file}.")
             return
 
-        # Extract a sample row to infer schema
-        data_sample = data[0]
         print(f"Inferring schema for table '{table_name}'...")
 
+        engine = get_engine()
         inspector = inspect(engine)
 
         # Check if table already exists
         if table_name in inspector.get_table_names():
             print(f"Table '{table_name}' already exists. Checking for schema changes...")
-            with engine.connect() as conn:
-                # Reflect the existing table
-                existing_table = Table(table_name, metadata, autoload_with=engine)
-
-                # Compare existing columns with new schema
-                existing_columns = {col.name for col in existing_table.columns}
-
-                # Identify new or missing columns
-                for key, value in data_sample.items():
-                    if key not in existing_columns:
-                        print(f"Adding new column '{key}' to table '{table_name}'...")
-                        alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {key} {infer_column_type(value).__visit_name__.upper()}"
-                        conn.execute(alter_sql)
-
-                print(f"Schema for table '{table_name}' updated successfully.")
         else:
-            # Create a new table if it doesn't exist
+            # Create a new table if it doesn't exist; its columns are added with the other new fields
             print(f"Creating new table '{table_name}'...")
-            columns = [Column("id", Integer, primary_key=True, autoincrement=True)]
-            for key, value in data_sample.items():
-                columns.append(Column(key, infer_column_type(value)))
-
-            new_table = Table(table_name, metadata, *columns)
+            Table(table_name, metadata, Column("id", Integer, primary_key=True, autoincrement=True))
             metadata.create_all(engine)
             print(f"Table '{table_name}' created successfully.")
 
+        with engine.begin() as conn:
+            columns = evolve_schema(conn, table_name, data_sample)
+        print(f"Schema for table '{table_name}' updated successfully.")
+
         # Load the data
         print(f"Loading data into table '{table_name}'...")
-        with engine.connect() as conn:
-            conn.execute(Table(table_name, metadata, autoload_with=engine).insert(), data)
+        with engine.begin() as conn:
+            table = Table(table_name, MetaData(), autoload_with=conn)
+            for batch in iter_batches(chain(data_sample, records), BATCH_SIZE):
+                for rows in group_by_keys(split_extras(batch, columns)):
+                    conn.execute(table.insert(), rows)
         print(f"Data loaded into table '{table_name}' successfully.")
 
     except SQLAlchemyError as e:
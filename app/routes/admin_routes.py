@@ -0,0 +1,32 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.routes.sundae_routes import single_flight
+from webapp.slow_queries import admin_token_valid, slow_queries
+
+router = APIRouter(prefix="/admin")
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    # Captured statements carry their parameters, so they are only shown to holders of SLOW_QUERY_ADMIN_TOKEN
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Send SLOW_QUERY_ADMIN_TOKEN in the X-Admin-Token header")
+
+
+# Statements slower than SLOW_QUERY_MS, slowest (or newest) first, with sampled EXPLAIN plans
+@router.get("/slow-queries", dependencies=[Depends(require_admin_token)])
+def get_slow_queries(order: Literal["worst", "recent"] = "worst", limit: int = Query(20, ge=1, le=1000)):
+    entries = slow_queries.worst() if order == "worst" else slow_queries.recent()
+    return {"threshold_ms": slow_queries.threshold_ms, "captured": slow_queries.captured, "queries": entries[:limit]}
+
+
+# Forget the captured statements (e.g. after deploying a fix)
+@router.delete("/slow-queries", status_code=204, dependencies=[Depends(require_admin_token)])
+def clear_slow_queries():
+    slow_queries.clear()
+
+
+# How many read requests were answered by an identical request already in flight
+@router.get("/coalescing")
+def get_coalescing():
+    return single_flight.status()
@@ -1,19 +1,42 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.config import settings
+from app.database import get_read_db
+from webapp.coalesce import SingleFlight, coalesced
 from sqlalchemy import text
 
 router = APIRouter()
 
+# Identical concurrent reads share one execution, unless API_COALESCE_REQUESTS is off (see GET /admin/coalescing)
+single_flight = SingleFlight(lambda: settings.API_COALESCE_REQUESTS)
+
+# Statements are built once so SQLAlchemy's compiled cache is reused across requests
+SUNDAE_LIST_QUERY = text("SELECT * FROM sundaes")
+
+# Sundae details plus volume (number of sales) and revenue (total price) in one round trip
+SUNDAE_DETAIL_QUERY = text(
+    """
+    SELECT s.*, m.volume, m.revenue
+    FROM sundaes s
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS volume, SUM(sales.price) AS revenue
+        FROM sales
+        WHERE sales.sundae_id = s.id
+    ) m
+    WHERE s.id = :id
+    """
+)
+
 # GET /sundaes: Return all available sundaes
 @router.get("/sundaes")
-def get_all_sundaes(db: Session = Depends(get_db)):
+@coalesced("sundaes", single_flight)  # Identical concurrent requests share one execution
+def get_all_sundaes(db: Session = Depends(get_read_db)):
     """
     Fetch all available sundaes.
     """
     try:
         # Execute raw SQL query to fetch all sundaes
-        result = db.execute(text("SELECT * FROM sundaes")).fetchall()
+        result = db.execute(SUNDAE_LIST_QUERY).fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="No sundaes found")
@@ -23,21 +46,22 @@ def get_all_sundaes(db: Session = Depends(get_db)):
         
         return sundaes
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # GET /sundaes/{id}: Return details of a specific sundae with volume and revenue
 @router.get("/sundaes/{id}")
-def get_sundae_by_id(id: str, db: Session = Depends(get_db)):
+@coalesced("sundae", single_flight)
+def get_sundae_by_id(id: str, db: Session = Depends(get_read_db)):
     """
     Fetch details of a specific sundae, including volume and revenue.
     """
     try:
-        # Query to get sundae details
-        sundae_result = db.execute(
-            text("SELECT * FROM sundaes WHERE id = :id"), {"id": id}
-        ).fetchone()
+        # Query sundae details together with its sales metrics
+        sundae_result = db.execute(SUNDAE_DETAIL_QUERY, {"id": id}).fetchone()
 
         if not sundae_result:
             raise HTTPException(status_code=404, detail=f"Sundae with ID '{id}' not found")
@@ -45,27 +69,13 @@ def get_sundae_by_id(id: str, db: Session = Depends(get_db)):
         # Convert result to dictionary
         sundae = dict(sundae_result._mapping)
 
-        # Query to calculate volume (number of sales) and revenue (total price)
-        sales_result = db.execute(
-            text(
-                """
-                SELECT COUNT(*) AS volume, SUM(price) AS revenue
-                FROM sales
-                WHERE sundae_id = :id
-                """
-            ),
-            {"id": id},
-        ).fetchone()
-
-        # Extract sales data
-        volume = sales_result.volume or 0
-        revenue = float(sales_result.revenue) if sales_result.revenue else 0.0
-
-        # Add volume and revenue to the sundae details
-        sundae["volume"] = volume
-        sundae["revenue"] = revenue
+        # Normalise sales metrics
+        sundae["volume"] = sundae["volume"] or 0
+        sundae["revenue"] = float(sundae["revenue"]) if sundae["revenue"] else 0.0
 
         return sundae
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,7 @@
-from app.database import Base, engine, SessionLocal
-from app.utils.loader import load_data
+from app.database import get_engine, get_session_local
+from webapp.models import Sale, Sundae  # The webapp's models: both loaders write the same tables
+from app.utils.loader import load_sales, load_sundaes
+from webapp.scheduler import load_tables
 
 # File paths to the JSON files
 SUNDAES_FILE = "data/sundaes.json"
@@ -10,12 +12,20 @@ def initialize_database():
     Create tables in the database and load data.
     """
     print("Creating tables in the database...")
-    Base.metadata.create_all(bind=engine)  # Create tables based on ORM models
+    # Create the tables of the ORM models
+    Sale.metadata.create_all(bind=get_engine(), tables=[Sundae.__table__, Sale.__table__])
     print("Tables created successfully!")
 
     print("Loading data into tables...")
-    with SessionLocal() as db:
-        load_data(db, SUNDAES_FILE, SALES_FILE)
+    loaders = {Sundae.__tablename__: load_sundaes, Sale.__tablename__: load_sales}
+
+    def load(file_path, model_class):
+        # One session (and connection) per table, so independent tables load concurrently
+        with get_session_local()() as db:
+            loaders[model_class.__tablename__](db, file_path)
+
+    # Ordered by the models' foreign keys: sales start once sundaes are in
+    load_tables(load, [(SUNDAES_FILE, Sundae), (SALES_FILE, Sale)], Sale.__table__.metadata, engine=get_engine())
     print("Database setup complete!")
 
 if __name__ == "__main__":
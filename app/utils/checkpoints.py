@@ -0,0 +1,79 @@
+"""
+Durable checkpoints for chunked, resumable loads of large files.
+
+A load commits every ``LOAD_CHUNK_ROWS`` records. Each chunk's transaction also
+upserts a ``load_checkpoints`` row keyed by table and file fingerprint,
+recording how many records of the file have been consumed (``record_index``)
+and how many rows were inserted (``rows_committed``). Rows and checkpoint
+commit or roll back together, so ``--resume`` continues after the last
+committed chunk without inserting anything twice.
+"""
+import time
+
+from sqlalchemy import BigInteger, Boolean, Column, Float, Integer, MetaData, String, Table, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from webapp.readers import file_fingerprint
+
+PRIMARY = -1  # ``shard`` value of checkpoints kept on the primary database (the app is not sharded)
+
+checkpoint_metadata = MetaData()
+LoadCheckpoints = Table(
+    "load_checkpoints",
+    checkpoint_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("fingerprint", String, primary_key=True),
+    Column("shard", Integer, primary_key=True, autoincrement=False),
+    Column("source", String, nullable=True),
+    Column("record_index", BigInteger, nullable=False),  # Records of the file consumed by committed chunks
+    Column("rows_committed", BigInteger, nullable=False),  # Rows those chunks inserted
+    Column("complete", Boolean, nullable=False, default=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+class Checkpointer:
+    """
+    Progress of one file being loaded into one table.
+
+    Args:
+        engine (Engine): Database holding the table and its checkpoints.
+        table_name (str): Target table.
+        source (str): The file being loaded.
+        resume (bool): Continue from the stored checkpoint; otherwise it is cleared and the load starts over.
+    """
+
+    def __init__(self, engine, table_name, source, resume=False):
+        self.key = {"table_name": table_name, "fingerprint": file_fingerprint(source), "shard": PRIMARY}
+        self.source = str(source)
+        self.start, self.rows_committed, self.complete = 0, 0, False
+
+        where = [LoadCheckpoints.c[name] == value for name, value in self.key.items()]
+        with engine.begin() as conn:
+            LoadCheckpoints.create(bind=conn, checkfirst=True)
+            if not resume:
+                conn.execute(delete(LoadCheckpoints).where(*where))
+                return
+            row = conn.execute(
+                select(LoadCheckpoints.c.record_index, LoadCheckpoints.c.rows_committed, LoadCheckpoints.c.complete)
+                .where(*where)
+            ).fetchone()
+        if row is not None:
+            self.start, self.rows_committed, self.complete = row
+
+    def save(self, conn, record_index, rows, complete=False):
+        """
+        Record that the file is loaded up to ``record_index`` and that ``rows`` more rows were inserted,
+        inside the transaction of ``conn`` that commits them.
+        """
+        self.rows_committed += rows
+        values = {"source": self.source, "record_index": record_index, "rows_committed": self.rows_committed,
+                  "complete": complete, "updated_at": time.time()}
+        where = [LoadCheckpoints.c[name] == value for name, value in self.key.items()]
+        if conn.dialect.name == "duckdb":
+            # The driver reports -1 rows for every UPDATE, so UPDATE-then-INSERT cannot tell whether the row exists
+            statement = pg_insert(LoadCheckpoints).values(**self.key, **values)
+            conn.execute(statement.on_conflict_do_update(index_elements=list(self.key), set_=values))
+        elif conn.execute(update(LoadCheckpoints).where(*where).values(**values)).rowcount == 0:
+            conn.execute(insert(LoadCheckpoints).values(**self.key, **values))
+        self.complete = complete
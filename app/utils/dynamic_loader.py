@@ -1,114 +1,138 @@
-import json
 import argparse
-from sqlalchemy import create_engine, Column, Integer, String, Float, MetaData, Table, insert
+from itertools import chain, islice
+from sqlalchemy import Column, Integer, MetaData, Sequence, Table, insert
 from sqlalchemy.exc import SQLAlchemyError
-from app.database import engine
+from app.config import settings
+from app.database import get_engine
+from app.utils.checkpoints import Checkpointer
+from webapp.backends import column_types, reflect_table
+from webapp.readers import iter_batches, iter_records
+from webapp.routing import mark_write
+from webapp.schema_policy import evolve_schema, group_by_keys, split_extras
 
-# Initialize MetaData
-metadata = MetaData()
-
-
-def infer_column_type(value):
-    """
-    Infer SQLAlchemy column type based on the value type.
-    """
-    if isinstance(value, int):
-        return Integer
-    elif isinstance(value, float):
-        return Float
-    else:
-        return String
+BATCH_SIZE = 5000
 
 
 def merge_table_schema(table_name, data_sample):
     """
     Dynamically merge the table schema with new fields from the JSON data.
+    Dense new fields become columns, added in a single ALTER TABLE; sparse ones go
+    to the JSONB extras column (see template/webapp/schema_policy.py).
 
     Args:
         table_name (str): The name of the table.
-        data_sample (dict): A sample JSON record to infer the schema.
+        data_sample (list): The first records of the file, used to measure how often each field is set.
+
+    Returns:
+        set: The table's real columns, or None if the schema could not be updated.
     """
     try:
-        # Reflect existing tables in the database
-        metadata.reflect(bind=engine)
-        existing_table = metadata.tables.get(table_name)
-
-        # Check for existing columns if the table exists
-        existing_columns = {col.name for col in existing_table.columns} if existing_table else set()
-        new_columns = []
-
-        # Infer new columns from data_sample
-        for key, value in data_sample.items():
-            if key not in existing_columns:
-                column_type = infer_column_type(value)
-                new_columns.append(Column(key, column_type))
-            else:
-                print(f"Column '{key}' already exists in '{table_name}', skipping...")
-
-        # If the table doesn't exist, create it
-        if existing_table is None:
+        engine = get_engine()
+
+        # If the table doesn't exist, create it; its columns are then added like any new fields
+        if not column_types(engine, table_name):
             print(f"Creating new table '{table_name}'...")
-            columns = [Column("id_pk", Integer, primary_key=True, autoincrement=True)] + new_columns
-            new_table = Table(table_name, metadata, *columns)
-            metadata.create_all(engine)
+            # An explicit sequence rather than SERIAL, which DuckDB does not have. It is also the server-side
+            # default, so inserts through the reflected table (which has no Sequence) still get keys.
+            sequence = Sequence(f"{table_name}_id_pk_seq")
+            key = Column("id_pk", Integer, sequence, server_default=sequence.next_value(), primary_key=True)
+            Table(table_name, MetaData(), key).create(engine)
             print(f"Table '{table_name}' created successfully.")
-        else:
-            # Dynamically add new columns to the existing table
-            with engine.connect() as conn:
-                for column in new_columns:
-                    print(f"Adding new column '{column.name}' to table '{table_name}'...")
-                    alter_query = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(engine)}"
-                    conn.execute(alter_query)
-            print(f"Schema for table '{table_name}' updated successfully.")
+
+        with engine.begin() as conn:
+            columns = evolve_schema(conn, table_name, data_sample)
+        print(f"Schema for table '{table_name}' updated successfully.")
+        return columns
     except SQLAlchemyError as e:
         print(f"Error updating schema for table '{table_name}': {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
 
-def load_json_data_to_table(json_file, table_name):
+def load_json_data_to_table(json_file, table_name, resume=False):
     """
-    Load data from JSON file into the corresponding table.
+    Load data from a data file into the corresponding table.
+    The file may be a JSON array, NDJSON or CSV, optionally gzip/zstd compressed,
+    and is streamed in batches rather than read into memory at once.
+    Every ``LOAD_CHUNK_ROWS`` records are committed together with a checkpoint, so an
+    interrupted load can be resumed instead of started over.
     Args:
-        json_file (str): Path to the JSON file.
+        json_file (str): Path to the data file.
         table_name (str): Table name to insert data into.
+        resume (bool): Continue after the last chunk committed from this (unchanged) file.
     """
     try:
-        # Load JSON data
-        with open(json_file, "r") as file:
-            data = json.load(file)
+        engine = get_engine()
+        checkpoint = Checkpointer(engine, table_name, json_file, resume=resume)
+        if checkpoint.complete:
+            print(f"'{json_file}' was already loaded into '{table_name}' ({checkpoint.rows_committed} rows).")
+            return
+        if checkpoint.start:
+            print(f"Resuming '{json_file}' at record {checkpoint.start} ({checkpoint.rows_committed} rows already committed).")
+
+        # Committed records are decoded and skipped: compressed and JSON-array files cannot be seeked into
+        records = islice(iter_records(json_file), checkpoint.start, None)
+        data_sample = list(islice(records, BATCH_SIZE))
 
-        if not data or not isinstance(data, list):
-            print("No data found or invalid JSON format.")
+        if not data_sample and checkpoint.start:
+            with engine.begin() as conn:  # Interrupted after its last chunk committed
+                checkpoint.save(conn, checkpoint.start, 0, complete=True)
+            print(f"Data already inserted into table '{table_name}'.")
+            return
+        if not data_sample or not isinstance(data_sample[0], dict):
+            print("No data found or invalid data format.")
             return
 
-        # Merge schema dynamically
-        data_sample = data[0]
-        merge_table_schema(table_name, data_sample)
+        # Merge schema dynamically, judging field density on the first batch
+        columns = merge_table_schema(table_name, data_sample)
+        if columns is None:
+            return
 
-        # Reflect the updated table
-        metadata.reflect(bind=engine)
-        table = metadata.tables[table_name]
+        # Reflect the updated table, so columns added above are included
+        table = reflect_table(engine, table_name)
+        seen_keys = {key for record in data_sample for key in record}
 
-        # Insert data using a single bulk insert
+        # Insert data in streamed batches, one transaction (ending in its checkpoint) per chunk
         print(f"Inserting data into table '{table_name}'...")
+        index = checkpoint.start
         with engine.connect() as conn:
-            conn.execute(insert(table), data)
-            conn.commit()  # Commit transaction
+            for chunk in iter_batches(chain(data_sample, records), settings.LOAD_CHUNK_ROWS):
+                chunk_keys = {key for record in chunk for key in record}
+                if not chunk_keys <= seen_keys:
+                    # Fields first seen further into the file. The ALTER commits in its own short transaction,
+                    # before this chunk's inserts, so its lock is not held while the chunk loads.
+                    with engine.begin() as ddl:
+                        columns = evolve_schema(ddl, table_name, chunk)
+                    table = reflect_table(conn, table_name)
+                    seen_keys |= chunk_keys
+                for batch in iter_batches(chunk, BATCH_SIZE):
+                    for rows in group_by_keys(split_extras(batch, columns)):
+                        conn.execute(insert(table), rows)
+                index += len(chunk)
+                checkpoint.save(conn, index, len(chunk))
+                conn.commit()  # Rows and checkpoint commit together
+                print(f"Committed records up to {index} ({checkpoint.rows_committed} rows).")
+            checkpoint.save(conn, index, 0, complete=True)
+            conn.commit()
+        mark_write()  # Opens the read-your-writes window for replica routing
         print(f"Data successfully inserted into table '{table_name}'.")
 
     except SQLAlchemyError as e:
         print(f"Database error occurred while loading data: {e}")
+        print("Run again with --resume to continue after the last committed chunk.")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
 
 if __name__ == "__main__":
     # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Load JSON data into a database dynamically.")
-    parser.add_argument("filepath", type=str, help="Path to the JSON file")
+    parser = argparse.ArgumentParser(description="Load JSON, NDJSON or CSV data into a database dynamically.")
+    parser.add_argument("filepath", type=str, help="Path to the data file (optionally .gz/.zst compressed)")
     parser.add_argument("tablename", type=str, help="Name of the table to load data into")
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue an interrupted load of the same file after its last committed chunk"
+    )
     args = parser.parse_args()
 
     # Load data into the specified table
-    load_json_data_to_table(args.filepath, args.tablename)
+    load_json_data_to_table(args.filepath, args.tablename, resume=args.resume)
@@ -1,45 +1,73 @@
 #from app.database import SessionLocal
-from app.models.models import Sundae, Sale
-import json
+from webapp.models import Sundae, Sale  # The webapp's models: both loaders write the same tables
+from webapp.readers import iter_batches, iter_records
+from webapp.records import insert_records
+from webapp.validation import BatchValidator, ensure_quarantine_table, quarantine
+from webapp.routing import mark_write
+
+BATCH_SIZE = 5000
 
 def load_data(db, sundae_file: str, sales_file: str):
     """
-    Load data into the database from the JSON files in the correct order.
+    Load data into the database from the data files in the correct order.
+    Each file may be a JSON array, NDJSON or CSV, optionally gzip/zstd compressed.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        sundae_file (str): Path to the sundae menu file.
+        sales_file (str): Path to the sales transaction file.
+    """
+    load_sundaes(db, sundae_file)
+    load_sales(db, sales_file)
+
+
+def load_sundaes(db, sundae_file: str):
+    """
+    Load the sundae menu.
 
     Args:
         db (Session): SQLAlchemy database session.
-        sundae_file (str): Path to the sundae menu JSON file.
-        sales_file (str): Path to the sales transaction JSON file.
+        sundae_file (str): Path to the sundae menu file.
     """
-    # Step 1: Load Sundaes Data
     print("Loading sundaes data...")
     try:
-        with open(sundae_file, "r") as file:
-            sundaes = json.load(file)
-            for sundae in sundaes:
-                db.add(Sundae(
-                    id=sundae["id"],
-                    name=sundae["name"],
-                    description=sundae["description"]
-                ))
+        # Plain dicts in executemany batches (COPY on DuckDB) instead of one ORM object per row
+        sundaes = (
+            {"id": sundae["id"], "name": sundae["name"], "description": sundae["description"]}
+            for sundae in iter_records(sundae_file)
+        )
+        insert_records(db, Sundae, sundaes)
         db.commit()
+        mark_write()
         print("Sundaes data loaded successfully!")
     except Exception as e:
         db.rollback()
         print(f"Error loading sundaes data: {e}")
 
-    # Step 2: Load Sales Data
+
+def load_sales(db, sales_file: str):
+    """
+    Load the sales transactions (after the sundaes they reference).
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        sales_file (str): Path to the sales transaction file.
+    """
     print("Loading sales data...")
     try:
-        with open(sales_file, "r") as file:
-            sales = json.load(file)
-            for sale in sales:
-                db.add(Sale(
-                    sundae_id=sale["sundae_id"],
-                    timestamp=sale["timestamp"],
-                    quantity=sale.get("quantity", 1)  # Default quantity to 1
-                ))
+        # Whole batches are checked before inserting (known sundae ids, required fields, types);
+        # bad rows are quarantined with their reasons instead of failing the file
+        ensure_quarantine_table(db)
+        validator = BatchValidator(db, Sale.__table__)
+        for batch in iter_batches(iter_records(sales_file), BATCH_SIZE):
+            valid, rejected = validator.validate(batch)
+            quarantine(db, Sale.__tablename__, rejected, source=str(sales_file))
+            insert_records(db, Sale, [
+                {"sundae_id": sale["sundae_id"], "timestamp": sale["timestamp"], "price": sale["price"]}
+                for sale in valid
+            ])
         db.commit()
+        mark_write()
         print("Sales data loaded successfully!")
     except Exception as e:
         db.rollback()
@@ -1,46 +1,257 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Literal, Optional
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from .database import get_db
-from .schema import SundaeBase, SundaeWithMetrics
-from sqlalchemy import text
+from .database import dispose_engines, get_engine, get_read_db, get_read_router, get_session_local, read_engine
+from .schema import SaleIn, SundaeBase, SundaeWithMetrics
+from . import queries, serialization
+from webapp.coalesce import coalesced, single_flight
+from .conditional import ConditionalGet, VersionCache
+from .ingest import Backpressure, IngestUnavailable, SaleBatcher
+from .live import DeltaHub, stream_deltas
+from .serialization import FastJSONResponse, rows_to_dicts
+from webapp.rollups import BUCKET_SECONDS, parse_window, window_buckets
+from webapp.config import settings
+from webapp.sharding import get_shards
+from webapp.sketches import summarize
+from webapp.slow_queries import admin_token_valid, slow_queries
+
+
+# Single-sale ingestion queue; sessions are opened on the primary only when a batch is flushed
+sale_batcher = SaleBatcher(lambda: get_session_local()())
+
+# Live sales deltas: one LISTEN connection per process, fanned out to every /sales/stream client
+delta_hub = DeltaHub(get_engine)
+
+# Per-table data versions behind the ETag/Last-Modified of /sundaes and /sundaes/{id}
+data_versions = VersionCache(get_engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engines are created lazily by the first request (the listeners start then too); release their pools on shutdown
+    delta_hub.start(asyncio.get_running_loop())
+    data_versions.start()
+    await run_in_threadpool(sale_batcher.start)  # Replays sales a crashed run left in the spill file
+    yield
+    await run_in_threadpool(sale_batcher.stop)  # Flushes the queue before the engines go away
+    await run_in_threadpool(delta_hub.stop)
+    await run_in_threadpool(data_versions.stop)
+    dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan)
+# Unchanged data since the client's copy: 304 Not Modified without running the endpoint
+app.add_middleware(ConditionalGet, cache=data_versions, router_factory=get_read_router)
 
 # GET /sundaes - Return all sundaes
 @app.get("/sundaes", response_model=list[SundaeBase])
-def get_all_sundaes(db: Session = Depends(get_db)):
+@coalesced("sundaes")  # Identical concurrent requests share one execution
+def get_all_sundaes(db: Session = Depends(get_read_db)):
     try:
-        result = db.execute(text("SELECT * FROM sundaes")).fetchall()
-        if not result:
+        result = queries.run(db, "sundae_list")
+        keys = list(result.keys())
+        rows = result.fetchall()
+        if not rows:
             raise HTTPException(status_code=404, detail="No sundaes found")
-        return [dict(row._mapping) for row in result]
+        if settings.API_FAST_SERIALIZATION:
+            # Trusted DB output: encode straight to bytes, bypassing response_model validation
+            return FastJSONResponse(serialization.dumps(rows_to_dicts(keys, rows)))
+        return rows_to_dicts(keys, rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # GET /sundaes/{id} - Return sundae details with metrics
 @app.get("/sundaes/{id}", response_model=SundaeWithMetrics)
-def get_sundae_by_id(id: str, db: Session = Depends(get_db)):
+@coalesced("sundae")
+def get_sundae_by_id(id: str, db: Session = Depends(get_read_db)):
     try:
-        # Get sundae details
-        sundae = db.execute(
-            text("SELECT * FROM sundaes WHERE id = :id"), {"id": id}
-        ).fetchone()
+        shards = get_shards()
+        if shards is None:
+            # Sundae details and sales metrics (volume, revenue) in a single round trip
+            sundae = queries.run(db, "sundae_detail", {"id": id}).fetchone()
+        else:
+            sundae = queries.run(db, "sundae_by_id", {"id": id}).fetchone()
         if not sundae:
             raise HTTPException(status_code=404, detail="Sundae not found")
-        
-        # Calculate metrics: volume and revenue
-        sales = db.execute(
-            text("""
-                SELECT COUNT(*) AS volume, SUM(price) AS revenue
-                FROM sales
-                WHERE sundae_id = :id
-            """), {"id": id}
-        ).fetchone()
 
         sundae_data = dict(sundae._mapping)
-        sundae_data["volume"] = sales.volume or 0
-        sundae_data["revenue"] = round(float(sales.revenue or 0),2)
+        if shards is not None:
+            # Sales live on the shards: only the shard owning this sundae is queried
+            sundae_data["volume"], sundae_data["revenue"] = shards.sales_totals(sundae_id=id).get(id, [0, 0.0])
+        sundae_data["revenue"] = round(float(sundae_data["revenue"]), 2)
 
+        if settings.API_FAST_SERIALIZATION:
+            return FastJSONResponse(serialization.dumps(sundae_data))
         return sundae_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# GET /sundaes/{id}/distribution - Approximate price quantiles and distinct counts from the sales sketches
+@app.get("/sundaes/{id}/distribution")
+@coalesced("distribution")
+def get_sundae_distribution(
+    id: str,
+    window: str = Query("30d", description="Window length, e.g. 7d, 30d, 12w"),
+    end: Optional[float] = Query(None, description="Window end as a Unix timestamp (defaults to now)"),
+    quantiles: str = Query("0.5,0.95", description="Comma-separated fractions between 0 and 1"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        window_seconds = parse_window(window)
+        fractions = [float(fraction) for fraction in quantiles.split(",")]
+        if not fractions or any(not 0 <= fraction <= 1 for fraction in fractions):
+            raise ValueError("Quantiles must be fractions between 0 and 1.")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        if not queries.run(db, "sundae_by_id", {"id": id}).fetchone():
+            raise HTTPException(status_code=404, detail="Sundae not found")
+
+        bucket_seconds = settings.SKETCH_BUCKET_SECONDS
+        first_bucket, last_bucket = window_buckets(time.time() if end is None else end, window_seconds, bucket_seconds)
+        params = {"id": id, "first_bucket": first_bucket, "last_bucket": last_bucket}
+        shards = get_shards()
+        if shards is None:
+            rows = queries.run(db, "sundae_sketches", params).fetchall()
+        else:
+            # Sketches are mergeable, so per-shard rows combine exactly like per-bucket rows
+            rows = shards.gather(queries.SUNDAE_SKETCHES.statement, params, shards.sundae_shards(id))
+
+        distribution = {
+            "sundae_id": id,
+            "window": window,
+            "from": first_bucket,
+            "to": last_bucket + bucket_seconds,
+            **summarize(rows, fractions),
+        }
+        if settings.API_FAST_SERIALIZATION:
+            return FastJSONResponse(serialization.dumps(distribution))
+        return distribution
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# GET /leaderboard - Top sundaes by revenue or volume over a recent time window
+@app.get("/leaderboard")
+@coalesced("leaderboard")
+def get_leaderboard(
+    metric: Literal["revenue", "volume"] = "revenue",
+    window: str = Query("24h", description="Window length, e.g. 60m, 24h, 7d, 1w"),
+    n: int = Query(10, ge=1, le=100),
+    end: Optional[float] = Query(None, description="Window end as a Unix timestamp (defaults to now)"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        window_seconds = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        # Only the pre-aggregated buckets inside the window are merged, independent of total history
+        first_bucket, last_bucket = window_buckets(time.time() if end is None else end, window_seconds)
+        shards = get_shards()
+        if shards is None:
+            rows = queries.run(
+                db,
+                f"leaderboard_{metric}",
+                {"first_bucket": first_bucket, "last_bucket": last_bucket, "n": n},
+            ).fetchall()
+        else:
+            rows = sharded_leaderboard(shards, db, metric, first_bucket, last_bucket, n)
+        leaders = [
+            {
+                "sundae_id": row.sundae_id,
+                "sundae_name": row.sundae_name,
+                "volume": int(row.volume),
+                "revenue": round(float(row.revenue), 2),
+            }
+            for row in rows
+        ]
+        leaderboard = {
+            "metric": metric,
+            "window": window,
+            "from": first_bucket,
+            "to": last_bucket + BUCKET_SECONDS,
+            "leaders": leaders,
+        }
+        if settings.API_FAST_SERIALIZATION:
+            return FastJSONResponse(serialization.dumps(leaderboard))
+        return leaderboard
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# POST /sales - Accept one sale event; it is written within INGEST_MAX_DELAY_MS as part of a batch
+@app.post("/sales", status_code=202)
+def create_sale(sale: SaleIn):
+    try:
+        sale_id = sale_batcher.submit(
+            {"sale_id_pk": sale.sale_id, "sundae_id": sale.sundae_id, "timestamp": sale.timestamp, "price": sale.price}
+        )
+    except Backpressure as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    # Acknowledged only once the sale is durable in the spill file (at-least-once delivery)
+    return {"sale_id": str(sale_id), "status": "accepted"}
+
+# GET /sales/ingest - Queue depth and counters of the single-sale ingestion
+@app.get("/sales/ingest")
+def get_ingest_status():
+    return sale_batcher.status()
+
+# GET /sales/stream - Server-sent events: a totals snapshot, then per-sundae volume/revenue deltas as loads commit
+@app.get("/sales/stream")
+async def stream_sales(request: Request, sundae_id: Optional[str] = None):
+    events = stream_deltas(delta_hub, request, read_engine(), get_shards(), sundae_id)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # No proxy buffering of events
+    )
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    # Captured statements carry their parameters, so they are only shown to holders of SLOW_QUERY_ADMIN_TOKEN
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Send SLOW_QUERY_ADMIN_TOKEN in the X-Admin-Token header")
+
+# GET /admin/slow-queries - Statements slower than SLOW_QUERY_MS, slowest (or newest) first, with sampled EXPLAIN plans
+@app.get("/admin/slow-queries", dependencies=[Depends(require_admin_token)])
+def get_slow_queries(order: Literal["worst", "recent"] = "worst", limit: int = Query(20, ge=1, le=1000)):
+    entries = slow_queries.worst() if order == "worst" else slow_queries.recent()
+    return {"threshold_ms": slow_queries.threshold_ms, "captured": slow_queries.captured, "queries": entries[:limit]}
+
+# DELETE /admin/slow-queries - Forget the captured statements (e.g. after deploying a fix)
+@app.delete("/admin/slow-queries", status_code=204, dependencies=[Depends(require_admin_token)])
+def clear_slow_queries():
+    slow_queries.clear()
+
+# GET /admin/coalescing - How many read requests were answered by an identical request already in flight
+@app.get("/admin/coalescing")
+def get_coalescing():
+    return single_flight.status()
+
+# GET /admin/data-versions - The cached per-table data versions behind the ETags, and conditional GET counters
+@app.get("/admin/data-versions")
+def get_data_versions():
+    return data_versions.status()
+
+def sharded_leaderboard(shards, db, metric, first_bucket, last_bucket, n):
+    """Merge every shard's window totals, then rank and name the top ``n`` sundaes."""
+    totals = shards.window_totals(first_bucket, last_bucket)
+    names = {row.id: row.name for row in queries.run(db, "sundae_list")}
+    index = 1 if metric == "revenue" else 0
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][index], item[0]))[:n]
+    return [
+        SimpleNamespace(sundae_id=sundae_id, sundae_name=names.get(sundae_id), volume=volume, revenue=revenue)
+        for sundae_id, (volume, revenue) in ranked
+    ]
@@ -0,0 +1,284 @@
+"""
+Conditional GET for ``/sundaes`` and ``/sundaes/{id}``.
+
+The responses only change when a load, an ingest batch or a reset writes the
+tables they are built from. Their validators are derived from those tables'
+data versions (``webapp/data_versions.py``):
+- ``ETag``: a hash of the versions;
+- ``Last-Modified``: the time of the latest bump.
+
+A request whose ``If-None-Match`` (or, without it, ``If-Modified-Since``) still
+matches gets ``304 Not Modified`` before the endpoint runs, with no query and no
+pooled connection. ``Cache-Control`` comes from ``HTTP_CACHE_CONTROL`` so that
+a reverse proxy in front of the API can store and revalidate the responses too.
+
+The versions are kept in memory per process and read from the primary. On
+PostgreSQL a background thread LISTENs on ``DATA_VERSIONS_CHANNEL`` and drops
+them as soon as a bump commits. Independently of that, they are re-read at most
+every ``DATA_VERSION_TTL`` seconds.
+
+With read replicas, the middleware picks the engine that serves the request
+and pins it in ``request.state.read_engine`` for ``get_read_db``. The
+validators then come from that engine's versions: the cached primary versions,
+or a replica's versions as of its last health check. Validators taken from the
+primary could be newer than a lagging replica's body, and a client would keep
+that old body under the new ETag.
+"""
+import email.utils
+import hashlib
+import json
+import re
+import select
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from webapp.config import settings
+from webapp.data_versions import add_local_listener, read_versions, remove_local_listener
+from webapp.models import Sale, Sundae
+
+RECONNECT_BACKOFF = (0.5, 1, 2, 5)  # seconds between LISTEN reconnect attempts
+
+# Request paths and the tables their responses are built from
+CONDITIONAL_ROUTES = [
+    (re.compile(r"^/sundaes/?$"), (Sundae.__tablename__,)),
+    (re.compile(r"^/sundaes/[^/]+$"), (Sundae.__tablename__, Sale.__tablename__)),
+]
+
+
+class VersionCache:
+    """
+    This process's copy of the ``data_versions`` table.
+
+    Args:
+        engine_factory (callable): Returns the primary engine (where the versions are bumped and notified).
+        ttl (float): Seconds a copy is used before it is re-read (``DATA_VERSION_TTL``).
+        channel (str): NOTIFY channel of the bumps (``DATA_VERSIONS_CHANNEL``).
+    """
+
+    def __init__(self, engine_factory, ttl=None, channel=None):
+        self.engine_factory = engine_factory
+        self._ttl = ttl
+        self._channel = channel
+        self._versions = None
+        self._loaded_at = 0.0
+        self._generation = 0  # Incremented by every invalidation, so a read racing one is not kept
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.stats = {
+            "reads": 0, "notifications": 0, "not_modified": 0, "replica_validated": 0, "listening": False,
+            "last_error": None,
+        }
+
+    @property
+    def ttl(self):
+        return settings.DATA_VERSION_TTL if self._ttl is None else self._ttl
+
+    @property
+    def channel(self):
+        return self._channel or settings.DATA_VERSIONS_CHANNEL
+
+    def fresh(self):
+        """The cached versions, or None when they have to be re-read."""
+        versions = self._versions
+        if versions is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return versions
+        return None
+
+    def refresh(self):
+        """Re-read the versions (one query however many requests wait for it); empty if the database fails."""
+        self.listen()  # Before the read, so a bump committed after it is not missed
+        with self._lock:
+            versions = self.fresh()
+            if versions is not None:
+                return versions
+            generation = self._generation
+            try:
+                with self.engine_factory().connect() as connection:
+                    versions = read_versions(connection)
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                return {}  # No validators until the database is back: responses are built as usual
+            self.stats["reads"] += 1
+            if generation == self._generation:
+                self._versions, self._loaded_at = versions, time.monotonic()
+            return versions
+
+    def invalidate(self, _message=None):
+        self._generation += 1
+        self._versions = None
+
+    # Lifecycle
+
+    def start(self):
+        """Allow listening again after ``stop``; the listener itself starts with the first ``refresh``."""
+        self._stopping.clear()
+
+    def listen(self):
+        """Start following the bumps, once. Creates the primary engine, so call it off the event loop."""
+        with self._start_lock:
+            if self._started or self._stopping.is_set():
+                return
+            self._started = True
+            try:
+                engine = self.engine_factory()
+            except Exception as e:
+                self._started = False  # Retried by the next refresh
+                self.stats["last_error"] = str(e)
+                return
+            if engine.dialect.name != "postgresql":
+                # No LISTEN/NOTIFY: only sessions of this process report their bumps; the TTL covers the rest
+                add_local_listener(self.invalidate)
+                return
+            self._thread = threading.Thread(target=self._listen, name="data-version-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            self._stopping.set()
+            self._started = False
+        remove_local_listener(self.invalidate)
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.stats["listening"] = False
+
+    def _listen(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                self._listen_once()
+            except Exception as e:
+                attempt = 0 if self.stats["listening"] else attempt + 1  # Back off only while reconnects fail
+                self.stats["listening"] = False
+                self.stats["last_error"] = str(e)
+                self.invalidate()  # Bumps may have been missed while disconnected
+                delay = RECONNECT_BACKOFF[min(attempt, len(RECONNECT_BACKOFF) - 1)]
+                print(f"❌ Data version listener lost its connection, reconnecting in {delay}s: {e}")
+                self._stopping.wait(delay)
+
+    def _listen_once(self):
+        raw = self.engine_factory().raw_connection()
+        try:
+            connection = raw.driver_connection  # psycopg2 connection: notifies arrive via poll()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self.stats["listening"] = True
+            self.invalidate()  # Anything bumped before LISTEN took effect is re-read
+            print(f"🔹 Listening for data version bumps on '{self.channel}'.")
+            while not self._stopping.is_set():
+                if select.select([connection], [], [], 1.0) == ([], [], []):
+                    continue
+                connection.poll()
+                if connection.notifies:
+                    self.stats["notifications"] += len(connection.notifies)
+                    connection.notifies.clear()
+                    self.invalidate()
+        finally:
+            raw.invalidate()  # The session state (LISTEN, autocommit) must not go back to the pool
+
+    def status(self):
+        return dict(self.stats, versions=self._versions, ttl=self.ttl)
+
+
+def validators(versions, tables):
+    """
+    (ETag, Last-Modified header, last-modified Unix time) of a response built from ``tables``.
+    None before anything has been versioned. A table that was never bumped counts as version 0.
+    """
+    if not versions:
+        return None
+    state = [(table, *versions.get(table, (0, 0.0))) for table in tables]
+    etag = 'W/"' + hashlib.sha1(json.dumps(state).encode()).hexdigest()[:20] + '"'
+    modified_at = max(updated_at for _, _, updated_at in state)
+    return etag, email.utils.formatdate(modified_at, usegmt=True), modified_at
+
+
+def not_modified(headers, etag, modified_at):
+    """Whether the request's validators still match (If-None-Match takes precedence over If-Modified-Since)."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(modified_at) <= since  # HTTP dates have whole seconds
+    return False
+
+
+class ConditionalGet:
+    """
+    ASGI middleware answering matching conditional GETs with 304, and adding the validators and
+    ``Cache-Control`` to the 200 responses of ``routes``. Other requests pass through untouched.
+
+    Args:
+        app: The wrapped ASGI application.
+        cache (VersionCache): Data versions of this process.
+        routes (list): (compiled path pattern, tables) pairs.
+        router_factory (callable): Returns the ``ReplicaRouter`` of the reads; without it reads are not
+            pinned and the primary's versions are used.
+    """
+
+    def __init__(self, app, cache, routes=None, router_factory=None):
+        self.app = app
+        self.cache = cache
+        self.routes = CONDITIONAL_ROUTES if routes is None else routes
+        self.router_factory = router_factory
+        self._router = None
+
+    def _get_router(self):
+        self._router = self.router_factory()  # Creates the engines on first use, so called off the event loop
+        return self._router
+
+    async def serving_versions(self, scope):
+        """Versions of the engine that will serve this request, pinning that engine for ``get_read_db``."""
+        replica = None
+        if self.router_factory is not None:
+            router = self._router or await run_in_threadpool(self._get_router)
+            replica = router.read_replica()
+            scope.setdefault("state", {})["read_engine"] = router.primary if replica is None else replica.engine
+        if replica is not None:
+            self.cache.stats["replica_validated"] += 1
+            return replica.versions or {}  # Not read yet: no validators rather than the primary's
+        versions = self.cache.fresh()
+        if versions is None:
+            versions = await run_in_threadpool(self.cache.refresh)
+        return versions
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        tables = next((tables for pattern, tables in self.routes if pattern.match(scope["path"])), None)
+        if tables is None:
+            return await self.app(scope, receive, send)
+
+        validated = validators(await self.serving_versions(scope), tables)
+        if validated is None:
+            return await self.app(scope, receive, send)
+        etag, last_modified, modified_at = validated
+        headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": settings.HTTP_CACHE_CONTROL}
+
+        if not_modified(Headers(scope=scope), etag, modified_at):
+            self.cache.stats["not_modified"] += 1
+            return await Response(status_code=304, headers=headers)(scope, receive, send)
+
+        async def send_with_validators(message):
+            # Only successful responses carry validators; errors (e.g. 404) must not be cached as such
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                response_headers = MutableHeaders(scope=message)
+                for name, value in headers.items():
+                    response_headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
@@ -1,31 +1,90 @@
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.engine.url import URL
 from dotenv import load_dotenv
-import os
-import urllib.parse  # For URL encoding
+from webapp.routing import ReplicaRouter
+from webapp.slow_queries import slow_queries
+from webapp import backends
+from webapp.config import settings
+import threading
 
-# Load environment variables from the .env file
-load_dotenv()
+# Nothing below connects or reads .env at import time: the engine, session factories and
+# replica router are created on first use (or by the app's lifespan), keeping cold starts fast.
+_engine = None
+_session_local = None
+_read_router = None
+_init_lock = threading.RLock()
 
 
-# Dynamically build the DATABASE_URL from environment variables
-DATABASE_URL = URL.create(
-    drivername="postgresql+psycopg2",
-    username=os.getenv("DB_USER"),       # Database username
-    password=os.getenv("DB_PASSWORD"),           # URL-encoded Database password
-    host=os.getenv("DB_HOST"),           # Database host
-    port=os.getenv("DB_PORT"),           # Database port
-    database=os.getenv("DB_NAME")        # Database name
-)
+def database_url():
+    """The configured backend's URL (PostgreSQL from the DB_* variables, or DuckDB), loading .env first."""
+    load_dotenv()
+    return backends.database_url()
 
-print(f"Connecting to: {DATABASE_URL}")  # Debugging connection string
 
-# Create a database engine using the constructed DATABASE_URL
-engine = create_engine(DATABASE_URL, echo=True)
+def get_engine():
+    """The primary database engine, created on first use."""
+    global _engine
+    with _init_lock:
+        if _engine is None:
+            url = database_url()
+            print(f"Connecting to: {url.render_as_string(hide_password=True)}")  # Debugging connection string
+            # Statements are echoed only on request; slow ones are always captured for /admin/slow-queries
+            _engine = slow_queries.attach(
+                create_engine(url, echo=settings.SQL_ECHO, **backends.engine_options()), name="primary"
+            )
+        return _engine
 
-# Create a session maker to handle database transactions
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_session_local():
+    """Session factory bound to the primary engine."""
+    global _session_local
+    with _init_lock:
+        if _session_local is None:
+            _session_local = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+        return _session_local
+
+
+def get_read_router():
+    """Reads go to a healthy replica (DB_REPLICA_URLS) and fall back to the primary engine."""
+    global _read_router
+    with _init_lock:
+        if _read_router is None:
+            _read_router = ReplicaRouter(get_engine())
+            for i, replica in enumerate(_read_router.replicas):
+                slow_queries.attach(replica.engine, name=f"replica-{i}")
+        return _read_router
+
+
+def dispose_engines():
+    """Close pooled connections of every engine created so far (called on application shutdown)."""
+    global _engine, _session_local, _read_router
+    with _init_lock:
+        if _read_router is not None:
+            _read_router.stop()
+            for replica in _read_router.replicas:
+                replica.engine.dispose()
+        if _engine is not None:
+            _engine.dispose()
+        _engine = _session_local = _read_router = None
+
+
+# Backwards-compatible lazy module attributes (``from ... import engine`` creates the engine then)
+_LAZY_ATTRIBUTES = {
+    "DATABASE_URL": database_url,
+    "engine": get_engine,
+    "SessionLocal": get_session_local,
+    "read_router": get_read_router,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 # Base class for SQLAlchemy ORM models
 Base = declarative_base()
@@ -35,7 +94,24 @@ def get_db():
     Dependency to get a database session for API endpoints.
     Ensures the session is properly closed after use.
     """
-    db = SessionLocal()
+    db = get_session_local()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def read_engine():
+    """Engine for read-only queries (replica when healthy, otherwise the primary)."""
+    return get_read_router().read_engine()
+
+def get_read_db(request: Request = None):
+    """
+    Dependency to get a read-only database session for GET endpoints and dashboards.
+    The session is bound to a replica when one is healthy, otherwise to the primary. Conditional GETs
+    use the engine their validators were taken from (``request.state.read_engine``, see api/conditional.py).
+    """
+    engine = getattr(request.state, "read_engine", None) if request is not None else None
+    db = ReadSessionLocal(bind=engine or get_read_router().read_engine())
     try:
         yield db
     finally:
@@ -0,0 +1,445 @@
+"""
+Micro-batched ingestion of single sale events (``POST /sales``).
+
+Each accepted sale is appended to a spill segment and fsynced (group commit:
+one fsync covers every concurrent request) before the API acknowledges it, then
+queued in memory. A background flusher writes the queue in multi-row batches
+when ``INGEST_MAX_BATCH`` sales are waiting or the oldest has waited
+``INGEST_MAX_DELAY_MS``. When ``INGEST_MAX_PENDING`` sales are waiting, new ones
+are refused (HTTP 429) until the flusher catches up.
+
+Every API worker locks its own spill slot (``path``, ``path.1``, ...) and
+writes it as numbered segments (``path.seg-00000001``, ...) of about
+``INGEST_SPILL_SEGMENT_BYTES``. A segment is deleted once all of its sales are
+in the database, so the spill stays as small as the backlog. Delivery is
+at-least-once: on startup the flusher replays the segments left by a crash,
+both this slot's and those of any other slot no running worker holds, in
+batches of ``INGEST_MAX_BATCH``, and the sale's UUID primary key makes replays
+idempotent.
+"""
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from pathlib import Path
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from webapp.config import settings
+from webapp.data_versions import bump_versions
+from webapp.live import publish_deltas, sales_deltas
+from webapp.models import Sale
+from webapp.routing import mark_write
+from webapp.sharding import get_shards
+from webapp.writer import write_new_records
+
+SPILL_SLOTS = 64  # spill slots (API workers) per INGEST_SPILL_PATH
+RETRY_BACKOFF = (0.1, 0.5, 1, 2, 5)  # seconds between attempts while the database is unavailable
+
+
+class Backpressure(Exception):
+    """Raised when the ingest queue is full; clients should retry later."""
+
+
+class IngestUnavailable(Exception):
+    """Raised when the batcher is not running (startup or shutdown)."""
+
+
+def _lock_slot(base):
+    """The slot's lock file, locked by this process; None while another worker holds it."""
+    lock = open(f"{base}.lock", "a")
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock
+    except BlockingIOError:
+        lock.close()
+        return None
+
+
+def _segments(base):
+    """Spill segments of a slot, oldest first."""
+    base = Path(base)
+    return sorted(base.parent.glob(f"{base.name}.seg-*"))
+
+
+def _claim_spill(path):
+    """
+    Lock the first free spill slot (``path``, ``path.1``, ...), so several API workers never share one,
+    and every other free slot that still holds segments: their worker crashed or stopped with a backlog.
+
+    Returns:
+        tuple: ((base, lock file) of this worker's slot, [(base, lock file), ...] of the adopted slots)
+    """
+    own, orphans = None, []
+    for index in range(SPILL_SLOTS):
+        base = Path(path if index == 0 else f"{path}.{index}")
+        if own is not None and not _segments(base):
+            continue
+        lock = _lock_slot(base)
+        if lock is None:
+            continue
+        if own is None:
+            own = (base, lock)
+        elif _segments(base):
+            orphans.append((base, lock))
+        else:
+            lock.close()  # Emptied meanwhile by its own worker
+    if own is None:
+        raise RuntimeError(f"No free ingest spill slot next to '{path}'")
+    return own, orphans
+
+
+def _encode(record):
+    return json.dumps(dict(record, sale_id_pk=str(record["sale_id_pk"]))) + "\n"
+
+
+def _decode(line):
+    record = json.loads(line)
+    record["sale_id_pk"] = uuid.UUID(record["sale_id_pk"])
+    return record
+
+
+class SaleBatcher:
+    """
+    In-memory sale queue with durable spill segments and a background batch flusher.
+
+    Unset arguments come from the ``INGEST_*`` settings.
+
+    Args:
+        session_factory (callable): Returns a session on the primary database.
+        max_batch (int): Flush as soon as this many sales are waiting.
+        max_delay (float): Flush at the latest this many seconds after the oldest waiting sale arrived.
+        max_pending (int): Queue bound; ``submit`` raises ``Backpressure`` beyond it.
+        spill_path (str): Spill slot path for crash recovery.
+        fsync (bool): Fsync the spill before acknowledging a sale.
+        segment_bytes (int): Size at which the spill moves on to a new segment.
+    """
+
+    def __init__(self, session_factory, max_batch=None, max_delay=None, max_pending=None,
+                 spill_path=None, fsync=None, segment_bytes=None):
+        self.session_factory = session_factory
+        # Unset values are read from settings on use, so the module-level batcher does not load them at import
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+        self._spill_path = spill_path
+        self._fsync = fsync
+        self._segment_bytes = segment_bytes
+
+        self._pending = deque()  # (sale, segment it was spilled to)
+        self._admitting = 0
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        self._base = None  # this worker's spill slot
+        self._slot_lock = None
+        self._adopted = []  # (base, lock file) of crashed workers' slots being replayed
+        self._replay = []  # segments left by earlier runs, oldest first
+        self._spill = None  # segment new sales are appended to
+        self._segment_index = 0
+        self._segment_size = 0
+        self._segments = {}  # open segment path -> file
+        self._unflushed = {}  # segment path -> acknowledged sales in it not yet in the database
+        self._spill_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._seq = 0
+        self._synced_seq = 0
+
+        self.stats = {"accepted": 0, "refused": 0, "flushed": 0, "batches": 0, "rejected": 0, "recovered": 0,
+                      "last_error": None}
+
+    @property
+    def max_batch(self):
+        return settings.INGEST_MAX_BATCH if self._max_batch is None else self._max_batch
+
+    @property
+    def max_delay(self):
+        return settings.INGEST_MAX_DELAY_MS / 1000 if self._max_delay is None else self._max_delay
+
+    @property
+    def max_pending(self):
+        return settings.INGEST_MAX_PENDING if self._max_pending is None else self._max_pending
+
+    @property
+    def spill_path(self):
+        return settings.INGEST_SPILL_PATH if self._spill_path is None else self._spill_path
+
+    @property
+    def fsync(self):
+        return settings.INGEST_FSYNC if self._fsync is None else self._fsync
+
+    @property
+    def segment_bytes(self):
+        return settings.INGEST_SPILL_SEGMENT_BYTES if self._segment_bytes is None else self._segment_bytes
+
+    # Lifecycle
+
+    def start(self):
+        """Lock a spill slot, open a new segment and start the flusher, which first replays earlier segments."""
+        (self._base, self._slot_lock), self._adopted = _claim_spill(self.spill_path)
+        own = _segments(self._base)
+        self._replay = own + [segment for base, _ in self._adopted for segment in _segments(base)]
+        if self._replay:
+            print(f"🔸 Replaying {len(self._replay)} spill segment(s) of '{self.spill_path}'.")
+        self._segment_index = max((int(segment.name.rsplit("-", 1)[1]) for segment in own), default=0)
+        with self._spill_lock:
+            self._open_segment()
+        with self._cond:
+            self._oldest = None
+            self._stopping = False
+
+        self._thread = threading.Thread(target=self._run, name="sale-ingest-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        """Flush what is queued and stop; anything left unflushed stays in the spill segments."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._sync_lock, self._spill_lock:
+            for path, segment in self._segments.items():
+                segment.close()
+                if not self._unflushed[path]:
+                    path.unlink()  # Nothing of it is waiting: no need to replay it
+            self._segments.clear()
+            self._unflushed.clear()
+            self._spill = None
+        for _, lock in self._adopted:
+            lock.close()
+        self._adopted = []
+        self._slot_lock.close()  # Releases the slot: a later worker replays what is left in it
+
+    # Producers
+
+    def submit(self, sale):
+        """
+        Durably accept one sale (dict with sundae_id, timestamp, price, optional sale_id_pk).
+        Returns its sale id once it is safe to acknowledge.
+        """
+        with self._cond:
+            if self._thread is None or self._stopping:
+                raise IngestUnavailable("Sale ingestion is not running")
+            if len(self._pending) + self._admitting >= self.max_pending:
+                self.stats["refused"] += 1
+                raise Backpressure(f"{len(self._pending)} sales waiting to be written")
+            self._admitting += 1
+
+        record = dict(sale, sale_id_pk=sale.get("sale_id_pk") or uuid.uuid4())
+        try:
+            segment = self._append_to_spill(record)
+        except Exception:
+            with self._cond:
+                self._admitting -= 1
+            raise
+        with self._cond:
+            self._admitting -= 1
+            first = not self._pending
+            if first:
+                self._oldest = time.monotonic()
+            self._pending.append((record, segment))
+            self.stats["accepted"] += 1
+            # The first sale starts the flusher's max_delay timer; a full batch cuts it short
+            if first or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return record["sale_id_pk"]
+
+    def _open_segment(self):
+        self._segment_index += 1
+        path = Path(f"{self._base}.seg-{self._segment_index:08d}")
+        self._spill = self._segments[path] = open(path, "a", encoding="utf-8")
+        self._unflushed[path] = 0
+        self._segment_size = 0
+
+    def _rotate(self):
+        """Move on to a new segment; the full one stays until its last sale is flushed."""
+        self._spill.flush()
+        if self.fsync:
+            os.fsync(self._spill.fileno())  # Lines of the old segment never depend on a later group commit
+        self._open_segment()
+
+    def _append_to_spill(self, record):
+        """Durably append a sale and return the path of the segment holding it."""
+        line = _encode(record)
+        with self._spill_lock:
+            if self._segment_size >= self.segment_bytes:
+                self._rotate()
+            spill = self._spill
+            spill.write(line)
+            self._segment_size += len(line)  # JSON is ASCII: characters are bytes
+            segment = Path(spill.name)
+            self._unflushed[segment] += 1
+            self._seq += 1
+            seq = self._seq
+        try:
+            if not self.fsync:
+                with self._spill_lock:
+                    spill.flush()  # Survives a process crash, not a power loss
+                return segment
+            # Group commit: whoever gets the sync lock fsyncs every line written so far
+            with self._sync_lock:
+                if self._synced_seq >= seq:
+                    return segment
+                with self._spill_lock:
+                    current = self._spill
+                    current.flush()
+                    target = self._seq
+                os.fsync(current.fileno())  # Earlier segments were fsynced when they were rotated out
+                self._synced_seq = target
+            return segment
+        except Exception:
+            self._mark_flushed([segment])  # Not acknowledged, so not queued either
+            raise
+
+    # Flusher
+
+    def _run(self):
+        if not self._replay_segments():
+            return
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Size trigger, time trigger, or shutdown
+                while len(self._pending) < self.max_batch and not self._stopping:
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                entries = list(islice(self._pending, self.max_batch))
+
+            if not self._flush([record for record, _ in entries]):
+                return  # Stopping while the database is down: the spill segments keep the batch
+
+            with self._cond:
+                for _ in entries:
+                    self._pending.popleft()
+                self._oldest = time.monotonic() if self._pending else None
+            self._mark_flushed([segment for _, segment in entries])
+
+    def _replay_segments(self):
+        """
+        Write the sales of earlier runs' segments, ``max_batch`` at a time, and delete each segment once
+        it is done. Only one batch is held in memory and none is queued, so ``max_pending`` keeps bounding
+        the sales accepted meanwhile. False if stopped before finishing (the rest is replayed next start).
+        """
+        while self._replay:
+            segment = self._replay[0]
+            torn = 0
+            with open(segment, encoding="utf-8") as lines:
+                while True:
+                    batch = []
+                    for line in islice(lines, self.max_batch):
+                        try:
+                            batch.append(_decode(line))
+                        except (ValueError, KeyError):
+                            torn += 1  # Torn last line of a crash mid-write: it was never acknowledged
+                    if not batch:
+                        break
+                    if not self._flush(batch):
+                        return False
+                    self.stats["recovered"] += len(batch)
+            if torn:
+                print(f"⚠ Skipped {torn} torn line(s) of '{segment}'.")
+            segment.unlink()
+            self._replay.pop(0)
+        for _, lock in self._adopted:
+            lock.close()  # Their slots are empty again and free for new workers
+        self._adopted = []
+        return True
+
+    def _flush(self, batch):
+        """Write a batch, retrying while the database is unavailable. False if stopped before succeeding."""
+        individually = False
+        for attempt in itertools.count():
+            try:
+                if individually:
+                    self._write_individually(batch)
+                else:
+                    self._write(batch)
+                    self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+                return True
+            except (IntegrityError, DataError) as e:
+                # A bad sale (e.g. unknown sundae_id) must not block the others; replays are idempotent
+                print(f"⚠ Batch of {len(batch)} sales rejected ({e.__class__.__name__}); retrying one by one.")
+                individually = True
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                delay = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
+                print(f"❌ Failed to flush {len(batch)} sales, retrying in {delay}s: {e}")
+                deadline = time.monotonic() + delay
+                with self._cond:
+                    # Producers notify on every full batch, so wait out the whole delay
+                    while not self._stopping and deadline > time.monotonic():
+                        self._cond.wait(deadline - time.monotonic())
+                    if self._stopping:
+                        return False
+
+    def _write(self, batch):
+        shards = get_shards()
+        with self.session_factory() as session:
+            if shards is not None:
+                inserted = [row for rows in shards.write(Sale, batch, write_new_records) for row in rows]
+            else:
+                inserted = write_new_records(session, Sale, batch)
+            # Replayed sales that were already stored add nothing to the live totals
+            publish_deltas(session, sales_deltas(Sale, inserted))
+            if inserted:
+                bump_versions(session, [Sale.__tablename__])
+            session.commit()
+        mark_write()  # Opens the read-your-writes window for replica routing
+
+    def _write_individually(self, batch):
+        for record in batch:
+            try:
+                self._write([record])
+                self.stats["flushed"] += 1
+            except (IntegrityError, DataError) as e:
+                self.stats["rejected"] += 1
+                with open(f"{self._base}.rejected", "a", encoding="utf-8") as rejected:
+                    rejected.write(_encode(dict(record, error=str(e.orig))))
+                print(f"❌ Rejected sale {record['sale_id_pk']}: {e.orig}")
+
+    def _mark_flushed(self, segments):
+        """Count the sales of ``segments`` (one entry per sale) as written, and drop segments that are done."""
+        # The sync lock keeps a group commit from fsyncing a segment while it is closed
+        with self._sync_lock, self._spill_lock:
+            for segment in segments:
+                if segment in self._unflushed:
+                    self._unflushed[segment] -= 1
+            for segment, unflushed in list(self._unflushed.items()):
+                if unflushed:
+                    continue
+                if self._segments[segment] is self._spill:
+                    if self._segment_size:
+                        # Everything spilled is in the database: start the segment afresh
+                        self._spill.truncate(0)
+                        self._spill.flush()
+                        self._segment_size = 0
+                else:
+                    self._segments.pop(segment).close()
+                    del self._unflushed[segment]
+                    segment.unlink()
+
+    def status(self):
+        """Counters and queue depth, for monitoring."""
+        with self._cond:
+            pending = len(self._pending)
+        with self._spill_lock:
+            segments = len(self._segments)
+        return dict(self.stats, pending=pending, running=self._thread is not None,
+                    spill_file=str(self._base) if self._base is not None else None, spill_segments=segments,
+                    replaying=len(self._replay))
@@ -0,0 +1,198 @@
+"""
+Fan-out of live sales deltas to server-sent-event subscribers (``GET /sales/stream``).
+
+One background thread per API process LISTENs on ``LIVE_DELTAS_CHANNEL`` with a
+dedicated connection to the primary and hands every notification to the
+subscribers' asyncio queues. A new subscriber first receives a snapshot of the
+per-sundae totals, then only deltas; deltas the snapshot already contains are
+dropped by transaction id. If the listener loses its connection, or a
+subscriber falls ``LIVE_QUEUE_SIZE`` events behind, the subscriber gets a
+``reset`` event and should reconnect for a fresh snapshot.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+
+from webapp.config import settings
+from webapp.live import add_local_listener, remove_local_listener, sales_snapshot, visible_in_snapshot
+
+RECONNECT_BACKOFF = (0.5, 1, 2, 5)  # seconds between LISTEN reconnect attempts
+RESET = {"event": "reset"}
+
+
+class DeltaHub:
+    """
+    Delivers ``publish_deltas`` messages to every subscribed stream of this process.
+
+    Args:
+        engine_factory (callable): Returns the primary engine (where loaders send NOTIFY).
+        channel (str): NOTIFY channel name.
+    """
+
+    def __init__(self, engine_factory, channel=None):
+        self.engine_factory = engine_factory
+        self._channel = channel
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.stats = {"subscribers": 0, "notifications": 0, "resets": 0, "listening": False, "last_error": None}
+
+    @property
+    def channel(self):
+        return self._channel or settings.LIVE_DELTAS_CHANNEL
+
+    # Lifecycle
+
+    def start(self, loop):
+        """
+        Attach the hub to ``loop``, the event loop the subscriber queues belong to.
+        No engine is created here: listening begins with the first subscriber (``listen``).
+        """
+        self._loop = loop
+        self._stopping.clear()
+
+    def listen(self):
+        """Start receiving deltas, once. Creates the primary engine, so call it off the event loop."""
+        with self._start_lock:
+            if self._started or self._stopping.is_set():
+                return
+            self._started = True
+            if self.engine_factory().dialect.name != "postgresql":
+                # No LISTEN/NOTIFY: writers in this process deliver directly after commit
+                add_local_listener(self._dispatch)
+                self.stats["listening"] = True
+                return
+            self._thread = threading.Thread(target=self._listen, name="sales-delta-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            self._stopping.set()
+            self._started = False
+        remove_local_listener(self._dispatch)
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.stats["listening"] = False
+
+    def _listen(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                self._listen_once()
+            except Exception as e:
+                attempt = 0 if self.stats["listening"] else attempt + 1  # Back off only while reconnects fail
+                self.stats["listening"] = False
+                self.stats["last_error"] = str(e)
+                self._dispatch(RESET)  # Notifications may have been missed while disconnected
+                delay = RECONNECT_BACKOFF[min(attempt, len(RECONNECT_BACKOFF) - 1)]
+                print(f"❌ Live delta listener lost its connection, reconnecting in {delay}s: {e}")
+                self._stopping.wait(delay)
+
+    def _listen_once(self):
+        raw = self.engine_factory().raw_connection()
+        try:
+            connection = raw.driver_connection  # psycopg2 connection: notifies arrive via poll()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self.stats["listening"] = True
+            print(f"🔹 Listening for live sales deltas on '{self.channel}'.")
+            while not self._stopping.is_set():
+                if select.select([connection], [], [], 1.0) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    self.stats["notifications"] += 1
+                    self._dispatch(json.loads(notify.payload))
+        finally:
+            raw.invalidate()  # The session state (LISTEN, autocommit) must not go back to the pool
+
+    # Subscribers
+
+    def _dispatch(self, message):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow to keep up: drop its backlog and make it resync from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET)
+                self.stats["resets"] += 1
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(queue)
+            self.stats["subscribers"] = len(self._subscribers)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+            self.stats["subscribers"] = len(self._subscribers)
+
+    def status(self):
+        return dict(self.stats)
+
+
+def sse(event, data):
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_deltas(hub, request, engine, shards=None, sundae_id=None):
+    """
+    Server-sent events for one subscriber: ``snapshot``, then ``delta`` per committed load, ``reset`` on gaps.
+
+    Args:
+        hub (DeltaHub): Running hub of this process.
+        request (Request): The streaming request, checked for client disconnects.
+        engine: Engine the snapshot is read from (a replica is fine).
+        shards (ShardSet): Sales shards, when configured.
+        sundae_id (str): Only stream this sundae's totals.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, hub.listen)  # The first subscriber starts the listener
+    queue = hub.subscribe()  # Before the snapshot, so no commit falls between the two
+    try:
+        totals, snapshot = await loop.run_in_executor(None, sales_snapshot, engine, shards)
+        if sundae_id is not None:
+            totals = {sundae_id: totals.get(sundae_id, [0, 0.0])}
+        yield sse("snapshot", {"totals": totals, "at": time.time()})
+
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), settings.LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"  # Keeps proxies from closing an idle stream
+                continue
+            if message is RESET:
+                yield sse("reset", {"reason": "missed deltas, reconnect for a new snapshot"})
+                return
+            if visible_in_snapshot(message["xid"], snapshot):
+                continue  # Already counted in the snapshot
+            deltas = message["deltas"]
+            if sundae_id is not None:
+                deltas = {sundae_id: deltas[sundae_id]} if sundae_id in deltas else {}
+            if deltas:
+                yield sse("delta", {"deltas": deltas, "at": message["at"]})
+    finally:
+        hub.unsubscribe(queue)
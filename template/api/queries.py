@@ -0,0 +1,126 @@
+import re
+
+from sqlalchemy import text
+
+from webapp.config import settings
+from .schema import SundaeBase
+from .serialization import model_columns
+
+# Server-side prepared statements (PREPARE/EXECUTE) are used on PostgreSQL for the hot queries unless
+# API_PREPARED_STATEMENTS is off, e.g. behind a transaction-pooling proxy such as PgBouncer.
+
+_BIND_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+
+
+class PreparedQuery:
+    """
+    A hot API query, built once at import time.
+
+    On PostgreSQL the statement is PREPAREd once per pooled connection and then
+    run with EXECUTE, so the server skips parsing and planning on every request.
+    Other dialects (and API_PREPARED_STATEMENTS=false) run the cached ``text()`` object.
+    """
+
+    def __init__(self, name, sql, param_types):
+        self.name = name
+        self.sql = sql
+        self.param_names = list(param_types)
+        self.statement = text(sql)
+
+        positions = {param: f"${i}" for i, param in enumerate(self.param_names, start=1)}
+        types = f" ({', '.join(param_types.values())})" if param_types else ""
+        self.prepare_sql = f"PREPARE {name}{types} AS " + _BIND_PARAM.sub(lambda m: positions[m.group(1)], sql)
+        args = ", ".join(f":{param}" for param in self.param_names)
+        self.execute_statement = text(f"EXECUTE {name}({args})" if args else f"EXECUTE {name}")
+
+
+QUERIES = {}
+
+
+def register(name, sql, **param_types):
+    """Register a hot query under ``name``; ``param_types`` maps bind parameters to PostgreSQL types."""
+    query = PreparedQuery(name, sql, param_types)
+    QUERIES[name] = query
+    return query
+
+
+def run(db, name, params=None):
+    """
+    Execute a registered query in the session ``db``.
+    The first use on a pooled PostgreSQL connection prepares the statement; later uses only EXECUTE it.
+    """
+    query = QUERIES[name]
+    connection = db.connection()
+    if not settings.API_PREPARED_STATEMENTS or connection.dialect.name != "postgresql":
+        return connection.execute(query.statement, params or {})
+
+    # Prepared statements are session-scoped on the server, so track them per pooled DBAPI connection
+    prepared = connection.info.setdefault("prepared_statements", set())
+    if name not in prepared:
+        connection.exec_driver_sql(query.prepare_sql)
+        prepared.add(name)
+    return connection.execute(query.execute_statement, params or {})
+
+
+SUNDAE_COLUMNS = ", ".join(f"s.{column}" for column in model_columns(SundaeBase))
+
+SUNDAE_LIST = register(
+    "sundae_list",
+    f"SELECT {SUNDAE_COLUMNS} FROM sundaes s",
+)
+
+# One round trip: sundae details and its sales aggregate via a LATERAL join
+SUNDAE_DETAIL = register(
+    "sundae_detail",
+    f"""
+    SELECT {SUNDAE_COLUMNS}, m.volume, m.revenue
+    FROM sundaes s
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS volume, COALESCE(SUM(sales.price), 0) AS revenue
+        FROM sales
+        WHERE sales.sundae_id = s.id
+    ) m
+    WHERE s.id = :id
+    """,
+    id="text",
+)
+
+# Sundae details alone, for sharded deployments where the sales aggregate is scatter-gathered
+SUNDAE_BY_ID = register(
+    "sundae_by_id",
+    f"SELECT {SUNDAE_COLUMNS} FROM sundaes s WHERE s.id = :id",
+    id="text",
+)
+
+# Top-N sundaes over a bucket range, merged from the sales_rollups pre-aggregates
+for _metric in ("revenue", "volume"):
+    register(
+        f"leaderboard_{_metric}",
+        f"""
+        SELECT r.sundae_id, s.name AS sundae_name, SUM(r.volume) AS volume, SUM(r.revenue) AS revenue
+        FROM sales_rollups r
+        LEFT JOIN sundaes s ON s.id = r.sundae_id
+        WHERE r.bucket_start BETWEEN :first_bucket AND :last_bucket
+        GROUP BY r.sundae_id, s.name
+        ORDER BY {_metric} DESC, r.sundae_id
+        LIMIT :n
+        """,
+        first_bucket="bigint",
+        last_bucket="bigint",
+        n="integer",
+    )
+del _metric
+
+# Stored price/distinct sketches of one sundae over a bucket range, merged in the API
+SUNDAE_SKETCHES = register(
+    "sundae_sketches",
+    """
+    SELECT bucket_start, price_sketch, distinct_registers
+    FROM sales_sketches
+    WHERE sundae_id = :id AND bucket_start BETWEEN :first_bucket AND :last_bucket
+    ORDER BY bucket_start
+    """,
+    id="text",
+    first_bucket="bigint",
+    last_bucket="bigint",
+)
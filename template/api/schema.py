@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
+from uuid import UUID
 
 # Base schema for Sundae
 class SundaeBase(BaseModel):
@@ -14,3 +15,10 @@ class SundaeWithMetrics(SundaeBase):
 
     class Config:
         orm_mode = True
+
+# Request body for POST /sales (one point-of-sale event)
+class SaleIn(BaseModel):
+    sundae_id: str
+    timestamp: float
+    price: float = Field(ge=0)
+    sale_id: Optional[UUID] = None  # Idempotency key for client retries; generated when omitted
@@ -0,0 +1,40 @@
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+# With API_FAST_SERIALIZATION the routes encode trusted DB rows straight to JSON bytes, skipping
+# jsonable_encoder and response_model validation. The response_model stays declared on the routes,
+# so the OpenAPI schema is unchanged.
+
+
+def dumps(content):
+    """Encode ``content`` to JSON bytes with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def model_columns(schema):
+    """Column names of a response schema, in declaration order."""
+    return list(schema.model_fields)
+
+
+def rows_to_dicts(keys, rows):
+    """Turn result rows into plain dicts keyed by ``keys`` (no RowMapping round trip)."""
+    return [dict(zip(keys, row)) for row in rows]
+
+
+class FastJSONResponse(Response):
+    """JSON response that accepts pre-encoded bytes or encodes plain data with ``dumps``."""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
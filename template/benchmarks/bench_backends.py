@@ -0,0 +1,185 @@
+"""
+Scan and aggregate latency of the dashboard and API queries on each storage backend.
+
+Loads the same synthetic sundaes and sales into an embedded DuckDB file and, with
+``--postgres``, into a scratch schema of the PostgreSQL database from ``.env``
+(dropped afterwards). It then times the revenue report, the sundae detail, and
+the range and pixel-bucket queries behind the sales chart. The SQL is the same
+on both backends.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_backends [--sales 1000000] [--sundaes 50] [--repeat 20] [--postgres]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, create_engine, event, insert, text
+from sqlalchemy.engine.url import URL
+
+from api import queries
+from webapp.backends import copy_rows, is_duckdb
+from webapp.downsample import pixel_buckets_query, range_query
+from webapp.models import Sale, Sundae
+
+SCRATCH_SCHEMA = "bench_backends"
+BATCH = 50000
+DAY = 86400
+
+REVENUE_REPORT = text(
+    """
+    SELECT sundaes.id AS sundae_id, sundaes.name AS sundae_name,
+           COUNT(sales.sundae_id) AS volume, COALESCE(SUM(sales.price), 0) AS revenue
+    FROM sundaes
+    LEFT JOIN sales ON sundaes.id = sales.sundae_id
+    GROUP BY sundaes.id, sundaes.name
+    ORDER BY revenue DESC
+    """
+)
+
+
+def synthetic_rows(sundaes, sales, days=365, seed=7):
+    rng = random.Random(seed)
+    sundae_rows = [{"id": f"sundae-{i}", "name": f"Sundae {i}", "description": None} for i in range(sundaes)]
+    sale_rows = (
+        {
+            "sale_id_pk": uuid.UUID(int=rng.getrandbits(128)),
+            "sundae_id": f"sundae-{rng.randrange(sundaes)}",
+            "timestamp": rng.random() * days * DAY,
+            "price": round(rng.lognormvariate(1.8, 0.35), 2),
+        }
+        for _ in range(sales)
+    )
+    return sundae_rows, sale_rows
+
+
+def load(engine, tables, sundaes, sales):
+    """Create the scratch tables and load them; returns the load time in seconds."""
+    metadata, sundae_table, sale_table = tables
+    metadata.create_all(engine)
+    sundae_rows, sale_rows = synthetic_rows(sundaes, sales)
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for table, rows in ((sundae_table, sundae_rows), (sale_table, sale_rows)):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == BATCH:
+                    write(connection, table, batch)
+                    batch = []
+            write(connection, table, batch)
+    return time.perf_counter() - start
+
+
+def write(connection, table, rows):
+    if not rows:
+        return
+    if is_duckdb(connection):
+        copy_rows(connection, table, rows)
+    else:
+        connection.execute(insert(table), rows)
+
+
+def timed(connection, statement, params, repeat):
+    """Latencies (ms) of ``repeat`` runs after one warm-up run."""
+    connection.execute(statement, params).fetchall()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(statement, params).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def workload(sundaes):
+    end = 365 * DAY
+    return [
+        ("revenue report (GROUP BY)", REVENUE_REPORT, {}),
+        ("sundae detail (LATERAL)", queries.SUNDAE_DETAIL.statement, {"id": f"sundae-{sundaes // 2}"}),
+        ("sales range (MIN/MAX/COUNT)", range_query(), {}),
+        ("chart buckets, 1200 px", pixel_buckets_query(), {"start": 0, "end": end, "bucket_width": end / 1200}),
+    ]
+
+
+def postgres_engine():
+    load_dotenv()
+    url = URL.create(
+        drivername="postgresql+psycopg2",
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+    )
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCRATCH_SCHEMA}"))
+
+    @event.listens_for(engine, "connect")
+    def scratch_search_path(dbapi_connection, connection_record):
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {SCRATCH_SCHEMA}")
+        dbapi_connection.commit()
+
+    engine.dispose()  # reconnect so every pooled connection gets the scratch search_path
+    return engine
+
+
+def drop_postgres(engine):
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query latency on the PostgreSQL and DuckDB backends.")
+    parser.add_argument("--sales", type=int, default=1_000_000, help="Synthetic sales rows")
+    parser.add_argument("--sundaes", type=int, default=50, help="Synthetic sundaes")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--postgres", action="store_true", help="Also run against a scratch schema of the .env database")
+    args = parser.parse_args()
+
+    metadata = MetaData()
+    tables = (metadata, Sundae.__table__.to_metadata(metadata), Sale.__table__.to_metadata(metadata))
+
+    directory = tempfile.mkdtemp(prefix="bench-backends-")
+    backends = [("duckdb", create_engine(URL.create("duckdb", database=os.path.join(directory, "bench.duckdb"))), None)]
+    if args.postgres:
+        engine = postgres_engine()
+        backends.append(("postgres", engine, drop_postgres))
+
+    print(f"{args.sales} sales across {args.sundaes} sundaes, {args.repeat} runs per query\n")
+    results = {}
+    for name, engine, cleanup in backends:
+        try:
+            seconds = load(engine, tables, args.sundaes, args.sales)
+            print(f"🔸 {name}: loaded in {seconds:.2f}s ({args.sales / seconds:,.0f} rows/s)")
+            with engine.connect() as connection:
+                for label, statement, params in workload(args.sundaes):
+                    results[(label, name)] = timed(connection, statement, params, args.repeat)
+        finally:
+            if cleanup:
+                cleanup(engine)
+            else:
+                engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    names = [name for name, _, _ in backends]
+    print(f"\n{'query':<30}" + "".join(f"{name + ' p50 ms':>18}{name + ' p95 ms':>18}" for name in names))
+    for label, _, _ in workload(args.sundaes):
+        cells = ""
+        for name in names:
+            latencies = sorted(results[(label, name)])
+            cells += f"{statistics.median(latencies):>18.2f}{latencies[int(len(latencies) * 0.95) - 1]:>18.2f}"
+        print(f"{label:<30}{cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Decode throughput and memory per row: ``json.load`` (+ ORM objects) vs the streamed dicts the loaders use.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_decode [--rows 200000]
+"""
+import argparse
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from webapp.models import Sale
+from webapp.records import iter_table_records
+
+SOURCE_FILE = Path(__file__).resolve().parent.parent / "webapp/data/sales.json"
+
+
+def build_input(rows, directory):
+    """Write a sales JSON array with ``rows`` records by repeating the sample data."""
+    with open(SOURCE_FILE) as f:
+        sample = json.load(f)
+    data = (sample * (rows // len(sample) + 1))[:rows]
+    path = Path(directory) / "sales.json"
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return path
+
+
+def decode_json_load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def decode_json_load_orm(path):
+    with open(path) as f:
+        return [Sale(**record) for record in json.load(f)]
+
+
+def decode_streamed(path):
+    return list(iter_table_records(path, "sales"))
+
+
+def measure(decode, path, rows):
+    """Return (rows/s, retained bytes per row, peak bytes per row) for one decoder."""
+    gc.collect()
+    start = time.perf_counter()
+    decode(path)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = decode(path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return rows / elapsed, retained / rows, peak / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sales record decoding.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Number of sales records to decode")
+    args = parser.parse_args()
+
+    decoders = [
+        ("json.load -> dict", decode_json_load),
+        ("json.load -> ORM Sale", decode_json_load_orm),
+        ("streamed dicts", decode_streamed),
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = build_input(args.rows, directory)
+        print(f"Decoding {args.rows:,} sales records ({path.stat().st_size / 1e6:.1f} MB)\n")
+        print(f"{'decoder':<24}{'rows/s':>14}{'retained B/row':>18}{'peak B/row':>14}")
+        for name, decode in decoders:
+            rate, retained, peak = measure(decode, path, args.rows)
+            print(f"{name:<24}{rate:>14,.0f}{retained:>18,.0f}{peak:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Load harness for the sundae detail query: round trips, planning time and latency.
+
+Compares the legacy two-statement lookup against the single LATERAL query run
+through the prepared-statement registry. Needs the PostgreSQL database from
+``.env`` loaded with sundaes and sales.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_queries [--threads 8] [--requests 500]
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, text
+
+from api import queries
+from api.database import SessionLocal, engine
+
+LEGACY_SUNDAE = text("SELECT * FROM sundaes WHERE id = :id")
+LEGACY_SALES = text("SELECT COUNT(*) AS volume, SUM(price) AS revenue FROM sales WHERE sundae_id = :id")
+
+_counter = threading.local()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_round_trips(conn, cursor, statement, parameters, context, executemany):
+    _counter.statements = getattr(_counter, "statements", 0) + 1
+
+
+def legacy_detail(db, sundae_id):
+    sundae = db.execute(LEGACY_SUNDAE, {"id": sundae_id}).fetchone()
+    sales = db.execute(LEGACY_SALES, {"id": sundae_id}).fetchone()
+    return sundae, sales
+
+
+def registry_detail(db, sundae_id):
+    return queries.run(db, "sundae_detail", {"id": sundae_id}).fetchone()
+
+
+def planning_time(connection, sql, params):
+    """Server-side planning time (ms) of ``sql`` as reported by EXPLAIN ANALYZE."""
+    plan = connection.execute(text(f"EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) {sql}"), params).scalar()
+    return plan[0]["Planning Time"]
+
+
+def run_load(detail, sundae_ids, threads, requests):
+    """Run ``requests`` lookups per thread; return (latencies in ms, statements per request)."""
+    latencies = []
+    statements = []
+
+    def worker(worker_id):
+        with SessionLocal() as db:
+            detail(db, sundae_ids[0])  # warm the connection (and prepare on first use)
+            for i in range(requests):
+                _counter.statements = 0
+                start = time.perf_counter()
+                detail(db, sundae_ids[(worker_id + i) % len(sundae_ids)])
+                latencies.append((time.perf_counter() - start) * 1000)
+                statements.append(_counter.statements)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return latencies, statistics.mean(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sundae detail query under load.")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per client")
+    args = parser.parse_args()
+    engine.echo = False
+
+    with engine.connect() as connection:
+        sundae_ids = [row[0] for row in connection.execute(text("SELECT id FROM sundaes"))]
+        sample = {"id": sundae_ids[0]}
+        legacy_planning = planning_time(connection, LEGACY_SUNDAE.text, sample) + planning_time(
+            connection, LEGACY_SALES.text, sample
+        )
+        lateral_planning = planning_time(connection, queries.SUNDAE_DETAIL.sql, sample)
+        connection.exec_driver_sql(queries.SUNDAE_DETAIL.prepare_sql)
+        for _ in range(6):  # let the server settle on a generic plan
+            connection.execute(queries.SUNDAE_DETAIL.execute_statement, sample)
+        prepared_planning = planning_time(connection, queries.SUNDAE_DETAIL.execute_statement.text, sample)
+        connection.exec_driver_sql(f"DEALLOCATE {queries.SUNDAE_DETAIL.name}")
+
+    print(f"{args.threads} clients x {args.requests} requests against {len(sundae_ids)} sundaes\n")
+    print(f"{'variant':<30}{'round trips':>12}{'planning ms':>13}{'p50 ms':>9}{'p95 ms':>9}")
+    variants = [
+        ("legacy (2 statements)", legacy_detail, legacy_planning),
+        ("lateral + prepared registry", registry_detail, prepared_planning),
+    ]
+    for name, detail, planning in variants:
+        latencies, round_trips = run_load(detail, sundae_ids, args.threads, args.requests)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95)]
+        print(f"{name:<30}{round_trips:>12.1f}{planning:>13.3f}{p50:>9.2f}{p95:>9.2f}")
+    print(f"\n(unprepared LATERAL query planning: {lateral_planning:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Per-request CPU cost of GET /sundaes with and without fast serialization.
+
+Runs the real FastAPI app in-process against an in-memory SQLite copy of the
+``sundaes`` table so only query + serialization work is measured.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_serialization [--rows 10000] [--requests 50]
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api import serialization
+from api.api import app
+from api.database import get_read_db
+from webapp.config import settings
+from webapp.models import Base, Sundae
+
+
+def build_database(rows):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Sundae.__table__])
+    with engine.begin() as connection:
+        connection.execute(
+            Sundae.__table__.insert(),
+            [
+                {"id": f"sundae-{i}", "name": f"Sundae {i}", "description": "Three scoops and a cherry on top."}
+                for i in range(rows)
+            ],
+        )
+    return sessionmaker(bind=engine)
+
+
+def cpu_per_request(client, requests):
+    client.get("/sundaes")  # warm up
+    start = time.process_time()
+    for _ in range(requests):
+        response = client.get("/sundaes")
+        response.raise_for_status()
+    return (time.process_time() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GET /sundaes serialization.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Number of sundae rows to return")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per mode")
+    args = parser.parse_args()
+
+    session_factory = build_database(args.rows)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_read_db] = override_get_db
+    client = TestClient(app)
+
+    results = {}
+    for fast in (False, True):
+        settings.API_FAST_SERIALIZATION = fast
+        results[fast] = cpu_per_request(client, args.requests)
+
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"GET /sundaes with {args.rows:,} rows, {args.requests} requests per mode\n")
+    print(f"{'mode':<40}{'CPU ms/request':>16}")
+    print(f"{'response_model + jsonable_encoder':<40}{results[False] * 1000:>16.1f}")
+    print(f"{'fast (' + encoder + ', no validation)':<40}{results[True] * 1000:>16.1f}")
+    print(f"\nCPU saving per request: {(1 - results[True] / results[False]) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
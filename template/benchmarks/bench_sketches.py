@@ -0,0 +1,86 @@
+"""
+Accuracy and cost of the sales sketches against exact answers.
+
+Simulates daily batches for one sundae, folds them the way the loaders do, merges
+the per-day sketches like GET /sundaes/{id}/distribution, and compares with the
+exact percentiles and distinct counts of the raw values.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_sketches [--days 30] [--sales-per-day 20000] [--customers 5000]
+"""
+import argparse
+import bisect
+import random
+import time
+
+from webapp.config import settings
+from webapp.sketches import fold_sales, hll_relative_error, kll_rank_error, summarize
+
+DAY = 86400
+FRACTIONS = (0.5, 0.95, 0.99)
+
+
+def simulate(days, sales_per_day, customers, seed=7):
+    rng = random.Random(seed)
+    return [
+        [
+            {
+                "sundae_id": "banana-split",
+                "timestamp": day * DAY + rng.random() * DAY,
+                "price": round(rng.lognormvariate(1.8, 0.35), 2),
+                "customer_id": f"customer-{rng.randrange(customers)}",
+            }
+            for _ in range(sales_per_day)
+        ]
+        for day in range(days)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sales sketches.")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--sales-per-day", type=int, default=20_000)
+    parser.add_argument("--customers", type=int, default=5_000, help="Customer id pool drawn from per sale")
+    args = parser.parse_args()
+
+    batches = simulate(args.days, args.sales_per_day, args.customers)
+
+    start = time.perf_counter()
+    rows = []
+    for batch in batches:
+        for (bucket, _), (kll, hll) in fold_sales(batch).items():
+            rows.append((bucket, kll.to_dict(), bytes(hll.registers)))
+    fold_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = summarize(rows, FRACTIONS)
+    merge_ms = (time.perf_counter() - start) * 1000
+
+    prices = sorted(sale["price"] for batch in batches for sale in batch)
+    total_sales = len(prices)
+    exact_distinct = len({sale["customer_id"] for batch in batches for sale in batch})
+
+    print(f"{args.days} days x {args.sales_per_day:,} sales, {args.customers:,} customers\n")
+    print(f"Fold throughput: {total_sales / fold_seconds:,.0f} sales/s")
+    print(f"Merge {len(rows)} daily sketches + answer: {merge_ms:.1f} ms\n")
+
+    print(f"{'quantile':<10}{'sketch':>10}{'exact':>10}{'rank error':>12}")
+    worst = 0.0
+    for fraction, value in zip(FRACTIONS, summary["price"]["quantiles"].values()):
+        exact = prices[min(total_sales - 1, int(fraction * total_sales))]
+        # Rank error: how far the returned value's true rank is from the requested one
+        low = bisect.bisect_left(prices, value) / total_sales
+        high = bisect.bisect_right(prices, value) / total_sales
+        error = 0.0 if low <= fraction <= high else min(abs(low - fraction), abs(high - fraction))
+        worst = max(worst, error)
+        print(f"{'p' + format(fraction * 100, 'g'):<10}{value:>10.2f}{exact:>10.2f}{error:>11.2%}")
+    print(f"Worst rank error {worst:.2%} (documented bound {kll_rank_error(settings.SKETCH_KLL_K):.2%} at 99% confidence)\n")
+
+    estimate = summary["distinct"]["total"]
+    print(f"Distinct customers: sketch {estimate:,}, exact {exact_distinct:,}, "
+          f"error {abs(estimate - exact_distinct) / exact_distinct:.2%} "
+          f"(standard error {hll_relative_error(settings.SKETCH_HLL_PRECISION):.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Cold-start import time of the API, the loader CLIs and the Streamlit pages, with budgets.
+
+Every target is imported in a fresh interpreter under ``python -X importtime``; the
+interpreter's own startup imports (measured with an empty program) are subtracted.
+Streamlit pages are measured by their module-level imports only, so nothing
+touches the database. Exits with status 1 when a target exceeds its budget.
+
+Usage (from the ``template`` directory):
+    python -m benchmarks.bench_startup [--runs 5] [--scale 1.0] [--only api.api]
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = TEMPLATE_DIR.parent
+PAGES_DIR = TEMPLATE_DIR / "streamlit" / "pages"
+
+# Budgets in milliseconds of import time (best of --runs), set with ~30% headroom over the
+# lazily-initialised tree; FastAPI and SQLAlchemy themselves account for most of it.
+# Scale with --scale on slower machines.
+BUDGETS_MS = {
+    "app.main": 1200,
+    "api.api": 1200,
+    "app.utils.dynamic_loader": 450,
+    "exercise": 700,
+    "01_load_data": 100,  # streamlit + readers only; database and models load on demand
+    "02_view_data": 650,
+    "03_revenue_analysis_by_id": 100,  # requests and matplotlib load on demand
+    "04_revenue_report": 650,  # pandas, matplotlib and seaborn load on demand
+}
+
+
+def page_imports(page):
+    """Module-level import statements of a Streamlit page, as a program that runs only those."""
+    tree = ast.parse(page.read_text())
+    return "\n".join(
+        ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def targets():
+    """(name, program, working directory) for every measured entry point."""
+    yield "app.main", "import app.main", REPO_ROOT
+    yield "api.api", "import api.api", TEMPLATE_DIR
+    yield "app.utils.dynamic_loader", "import app.utils.dynamic_loader", REPO_ROOT
+    yield "exercise", "import exercise", TEMPLATE_DIR
+    for page in sorted(PAGES_DIR.glob("*.py")):
+        yield page.stem, page_imports(page), TEMPLATE_DIR
+
+
+def import_time_us(program, cwd):
+    """Total top-level import time (microseconds) of ``program`` in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(cwd), str(TEMPLATE_DIR / "streamlit")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", program],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(errors[-1] if errors else f"exit status {result.returncode}")
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # top-level import (nested ones are indented further)
+            total += int(cumulative)
+    return total
+
+
+def best_ms(program, cwd, runs, baseline_us=0):
+    """Best-of-``runs`` import time in ms; the minimum is the least noisy estimate of the real cost."""
+    return max(0, min(import_time_us(program, cwd) for _ in range(runs)) - baseline_us) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time against budgets.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per target (the best run is used)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, e.g. 2.0 on slow CI")
+    parser.add_argument("--only", nargs="*", help="Measure only these targets")
+    args = parser.parse_args()
+
+    baseline_us = min(import_time_us("pass", TEMPLATE_DIR) for _ in range(args.runs))
+
+    print(f"{'target':<30}{'import ms':>12}{'budget ms':>12}  status")
+    failed = []
+    for name, program, cwd in targets():
+        if args.only and name not in args.only:
+            continue
+        budget = BUDGETS_MS.get(name, 500) * args.scale
+        try:
+            elapsed = best_ms(program, cwd, args.runs, baseline_us)
+        except RuntimeError as e:
+            print(f"{name:<30}{'-':>12}{budget:>12.0f}  ⚠ skipped ({e})")
+            continue
+        ok = elapsed <= budget
+        if not ok:
+            failed.append(name)
+        print(f"{name:<30}{elapsed:>12.1f}{budget:>12.0f}  {'✅' if ok else '❌ over budget'}")
+
+    if failed:
+        print(f"\n❌ Startup budget exceeded: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
 from webapp.database import Database
 from webapp.models import Sundae, Sale, Employee
 from pathlib import Path
+import argparse
 
 def main():
+    parser = argparse.ArgumentParser(description="Load the sundae, sales and employee data.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--resume", action="store_true",
+                      help="Keep the loaded data and continue each file after its last committed chunk")
+    mode.add_argument("--warm", action="store_true",
+                      help="Keep the tables unless the models changed, and reload only the files that changed")
+    parser.add_argument("--defer-checks", action="store_true", default=None,
+                        help="Drop indexes and foreign keys while loading and rebuild them at the end")
+    args = parser.parse_args()
+
     BASE_DIR = Path(__file__).resolve().parent
     SUNDAES_FILE = BASE_DIR / "webapp/data/sundaes.json"
     SALES_FILE = BASE_DIR / "webapp/data/sales.json"
@@ -10,13 +21,15 @@ def main():
 
     print("🔹 Starting the database process...")
 
-    # Initialize the database
-    db = Database()
+    # Initialize the database (resumed and warm runs keep the tables and their checkpoints)
+    db = Database(reset=not (args.resume or args.warm))
 
-    # Load data dynamically
-    db.load_bulk_data(SUNDAES_FILE, Sundae)
-    db.load_bulk_data(SALES_FILE, Sale)
-    db.load_bulk_data(EMPLOYEES_FILE, Employee)
+    # Load data dynamically: sundaes and employees concurrently, then sales (which references sundaes)
+    sources = [(SUNDAES_FILE, Sundae), (SALES_FILE, Sale), (EMPLOYEES_FILE, Employee)]
+    if args.warm:
+        db.warm_start(sources)
+    else:
+        db.load_tables(sources, defer_checks=args.defer_checks, resume=args.resume)
 
     # Finalize
     db.close()
@@ -0,0 +1,147 @@
+"""
+Rendered-chart cache shared by every Streamlit session of the dashboard process.
+
+Charts are rendered once to PNG bytes and reused by later reruns and by other
+viewers. Keys combine the chart name, its query parameters and a version of its
+data: for charts read from the database, the ``data_versions`` of the tables
+they are built from (``data_version``), read on the engine that also runs the
+chart's query. A hit therefore costs one small lookup instead of the aggregate
+query; a load bumps the versions, which produces a new key, and the stale image
+simply ages out. The cache is an LRU bounded by ``CHART_CACHE_MAX_BYTES``.
+"""
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from webapp.config import settings
+
+
+def chart_key(name, params, version):
+    """Cache key for chart ``name`` drawn with ``params`` at data ``version`` (any JSON-friendly value)."""
+    payload = json.dumps([name, params, version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def data_version(engine, tables):
+    """
+    [[table, version], ...] of ``tables`` in the ``data_versions`` of ``engine``, the engine the chart's data
+    is read from (a replica serves both the versions and the data at the same point of replay).
+    None when nothing is versioned there yet: the data is then queried and drawn without caching.
+    """
+    from webapp.data_versions import read_versions
+
+    with engine.connect() as connection:
+        versions = read_versions(connection)
+    if not versions:
+        return None
+    return [[table, versions.get(table, (0, 0.0))[0]] for table in tables]
+
+
+def render_png(fig, dpi=150):
+    """Render a matplotlib figure to PNG bytes and release it."""
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)  # Figures stay in pyplot's registry (and memory) until closed
+    return buffer.getvalue()
+
+
+class ChartCache:
+    """
+    Size-bounded LRU of rendered chart bytes.
+
+    Concurrent requests for the same missing key wait for a single render
+    instead of each drawing the figure.
+
+    Args:
+        max_bytes (int): Total size of the cached images; least recently used ones are evicted beyond it.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._rendering = {}
+
+    def _lookup(self, key):
+        image = self._items.get(key)
+        if image is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+        return image
+
+    def get_or_render(self, key, render):
+        """Cached bytes for ``key``, calling ``render()`` to produce them on a miss."""
+        with self._lock:
+            image = self._lookup(key)
+            if image is not None:
+                return image
+            key_lock = self._rendering.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                with self._lock:
+                    image = self._lookup(key)  # Another viewer may have rendered it meanwhile
+                    if image is not None:
+                        return image
+                image = render()
+                with self._lock:
+                    self.misses += 1
+                    self._store(key, image)
+                return image
+        finally:
+            with self._lock:
+                # Also when render() raised; waiters that still hold key_lock render it themselves
+                if self._rendering.get(key) is key_lock:
+                    self._rendering.pop(key)
+
+    def _store(self, key, image):
+        if len(image) > self.max_bytes:
+            return
+        self._items[key] = image
+        self.size += len(image)
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "charts": len(self._items),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@st.cache_resource
+def chart_cache():
+    """The process-wide chart cache (one instance shared across sessions and reruns)."""
+    return ChartCache(settings.CHART_CACHE_MAX_BYTES)
+
+
+def cached_chart(name, params, version, render):
+    """
+    Rendered PNG bytes for a chart, querying and drawing it only on a cache miss.
+
+    Args:
+        name (str): Chart identifier.
+        params (dict): Query parameters the chart depends on.
+        version: What changes whenever the plotted data does: ``data_version(...)`` for data read from the
+            database, or the data itself when it is already in memory. None renders without caching.
+        render (callable): Queries the data if needed and returns a matplotlib figure; called only on a miss.
+    """
+    if version is None:
+        return render_png(render())
+    return chart_cache().get_or_render(chart_key(name, params, version), lambda: render_png(render()))
@@ -2,23 +2,23 @@ from sqlalchemy import create_engine, text, inspect, Column, Float, String
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import Table, MetaData
 from dotenv import load_dotenv
+from webapp.backends import database_url, default_schema, engine_options, is_duckdb, reflect_table
 import os
 import json
 from pathlib import Path
 from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
+from webapp.models import SalesRollup, SalesSketch
+from webapp.schema_policy import evolve_schema
+from webapp.checkpoints import load_in_chunks
+from webapp.sharding import get_shards
 
 # Load environment variables
 load_dotenv()
 
 # Database Connection Parameters
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-
-DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# PostgreSQL from the DB_* variables, or the embedded DuckDB file (DB_BACKEND, see webapp/backends.py)
+DB_URL = database_url()
 
 # SQLAlchemy Base Class
 Base = declarative_base()
@@ -28,9 +28,9 @@ class Database:
     def __init__(self):
         """Initialize the database connection."""
         print("🔹 Initializing the database connection...")
-        self.engine = create_engine(DB_URL, echo=False)
+        self.engine = create_engine(DB_URL, echo=False, **engine_options())
         self.session_factory = sessionmaker(bind=self.engine)
-        self.schema_name = "public"  # Use the default schema
+        self.schema_name = default_schema()  # Use the default schema
         print(f"🔹 Using schema '{self.schema_name}' for table creation...")
 
     def initialize_schema(self, model_class):
@@ -39,70 +39,39 @@ class Database:
         """
         print(f"🔹 Initializing table '{model_class.__tablename__}' in schema '{self.schema_name}'...")
         with self.engine.connect() as connection:
-            connection.execute(text(f"SET search_path TO {self.schema_name}"))
+            if not is_duckdb(connection):
+                connection.execute(text(f"SET search_path TO {self.schema_name}"))
             if not self.engine.dialect.has_table(connection, model_class.__tablename__, schema=self.schema_name):
                 model_class.__table__.create(bind=self.engine)
                 print(f"✅ Table '{model_class.__tablename__}' created successfully!")
             else:
                 print(f"🔸 Table '{model_class.__tablename__}' already exists.")
 
-    def _infer_column_type(self, value):
-        """Infer SQL column type based on a Python value."""
-        if isinstance(value, int):
-            return "INTEGER"
-        elif isinstance(value, float):
-            return "FLOAT"
-        elif isinstance(value, str):
-            return "TEXT"
-        else:
-            return "TEXT"
-
-    def _detect_and_update_schema(self, model_class, data_list):
+    def _detect_and_update_schema(self, model_class, data_list, load_size=None):
         """
-        Detect new columns and update the table schema dynamically.
+        Apply the schema-evolution policy to the keys of ``data_list``: dense new keys are added as
+        columns in one ALTER TABLE, sparse ones are kept in the JSONB extras column.
+        Returns the table's real columns.
         """
         print(f"🔹 Detecting and updating schema for table '{model_class.__tablename__}'...")
         with self.engine.connect() as connection:
-            connection.execute(text(f"SET search_path TO {self.schema_name}"))
-            inspector = inspect(connection)
-
-            # Fetch existing columns
-            existing_columns = {
-                col["name"] for col in inspector.get_columns(model_class.__tablename__, schema=self.schema_name)
-            }
-            print(f"🔸 Existing columns in '{model_class.__tablename__}': {existing_columns}")
-
-            # Detect columns in the JSON file
-            all_keys = {key for record in data_list for key in record.keys()}
-            print(f"🔸 Detected columns from JSON: {all_keys}")
-
-            # Add missing columns to the table dynamically
-            for key in all_keys:
-                if key not in existing_columns:
-                    sample_value = next(
-                        (record[key] for record in data_list if key in record and record[key] is not None), None
-                    )
-                    column_type = self._infer_column_type(sample_value)
-                    alter_query = (
-                        f"ALTER TABLE {self.schema_name}.{model_class.__tablename__} ADD COLUMN {key} {column_type}"
-                    )
-                    print(f"🔸 Adding column '{key}' of type '{column_type}' to table '{model_class.__tablename__}'.")
-                    connection.execute(text(alter_query))
-                    print(f"✅ Column '{key}' added to table '{model_class.__tablename__}'.")
-
-            connection.commit()  # Ensure changes are committed
+            if not is_duckdb(connection):
+                connection.execute(text(f"SET search_path TO {self.schema_name}"))
+            columns = evolve_schema(
+                connection, model_class.__tablename__, data_list, schema=self.schema_name, load_size=load_size
+            )
+            connection.commit()  # Ensure the transaction is committed
             print(f"✅ Schema for '{model_class.__tablename__}' updated successfully.")
         self._reflect_table_schema(model_class)
+        return columns
 
     def _reflect_table_schema(self, model_class):
         """
         Reflect the updated table schema and synchronize the ORM model.
         """
         print(f"🔹 Reflecting table schema for '{model_class.__tablename__}'...")
-        metadata = MetaData(schema=self.schema_name)
-        metadata.reflect(bind=self.engine)
-
-        table = metadata.tables[f"{self.schema_name}.{model_class.__tablename__}"]
+        # Only this table, and without the PostgreSQL catalogs on DuckDB (see webapp/backends.py)
+        table = reflect_table(self.engine, model_class.__tablename__, self.schema_name)
 
         # Add new columns to the ORM model dynamically
         for column in table.columns:
@@ -114,29 +83,26 @@ class Database:
         model_class.__table__ = table
         print(f"✅ Model '{model_class.__name__}' synchronized with updated table schema.")
 
-    def load_bulk_data(self, file_path: Path, model_class):
+    def load_bulk_data(self, file_path: Path, model_class, resume=False):
         """
-        Load JSON data into the database dynamically.
+        Load JSON, NDJSON or CSV data (optionally gzip/zstd compressed) into the database dynamically.
+        Records are committed in checkpointed chunks of ``LOAD_CHUNK_ROWS``; ``resume`` continues an
+        interrupted load of the same file after its last committed chunk.
         """
         print(f"🔹 Loading bulk data from '{file_path.name}' into table '{model_class.__tablename__}'...")
         session = self.session_factory()
         try:
-            # Load JSON data
-            with open(file_path, "r") as f:
-                data_list = json.load(f)
-            print(f"🔸 Loaded {len(data_list)} records from '{file_path.name}'.")
-
             # Initialize table and update schema
             self.initialize_schema(model_class)
-            self._detect_and_update_schema(model_class, data_list)
-
-            # Prepare and insert data
-            objects = [model_class(**record) for record in data_list]
-            print(f"🔸 Preparing to insert {len(objects)} records into '{model_class.__tablename__}'...")
-
-            session.bulk_save_objects(objects)
-            session.commit()
-            print(f"✅ Data from '{file_path.name}' loaded successfully into '{model_class.__tablename__}'!")
+            if model_class.__tablename__ == "sales":
+                self.initialize_schema(SalesRollup)
+                self.initialize_schema(SalesSketch)
+
+            # Validate, evolve the schema and insert chunk by chunk, each chunk committed with its checkpoint
+            shards = get_shards() if model_class.__tablename__ == "sales" else None
+            rows = load_in_chunks(session, model_class, file_path, self._detect_and_update_schema,
+                                  shards=shards, resume=resume)
+            print(f"✅ Data from '{file_path.name}' loaded successfully into '{model_class.__tablename__}' ({rows} rows)!")
 
         except Exception as e:
             session.rollback()
@@ -0,0 +1,114 @@
+"""
+Live per-sundae sales totals for the dashboard, kept current by the API's ``/sales/stream``.
+
+One background thread per dashboard process holds the server-sent-event
+connection: it takes the ``snapshot`` event as the starting totals and adds
+every ``delta`` to them locally. Pages read the totals from memory (typically in
+an ``st.fragment`` that reruns every ``LIVE_REFRESH_SECONDS``) instead of
+re-querying the database or the API. On a ``reset`` event or a dropped
+connection the thread reconnects and starts again from a fresh snapshot.
+"""
+import json
+import threading
+import time
+
+import streamlit as st
+
+from webapp.config import settings
+
+RECONNECT_BACKOFF = (1, 2, 5, 10)  # seconds between stream reconnect attempts
+
+
+def iter_events(lines):
+    """(event, data) pairs from the lines of a server-sent-event stream."""
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue  # keep-alive comment
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+class LiveTotals:
+    """
+    Per-sundae {sundae_id: [volume, revenue]} maintained from the API's live stream.
+
+    Args:
+        url (str): The ``/sales/stream`` endpoint.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.version = 0
+        self.updated_at = None
+        self.error = None
+        self._totals = {}
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="live-sales-totals", daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        """Whether the totals are current (a snapshot was received and the stream is open)."""
+        return self._connected.is_set()
+
+    def wait(self, timeout):
+        """Wait up to ``timeout`` seconds for the first snapshot; returns ``connected``."""
+        if self.error is not None:
+            return self.connected  # The last attempt failed: don't hold up every page run
+        return self._connected.wait(timeout)
+
+    def current(self):
+        """A copy of the totals and the number of updates applied so far."""
+        with self._lock:
+            return {sundae_id: list(total) for sundae_id, total in self._totals.items()}, self.version
+
+    def _run(self):
+        import requests  # Deferred like in the pages: only the stream thread needs it
+
+        attempt = 0
+        while True:
+            try:
+                # The read timeout exceeds the server's keep-alive interval, so a silent stream means a dead one
+                with requests.get(self.url, stream=True, timeout=(5, settings.LIVE_KEEPALIVE_SECONDS * 3)) as response:
+                    response.raise_for_status()
+                    attempt = 0
+                    for event, data in iter_events(response.iter_lines(decode_unicode=True)):
+                        if event == "reset":
+                            break
+                        self._apply(event, data)
+            except Exception as e:  # Whatever went wrong (network, malformed event), the thread reconnects
+                self.error = str(e)
+            finally:
+                self._connected.clear()
+            time.sleep(RECONNECT_BACKOFF[min(attempt, len(RECONNECT_BACKOFF) - 1)])
+            attempt += 1
+
+    def _apply(self, event, data):
+        with self._lock:
+            if event == "snapshot":
+                self._totals = {sundae_id: [int(v), float(r)] for sundae_id, (v, r) in data["totals"].items()}
+                self.error = None
+                self._connected.set()
+            elif event == "delta":
+                for sundae_id, (volume, revenue) in data["deltas"].items():
+                    total = self._totals.setdefault(sundae_id, [0, 0.0])
+                    total[0] += int(volume)
+                    total[1] += float(revenue)
+            else:
+                return
+            self.version += 1
+            self.updated_at = data.get("at")
+
+
+@st.cache_resource
+def live_totals():
+    """The process-wide live totals (one stream connection shared by every session)."""
+    return LiveTotals(f"{settings.API_BASE_URL}/sales/stream")
@@ -1,32 +1,41 @@
 import streamlit as st
 from pathlib import Path
-from database import Database
-from webapp.models import Sundae, Sale, Employee  # Import your model classes
+from webapp.readers import SUPPORTED_UPLOAD_TYPES, table_name_for
 import os
 import time  # To simulate loading time
 
 # Page title with style
 st.title("📂 Upload and Load JSON Data")
-st.write("Use this page to upload a JSON file and load it into the database.")
-
-# Initialize database connection
-db_handler = Database()
+st.write("Use this page to upload a JSON, NDJSON or CSV file (optionally gzip/zstd compressed) and load it into the database.")
 
 # File uploader
-uploaded_file = st.file_uploader("🔼 Upload a JSON file", type=["json"], help="Only JSON files are supported.")
+uploaded_file = st.file_uploader(
+    "🔼 Upload a data file",
+    type=SUPPORTED_UPLOAD_TYPES,
+    help="JSON arrays, NDJSON and CSV are supported, plain or gzip/zstd compressed.",
+)
 
 # Display instructions if no file is uploaded
 if not uploaded_file:
-    st.info("Please upload a valid JSON file to continue.")
+    st.info("Please upload a valid data file to continue.")
 else:
     # File uploaded message
     st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
 
+    # An interrupted load of the same file continues after its last committed chunk
+    resume = st.checkbox("⏯ Resume an interrupted load of this file", value=False)
+
     # Add a button to trigger data loading
     if st.button("🚀 Load Data into Database"):
         with st.spinner("📊 Processing file and loading data..."):
+            # Database and model imports are deferred until a load actually runs
+            from database import Database
+            from webapp.models import Sundae, Sale, Employee  # Import your model classes
+
+            # Initialize database connection
+            db_handler = Database()
             try:
-                # Parse the uploaded JSON file
+                # Save the uploaded file
                 file_path = f"/tmp/{uploaded_file.name}"
                 with open(file_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
@@ -36,7 +45,7 @@ else:
                 st.json({"File Name": uploaded_file.name, "Size (KB)": round(len(uploaded_file.getbuffer()) / 1024, 2)})
 
                 # Table name logic based on file name
-                table_name = Path(uploaded_file.name).stem.lower()
+                table_name = table_name_for(uploaded_file.name)
                 st.write(f"🛠 Detected Table Name: **{table_name}**")
 
                 # Dynamically determine the model class
@@ -55,7 +64,7 @@ else:
                 time.sleep(1)
 
                 # Load the JSON data into the database
-                db_handler.load_bulk_data(Path(file_path), model_class)
+                db_handler.load_bulk_data(Path(file_path), model_class, resume=resume)
 
                 # Success message with a balloon animation
                 st.success(f"🎉 Data loaded successfully into table **'{table_name}'**!")
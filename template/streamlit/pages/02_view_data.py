@@ -1,5 +1,6 @@
 import streamlit as st
-from api.database import get_db
+from api.database import get_read_db
+from webapp.backends import default_schema
 from sqlalchemy import text
 from contextlib import closing
 
@@ -10,7 +11,8 @@ st.title("🔍 View Loaded Data")
 def fetch_tables(db):
     try:
         result = db.execute(
-            text("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
+            text("SELECT table_name FROM information_schema.tables WHERE table_schema = :schema"),
+            {"schema": default_schema()},
         )
         return [row[0] for row in result]
     except Exception as e:
@@ -28,7 +30,7 @@ def fetch_table_data(table_name, db):
 
 # Fetch the list of tables
 st.info("Fetching available tables from the database...")
-with closing(next(get_db())) as db:  # Use next() to get the session
+with closing(next(get_read_db())) as db:  # Use next() to get the session
     tables = fetch_tables(db)
 
 # If tables are available
@@ -45,7 +47,7 @@ if tables:
     # Button to view the selected table data
     if st.button("📊 View Table Data"):
         with st.spinner(f"Loading data for table: **{selected_table}**..."):
-            with closing(next(get_db())) as db:  # Use next() to get the session
+            with closing(next(get_read_db())) as db:  # Use next() to get the session
                 data = fetch_table_data(selected_table, db)
                 
                 if data:
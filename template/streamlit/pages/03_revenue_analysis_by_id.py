@@ -1,6 +1,7 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import requests
+from charts import cached_chart  # Rendered chart cache shared across sessions
+from live import live_totals  # Per-sundae totals kept current by the API's live stream
+from webapp.config import settings
 
 # Streamlit Title
 st.title("Ice Cream Revenue Analysis 🍦")
@@ -13,12 +14,14 @@ st.image(
 )
 
 # API Base URL
-API_BASE_URL = "http://127.0.0.1:8000"  # Replace with your actual API URL if different
+API_BASE_URL = settings.API_BASE_URL  # Set API_BASE_URL if the API runs elsewhere
 
 def fetch_sundae_data(sundae_id):
     """
     Fetch revenue and volume data for a specific sundae_id from the API.
     """
+    import requests  # Deferred: only needed once a sundae is fetched
+
     try:
         response = requests.get(f"{API_BASE_URL}/sundaes/{sundae_id}")
         response.raise_for_status()  # Raise an error for bad responses
@@ -27,6 +30,40 @@ def fetch_sundae_data(sundae_id):
         st.error(f"Failed to fetch data for Sundae ID '{sundae_id}': {e}")
         return None
 
+def plot_revenue_and_volume(sundae_id, volume, revenue):
+    import matplotlib.pyplot as plt  # Deferred: only needed when a chart is rendered
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+
+    # Bar chart for revenue and volume
+    bars = ax.bar(["Volume", "Revenue"], [volume, revenue], color=["lightgreen", "skyblue"])
+    ax.bar_label(bars, fmt="%.2f", padding=3)
+
+    # Add labels and title
+    ax.set_ylabel("Values")
+    ax.set_title(f"Revenue and Volume for Sundae: {sundae_id}")
+    return fig
+
+def show_revenue_and_volume(sundae_id, volume, revenue):
+    # Visualization, rendered once per sundae and data version and then reused
+    st.write("### Revenue and Volume Chart")
+    st.image(
+        cached_chart(
+            "revenue_and_volume",
+            {"sundae_id": sundae_id},
+            [volume, revenue],
+            lambda: plot_revenue_and_volume(sundae_id, volume, revenue),
+        )
+    )
+
+@st.fragment(run_every=settings.LIVE_REFRESH_SECONDS)
+def show_live_revenue_and_volume(live, sundae_id):
+    """Redraws as the live stream adds this sundae's new sales; no request to the API."""
+    totals, _ = live.current()
+    volume, revenue = totals.get(sundae_id, [0, 0.0])
+    st.caption("🟢 Live totals")
+    show_revenue_and_volume(sundae_id, volume, round(revenue, 2))
+
 def main():
     # Dropdown for Sundae ID Selection
     st.subheader("Select a Sundae to Analyze")
@@ -36,30 +73,24 @@ def main():
     # Fetch Data Button
     if selected_sundae:
         if st.button("Fetch Data"):
-            # Fetch data for the selected sundae ID
-            data = fetch_sundae_data(selected_sundae)
+            # Fetch data for the selected sundae ID; kept so live updates survive reruns
+            st.session_state["sundae_data"] = fetch_sundae_data(selected_sundae)
 
-            if data:
-                # Display data in a neat table
-                st.write("### Sundae Details")
-                st.json(data)
+        data = st.session_state.get("sundae_data")
+        if data and data.get("id") == selected_sundae:
+            # Display data in a neat table
+            st.write("### Sundae Details")
+            st.json(data)
 
+            live = live_totals()
+            if live.wait(timeout=2):
+                # Volume and revenue follow the live stream instead of re-fetching /sundaes/{id}
+                show_live_revenue_and_volume(live, selected_sundae)
+            else:
                 # Extract volume and revenue
                 volume = data.get("volume", 0)
                 revenue = round(data.get("revenue", 0.0), 2)
-
-                # Visualization
-                st.write("### Revenue and Volume Chart")
-                fig, ax = plt.subplots(figsize=(6, 4))
-
-                # Bar chart for revenue and volume
-                bars = ax.bar(["Volume", "Revenue"], [volume, revenue], color=["lightgreen", "skyblue"])
-                ax.bar_label(bars, fmt="%.2f", padding=3)
-
-                # Add labels and title
-                ax.set_ylabel("Values")
-                ax.set_title(f"Revenue and Volume for Sundae: {selected_sundae}")
-                st.pyplot(fig)
+                show_revenue_and_volume(selected_sundae, volume, revenue)
 
 # Run the main function
 if __name__ == "__main__":
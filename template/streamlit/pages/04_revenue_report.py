@@ -1,17 +1,27 @@
-import pandas as pd
 import streamlit as st
-from api.database import engine  # Import your database engine
-import matplotlib.pyplot as plt
-import seaborn as sns
+from api.database import read_engine  # Replica-aware engine for read-only queries
+from webapp.sharding import get_shards
+from charts import cached_chart, data_version  # Rendered chart cache shared across sessions
+from live import live_totals  # Per-sundae totals kept current by the API's live stream
+from webapp.config import settings
+from webapp.downsample import range_query, sales_series
+from datetime import datetime, timezone
+from sqlalchemy import text
 
 st.title("Revenue Report 📊")
 
-def fetch_revenue_data():
+def fetch_revenue_data(engine):
+    import pandas as pd  # Deferred with the other heavy imports to keep page start-up fast
+
+    shards = get_shards()
+    if shards is not None:
+        return fetch_sharded_revenue_data(shards, engine)
+
     query = """
     SELECT 
         sundaes.id AS sundae_id,
         sundaes.name AS sundae_name,
-        COUNT(*) AS volume,
+        COUNT(sales.sundae_id) AS volume,
         COALESCE(SUM(sales.price), 0) AS revenue
     FROM sundaes
     LEFT JOIN sales ON sundaes.id = sales.sundae_id
@@ -21,56 +31,204 @@ def fetch_revenue_data():
     with engine.connect() as connection:
         return pd.read_sql(query, connection)
 
+def fetch_sharded_revenue_data(shards, engine):
+    import pandas as pd
+
+    # Sundaes come from the primary (or a replica); sales totals are gathered from every shard
+    with engine.connect() as connection:
+        sundaes = pd.read_sql("SELECT id AS sundae_id, name AS sundae_name FROM sundaes", connection)
+    totals = shards.sales_totals()
+    sundaes["volume"] = [totals.get(sundae_id, [0, 0.0])[0] for sundae_id in sundaes["sundae_id"]]
+    sundaes["revenue"] = [totals.get(sundae_id, [0, 0.0])[1] for sundae_id in sundaes["sundae_id"]]
+    return sundaes.sort_values("revenue", ascending=False, ignore_index=True)
+
+@st.cache_data(max_entries=16)
+def fetch_revenue_data_at(version, _engine):
+    """``fetch_revenue_data()`` at one data version: the aggregate runs again only after a load bumps it."""
+    return fetch_revenue_data(_engine)
+
+def revenue_data(version, engine):
+    return fetch_revenue_data(engine) if version is None else fetch_revenue_data_at(version, engine)
+
+@st.cache_data(ttl=300)
+def fetch_sundae_names(_engine):
+    """{sundae_id: name}; sundaes change rarely, so the names are cached for a few minutes."""
+    with _engine.connect() as connection:
+        return dict(connection.execute(text("SELECT id, name FROM sundaes")).fetchall())
+
+def live_revenue_data(totals, engine):
+    """The revenue table built from the live totals, without querying sales."""
+    import pandas as pd
+
+    names = fetch_sundae_names(engine)
+    rows = [
+        {"sundae_id": sundae_id, "sundae_name": name, "volume": totals.get(sundae_id, [0, 0.0])[0],
+         "revenue": totals.get(sundae_id, [0, 0.0])[1]}
+        for sundae_id, name in names.items()
+    ]
+    df = pd.DataFrame(rows, columns=["sundae_id", "sundae_name", "volume", "revenue"])
+    return df.sort_values("revenue", ascending=False, ignore_index=True)
+
+def plot_revenue(df):
+    # Matplotlib for customized visualization (imported only when a chart is rendered)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    
+    # Use seaborn for a better bar plot with distinct colors
+    sns.barplot(
+        x="sundae_name",
+        y="revenue",
+        data=df,
+        palette="coolwarm",
+        ax=ax,
+        label="Revenue",
+    )
+
+    # Add values above bars
+    for bar in ax.patches:
+        ax.annotate(
+            f"${bar.get_height():,.2f}",
+            (bar.get_x() + bar.get_width() / 2, bar.get_height()),
+            ha="center",
+            va="bottom",
+            fontsize=10,
+            color="black",
+        )
+
+    # Customization
+    ax.set_title("Revenue per Sundae", fontsize=16, weight="bold")
+    ax.set_xlabel("Sundae Name", fontsize=12)
+    ax.set_ylabel("Revenue ($)", fontsize=12)
+    ax.tick_params(axis="x", rotation=45)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    return fig
+
+def sales_runner(engine):
+    """``run(statement, params)`` over the sales: every shard when sharded, otherwise ``engine``."""
+    shards = get_shards()
+    if shards is not None:
+        return shards.gather
+
+    def run(statement, params):
+        with engine.connect() as connection:
+            return connection.execute(statement, params).fetchall()
+
+    return run
+
+def plot_sales_over_time(series, width):
+    import matplotlib.pyplot as plt
+
+    # Rendered at 150 dpi, so the figure is exactly ``width`` pixels wide: one bucket per pixel column
+    fig, ax = plt.subplots(figsize=(width / 150, 4))
+    points = series["points"]
+    times = [datetime.fromtimestamp(point[0], tz=timezone.utc) for point in points]
+    if series["mode"] == "minmax":
+        ax.fill_between(times, [p[1] for p in points], [p[2] for p in points], step="post", alpha=0.5, label="Price range")
+        revenue_ax = ax.twinx()
+        revenue_ax.plot(times, [p[4] for p in points], color="darkorange", linewidth=0.8, label="Revenue")
+        revenue_ax.set_ylabel("Revenue per bucket ($)", fontsize=12)
+    else:
+        ax.plot(times, [p[1] for p in points], linewidth=0.8, marker="." if len(points) < 200 else None)
+    ax.set_title("Sale Price Over Time", fontsize=16, weight="bold")
+    ax.set_ylabel("Price ($)", fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    fig.autofmt_xdate()
+    return fig
+
+def sales_extent(engine, sundae_id):
+    """(first, last) timestamp rows of the sales, per shard when sharded."""
+    return sales_runner(engine)(range_query(sundae_id), {"sundae_id": sundae_id} if sundae_id else {})
+
+@st.cache_data(max_entries=64)
+def sales_extent_at(version, _engine, sundae_id):
+    return sales_extent(_engine, sundae_id)
+
+@st.cache_data(max_entries=64)
+def sales_series_at(version, _engine, start, end, width, sundae_id):
+    return sales_series(sales_runner(_engine), start, end, width, sundae_id)
+
+def show_sales_over_time(sundae_ids, engine):
+    st.write("### Sales Over Time")
+    choice = st.selectbox("Sundae", ["All sundaes"] + list(sundae_ids))
+    sundae_id = None if choice == "All sundaes" else choice
+    # Until a load bumps the sales version, reruns reuse the range, the series and the chart without querying
+    version = data_version(engine, ["sales"])
+
+    extent = sales_extent(engine, sundae_id) if version is None else sales_extent_at(version, engine, sundae_id)
+    firsts = [row[0] for row in extent if row[0] is not None]
+    if not firsts:
+        st.info("No sales to plot.")
+        return
+    first, last = min(firsts), max(row[1] for row in extent if row[1] is not None)
+    last = max(last, first + 1)
+
+    # Chart width and zoom range decide how many points are fetched and drawn
+    width = st.slider("Chart width (px)", min_value=400, max_value=2000, value=1000, step=100)
+    start, end = st.slider(
+        "Time range",
+        min_value=datetime.fromtimestamp(first, tz=timezone.utc),
+        max_value=datetime.fromtimestamp(last, tz=timezone.utc),
+        value=(datetime.fromtimestamp(first, tz=timezone.utc), datetime.fromtimestamp(last, tz=timezone.utc)),
+    )
+    if version is None:
+        series = sales_series(sales_runner(engine), start.timestamp(), end.timestamp(), width, sundae_id)
+    else:
+        series = sales_series_at(version, engine, start.timestamp(), end.timestamp(), width, sundae_id)
+    st.caption(f"{series['rows']:,} sales in range → {len(series['points']):,} plotted points ({series['mode']})")
+    if series["points"]:
+        params = {"sundae_id": sundae_id, "start": start.timestamp(), "end": end.timestamp(), "width": width}
+        st.image(cached_chart("sales_over_time", params, version, lambda: plot_sales_over_time(series, width)))
+
+def show_revenue(df, version):
+    st.dataframe(df)
+
+    # Plot revenue data
+    st.write("### Revenue and Volume Comparison")
+
+    # The rendered chart is cached across reruns and viewers, keyed by the version of the data it shows
+    st.image(cached_chart("revenue_per_sundae", {}, version, lambda: plot_revenue(df)))
+
+    st.write("### Insights")
+    st.info(f"**Top Revenue Sundae:** {df.iloc[0]['sundae_name']} with ${df.iloc[0]['revenue']:.2f}")
+    st.info(f"**Total Revenue:** ${df['revenue'].sum():,.2f}")
+
+@st.fragment(run_every=settings.LIVE_REFRESH_SECONDS)
+def show_live_revenue(live):
+    """Redraws from the locally updated totals; only this fragment reruns, and it sends no queries."""
+    if not live.connected:
+        st.rerun()  # Stream lost: fall back to querying on a full rerun
+    totals, version = live.current()
+    st.caption(f"🟢 Live: {version} update(s) received")
+    df = live_revenue_data(totals, read_engine())
+    if df.empty:
+        st.warning("No revenue data available.")
+    else:
+        # Built from in-memory totals, so the plotted values themselves are the version
+        show_revenue(df, df[["sundae_name", "revenue"]].to_dict("records"))
+
 def main():
     try:
         st.write("### Revenue Analysis")
-        df = fetch_revenue_data()
+        # One engine per rerun: with several replicas, the versions and the data they key must come from the same one
+        engine = read_engine()
+        live = live_totals()
+        if live.wait(timeout=2):
+            # Totals come from the API's live stream, so loads show up without re-running the aggregate
+            show_live_revenue(live)
+            show_sales_over_time(fetch_sundae_names(engine), engine)
+            return
+
+        version = data_version(engine, ["sundaes", "sales"])
+        df = revenue_data(version, engine)
 
         if df.empty:
             st.warning("No revenue data available.")
         else:
-            st.dataframe(df)
-
-            # Plot revenue data
-            st.write("### Revenue and Volume Comparison")
-
-            # Matplotlib for customized visualization
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            # Use seaborn for a better bar plot with distinct colors
-            sns.barplot(
-                x="sundae_name",
-                y="revenue",
-                data=df,
-                palette="coolwarm",
-                ax=ax,
-                label="Revenue",
-            )
-
-            # Add values above bars
-            for bar in ax.patches:
-                ax.annotate(
-                    f"${bar.get_height():,.2f}",
-                    (bar.get_x() + bar.get_width() / 2, bar.get_height()),
-                    ha="center",
-                    va="bottom",
-                    fontsize=10,
-                    color="black",
-                )
-
-            # Customization
-            ax.set_title("Revenue per Sundae", fontsize=16, weight="bold")
-            ax.set_xlabel("Sundae Name", fontsize=12)
-            ax.set_ylabel("Revenue ($)", fontsize=12)
-            ax.tick_params(axis="x", rotation=45)
-            ax.grid(axis="y", linestyle="--", alpha=0.7)
-
-            # Render the chart
-            st.pyplot(fig)
-
-            st.write("### Insights")
-            st.info(f"**Top Revenue Sundae:** {df.iloc[0]['sundae_name']} with ${df.iloc[0]['revenue']:.2f}")
-            st.info(f"**Total Revenue:** ${df['revenue'].sum():,.2f}")
+            st.caption("Live updates unavailable; showing totals as of the last load.")
+            show_revenue(df, version)
+            show_sales_over_time(df["sundae_id"], engine)
 
     except Exception as e:
         st.error(f"Error fetching revenue data: {e}")
@@ -0,0 +1,60 @@
+"""
+Shared fixtures. The tests run against local SQLite and DuckDB files, so no database server
+is needed. PostgreSQL-only tests run when ``TEST_POSTGRES_URL`` points at a server.
+"""
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """A fresh SQLite database file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def make_sqlite_engine(tmp_path):
+    """Factory of independent SQLite databases, e.g. a primary and its replicas or shards."""
+    engines = []
+
+    def make(name):
+        engine = create_engine(f"sqlite:///{tmp_path / f'{name}.db'}")
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def duckdb_engine(tmp_path):
+    """A fresh embedded DuckDB file."""
+    pytest.importorskip("duckdb_engine")
+    engine = create_engine(f"duckdb:///{tmp_path / 'primary.duckdb'}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def postgres_engine():
+    """
+    A scratch schema on the PostgreSQL server in ``TEST_POSTGRES_URL``, dropped afterwards.
+    Tests of PostgreSQL-only features (partitions, LISTEN/NOTIFY) are skipped without it.
+    """
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    yield engine
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    engine.dispose()
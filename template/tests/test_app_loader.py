@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.config import settings as app_settings
+from app.utils import dynamic_loader
+from app.utils.loader import load_data
+from webapp.config import settings
+from webapp.models import Base, Sale, Sundae
+
+pytest.importorskip("duckdb_engine")
+
+RECORDS = 30
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"duckdb:///{tmp_path / 'app.duckdb'}")
+    monkeypatch.setattr(dynamic_loader, "get_engine", lambda: engine)
+    monkeypatch.setattr(app_settings, "LOAD_CHUNK_ROWS", 10)
+    monkeypatch.setattr(dynamic_loader, "BATCH_SIZE", 10)  # The schema sample ends before "color" appears
+    monkeypatch.setattr(settings, "DB_WRITE_MARKER", str(tmp_path / "last_write"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "toppings.ndjson"
+    with open(path, "w", encoding="utf-8") as source:
+        for i in range(RECORDS):
+            record = {"name": f"topping-{i}", "price": 0.5 + i}
+            if i >= 20:
+                record["color"] = "red"  # First seen in the last chunk
+            source.write(json.dumps(record) + "\n")
+    return path
+
+
+def test_load_json_data_to_table_loads_every_chunk_and_resumes_nothing(engine, data_file):
+    dynamic_loader.load_json_data_to_table(str(data_file), "toppings")
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id_pk, name, price, color FROM toppings ORDER BY id_pk")).fetchall()
+        checkpoint = connection.execute(text("SELECT record_index, rows_committed, complete FROM load_checkpoints")).one()
+    assert [row.name for row in rows] == [f"topping-{i}" for i in range(RECORDS)]
+    assert len({row.id_pk for row in rows}) == RECORDS
+    assert [row.color for row in rows].count("red") == 10
+    assert tuple(checkpoint) == (RECORDS, RECORDS, True)
+
+    dynamic_loader.load_json_data_to_table(str(data_file), "toppings", resume=True)  # Already complete
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM toppings")).scalar() == RECORDS
+
+
+def test_load_data_inserts_valid_sales_and_quarantines_the_rest(engine, tmp_path):
+    Base.metadata.create_all(engine, tables=[Sundae.__table__, Sale.__table__])
+    sundaes, sales = tmp_path / "sundaes.json", tmp_path / "sales.ndjson"
+    sundaes.write_text(json.dumps([{"id": "classic", "name": "The Classic", "description": "Vanilla", "rating": 5}]))
+    with open(sales, "w", encoding="utf-8") as source:
+        for i in range(RECORDS):
+            source.write(json.dumps({"sundae_id": "classic" if i % 10 else "unknown", "timestamp": i, "price": 4.5}) + "\n")
+
+    with Session(engine) as db:
+        load_data(db, str(sundaes), str(sales))
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id, name FROM sundaes")).fetchall() == [("classic", "The Classic")]
+        loaded = connection.execute(text("SELECT COUNT(DISTINCT sale_id_pk), SUM(price) FROM sales")).one()
+        quarantined = connection.execute(text("SELECT COUNT(*) FROM quarantined_records")).scalar()
+    assert tuple(loaded) == (27, 27 * 4.5)
+    assert quarantined == 3
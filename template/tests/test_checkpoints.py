@@ -0,0 +1,104 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from webapp import checkpoints, writer
+from webapp.checkpoints import Checkpointer, load_in_chunks
+from webapp.config import settings
+from webapp.data_versions import read_versions
+from webapp.models import Base, Sale, Sundae
+from webapp.sharding import SHARDED_MODELS
+
+pytest.importorskip("duckdb_engine")
+
+SALES = 230
+CHUNK = 50
+
+
+def detect_schema(model_class, records, load_size=None):
+    return set(model_class.__table__.columns.keys())
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_WRITE_MARKER", str(tmp_path / "last_write"))
+    monkeypatch.setattr(settings, "LOAD_CHUNK_ROWS", CHUNK)
+    monkeypatch.setattr(writer, "get_shards", lambda: None)
+    engine = create_engine(f"duckdb:///{tmp_path / 'primary.duckdb'}")
+    Base.metadata.create_all(engine, tables=[model.__mapper__.local_table for model in SHARDED_MODELS])
+    with engine.begin() as connection:
+        connection.execute(insert(Sundae.__table__), [{"id": "classic", "name": "Classic", "description": None}])
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sales_file(tmp_path):
+    path = tmp_path / "sales.ndjson"
+    with open(path, "w", encoding="utf-8") as source:
+        for i in range(SALES):
+            sale = {"sale_id_pk": str(uuid.UUID(int=i + 1)), "sundae_id": "classic",
+                    "timestamp": 1_700_000_000.0 + i, "price": 1.0 + i}
+            source.write(json.dumps(sale) + "\n")
+    return path
+
+
+def stored(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT COUNT(*), COUNT(DISTINCT sale_id_pk), SUM(price) FROM sales")).one()
+
+
+def sales_version(engine):
+    with engine.connect() as connection:
+        return read_versions(connection).get("sales", (0, 0.0))[0]
+
+
+def test_resume_after_a_failed_chunk_loads_every_row_once(database, sales_file, monkeypatch):
+    saver = Checkpointer.saver
+
+    def failing_saver(self, record_index):
+        checkpoint = saver(self, record_index)
+
+        def save(session, shard, rows):
+            if record_index == 3 * CHUNK:
+                raise RuntimeError("connection lost")  # Inside the chunk's transaction, after its rows
+            checkpoint(session, shard, rows)
+
+        return save
+
+    monkeypatch.setattr(Checkpointer, "saver", failing_saver)
+    with Session(database) as session, pytest.raises(RuntimeError):
+        load_in_chunks(session, Sale, sales_file, detect_schema)
+    assert stored(database)[0] == 2 * CHUNK  # The failed chunk rolled back with its checkpoint
+    assert sales_version(database) == 1  # The committed chunks are visible, so their version changed
+    monkeypatch.setattr(Checkpointer, "saver", saver)
+
+    chunks = []
+    commit_records = checkpoints.commit_records
+    monkeypatch.setattr(checkpoints, "commit_records",
+                        lambda session, model, chunk, **kwargs: chunks.append(len(chunk)) or commit_records(
+                            session, model, chunk, **kwargs))
+    with Session(database) as session:
+        assert load_in_chunks(session, Sale, sales_file, detect_schema, resume=True) == SALES
+
+    assert chunks == [CHUNK, CHUNK, SALES - 4 * CHUNK]  # Only what the first run did not commit
+    assert sales_version(database) == 2  # One bump for the whole resumed load, not one per chunk
+    assert stored(database) == (SALES, SALES, sum(1.0 + i for i in range(SALES)))
+    with database.connect() as connection:
+        # The rollups were maintained once per committed row as well
+        assert connection.execute(text("SELECT SUM(volume) FROM sales_rollups")).scalar() == SALES
+
+    chunks.clear()
+    with Session(database) as session:
+        assert load_in_chunks(session, Sale, sales_file, detect_schema, resume=True) == SALES
+    assert chunks == []  # A completed file is skipped
+
+
+def test_without_resume_the_checkpoints_are_cleared(database, sales_file):
+    with Session(database) as session:
+        load_in_chunks(session, Sale, sales_file, detect_schema)
+        checkpoint = Checkpointer(session, Sale.__tablename__, sales_file, resume=False)
+        assert (checkpoint.start, checkpoint.rows_committed, checkpoint.complete) == (0, 0, False)
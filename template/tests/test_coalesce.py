@@ -0,0 +1,95 @@
+import asyncio
+import inspect
+import threading
+
+import anyio.to_thread
+
+from webapp.coalesce import SingleFlight, coalesced
+
+
+def test_identical_calls_share_one_computation_and_one_worker_thread():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        release.wait(10)
+        return {"id": "classic"}
+
+    async def main():
+        callers = [asyncio.ensure_future(flight.do(("sundae", "classic"), compute)) for _ in range(20)]
+        await asyncio.sleep(0.1)
+        # The 19 waiters await on the event loop instead of each blocking a threadpool worker
+        assert anyio.to_thread.current_default_thread_limiter().borrowed_tokens == 1
+        release.set()
+        return await asyncio.gather(*callers)
+
+    assert asyncio.run(main()) == [{"id": "classic"}] * 20
+    assert runs == [1]
+    status = flight.status()
+    assert (status["executions"], status["coalesced"], status["max_waiters"], status["in_flight"]) == (1, 19, 19, 0)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(flight.do(("sundaes",), lambda: release.wait(10) and "menu"))
+        second = asyncio.ensure_future(flight.do(("sundaes",), lambda: "not run"))
+        await asyncio.sleep(0.05)
+        first.cancel()  # The leader's client went away
+        await asyncio.sleep(0.05)
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == "menu"
+
+
+def test_errors_reach_every_caller_and_the_next_call_runs_afresh():
+    flight = SingleFlight()
+    calls = []
+
+    @coalesced("sundae", flight)
+    def endpoint(id):
+        calls.append(id)
+        if len(calls) == 1:
+            threading.Event().wait(0.1)
+            raise LookupError(id)
+        return id
+
+    async def main():
+        outcomes = await asyncio.gather(endpoint("a"), endpoint("a"), endpoint("a"), return_exceptions=True)
+        assert [type(outcome) for outcome in outcomes] == [LookupError, LookupError, LookupError]
+        return await endpoint("a")
+
+    assert asyncio.run(main()) == "a"
+    assert flight.status()["errors"] == 1
+
+
+def test_the_decorated_endpoint_is_a_coroutine_with_the_same_signature():
+    def endpoint(id: str, limit: int = 5):
+        return id
+
+    wrapped = coalesced("sundae", SingleFlight())(endpoint)
+    assert inspect.iscoroutinefunction(wrapped)
+    assert inspect.signature(wrapped) == inspect.signature(endpoint)
+
+
+def test_a_flight_switched_off_by_its_flag_runs_every_call():
+    flight = SingleFlight(lambda: False)
+    calls = []
+
+    @coalesced("sundae", flight)
+    def endpoint(id):
+        calls.append(id)
+        threading.Event().wait(0.05)
+        return id
+
+    async def main():
+        return await asyncio.gather(endpoint("a"), endpoint("a"), endpoint("a"))
+
+    assert asyncio.run(main()) == ["a", "a", "a"]
+    assert len(calls) == 3
+    assert flight.status()["enabled"] is False and flight.status()["requests"] == 0
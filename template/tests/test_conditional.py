@@ -0,0 +1,69 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from api.conditional import ConditionalGet, VersionCache, validators
+from api.database import get_read_db
+from webapp.data_versions import bump_versions, read_versions
+from webapp.routing import ReplicaRouter
+
+TABLES = ("sundaes",)
+
+
+def bump(engine, times=1):
+    with engine.begin() as connection:
+        for _ in range(times):
+            bump_versions(connection, TABLES)
+    with engine.connect() as connection:
+        return read_versions(connection)
+
+
+def make_client(primary, router):
+    app = FastAPI()
+    app.add_middleware(ConditionalGet, cache=VersionCache(lambda: primary, ttl=60), router_factory=lambda: router)
+
+    @app.get("/sundaes")
+    def sundaes(db: Session = Depends(get_read_db)):
+        return {"engine": str(db.bind.url)}
+
+    return TestClient(app)
+
+
+def test_a_replica_read_carries_the_replica_validators(make_sqlite_engine, tmp_path):
+    primary = make_sqlite_engine("primary")
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    router = ReplicaRouter(primary, [replica_url], max_lag=10, health_interval=60,
+                           write_marker=str(tmp_path / "last_write"))
+    replica = router.replicas[0]
+    try:
+        lagging = bump(replica.engine)
+        bump(primary, times=2)  # The primary is ahead of the replica
+        router.check_replicas()
+        router.start()  # Checked already; no need to wait for the monitor
+
+        client = make_client(primary, router)
+        response = client.get("/sundaes")
+        assert response.json() == {"engine": replica_url}  # The pinned replica served the body
+        etag = validators(lagging, TABLES)[0]
+        assert response.headers["etag"] == etag
+
+        # The client's copy is current for the replica, so it is revalidated there
+        assert client.get("/sundaes", headers={"If-None-Match": etag}).status_code == 304
+
+        bump(replica.engine)  # Replication caught up; seen at the next health check
+        router.check_replicas()
+        response = client.get("/sundaes", headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+    finally:
+        router.stop()
+        replica.engine.dispose()
+
+
+def test_without_healthy_replicas_the_primary_serves_and_validates(make_sqlite_engine, tmp_path):
+    primary = make_sqlite_engine("primary")
+    router = ReplicaRouter(primary, [], write_marker=str(tmp_path / "last_write"))
+    versions = bump(primary)
+
+    response = make_client(primary, router).get("/sundaes")
+    assert response.json() == {"engine": str(primary.url)}
+    assert response.headers["etag"] == validators(versions, TABLES)[0]
@@ -0,0 +1,35 @@
+from sqlalchemy import text
+
+from webapp import downsample
+
+
+def make_sales(engine, timestamps):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE sales (sundae_id VARCHAR, timestamp DOUBLE, price DOUBLE)"))
+        connection.execute(
+            text("INSERT INTO sales VALUES ('classic', :timestamp, 1.0)"),
+            [{"timestamp": ts} for ts in timestamps],
+        )
+
+
+def runner(engine):
+    def run(statement, params):
+        with engine.connect() as connection:
+            return connection.execute(statement, params).fetchall()
+
+    return run
+
+
+def test_minmax_buckets_stay_within_the_chart_width(duckdb_engine, monkeypatch):
+    monkeypatch.setattr(downsample, "LTTB_ROW_LIMIT", 0)  # Force the in-database aggregation
+    width = 10
+    make_sales(duckdb_engine, [0, 5, 50, 99.5, 100])  # The last sale falls exactly on the range's end
+
+    series = downsample.sales_series(runner(duckdb_engine), 0, 100, width)
+
+    assert series["mode"] == "minmax"
+    assert series["rows"] == 5
+    assert len(series["points"]) <= width
+    assert series["points"][-1][0] == 90  # Start of the last pixel column, not one past it
+    assert series["points"][-1][3] == 2  # 99.5 and 100 share it
+    assert sum(point[3] for point in series["points"]) == 5
@@ -0,0 +1,118 @@
+import fcntl
+import json
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from api import ingest
+from api.ingest import SaleBatcher, _segments
+from webapp.config import settings
+from webapp.sharding import SHARDED_MODELS
+from webapp.models import Base, Sundae
+
+pytest.importorskip("duckdb_engine")
+
+
+def make_sales(count, start=0):
+    return [
+        {"sale_id_pk": uuid.UUID(int=i + 1), "sundae_id": "classic", "timestamp": 1_700_000_000.0 + i, "price": 4.5}
+        for i in range(start, start + count)
+    ]
+
+
+def write_segment(path, sales, torn=False):
+    with open(path, "w", encoding="utf-8") as segment:
+        segment.writelines(ingest._encode(sale) for sale in sales)
+        if torn:
+            segment.write(json.dumps({"sale_id_pk": str(uuid.uuid4())})[:20])  # Crash mid-write
+
+
+def stored(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT COUNT(*) FROM sales")).scalar()
+
+
+def wait_for(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_WRITE_MARKER", str(tmp_path / "last_write"))
+    monkeypatch.setattr(ingest, "get_shards", lambda: None)
+    engine = create_engine(f"duckdb:///{tmp_path / 'primary.duckdb'}")
+    Base.metadata.create_all(engine, tables=[model.__mapper__.local_table for model in SHARDED_MODELS])
+    with engine.begin() as connection:
+        connection.execute(insert(Sundae.__table__), [{"id": "classic", "name": "Classic", "description": None}])
+    yield engine
+    engine.dispose()
+
+
+def test_segments_rotate_during_an_outage_and_are_deleted_once_flushed(database, tmp_path):
+    available = threading.Event()
+
+    def session_factory():
+        if not available.is_set():
+            raise OperationalError("connect", {}, Exception("database is down"))
+        return Session(database)
+
+    spill = tmp_path / "spill"
+    batcher = SaleBatcher(session_factory, max_batch=50, max_delay=0.01, spill_path=str(spill), segment_bytes=2000)
+    batcher.start()
+    for sale in make_sales(200):
+        batcher.submit(sale)
+    assert len(_segments(spill)) > 3  # The backlog is spread over rotated segments
+
+    available.set()
+    wait_for(lambda: batcher.status()["pending"] == 0)
+    assert stored(database) == 200
+    assert len(_segments(spill)) == 1  # Only the active segment, emptied
+    assert (spill.parent / f"{_segments(spill)[0].name}").stat().st_size == 0
+
+    batcher.stop()
+    assert _segments(spill) == []
+
+
+def test_replays_own_and_orphaned_segments_in_bounded_batches(database, tmp_path):
+    spill = tmp_path / "spill"
+    sales = make_sales(60)
+    write_segment(f"{spill}.seg-00000003", sales[:5])  # This slot's last run
+    write_segment(f"{spill}.2.seg-00000001", sales[:45], torn=True)  # A crashed worker's, overlapping
+    write_segment(f"{spill}.3.seg-00000001", sales[45:])  # A running worker's: left alone
+    running = open(f"{spill}.3.lock", "a")
+    fcntl.flock(running.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    batches = []
+    batcher = SaleBatcher(lambda: Session(database), max_batch=10, max_pending=5, max_delay=0.01,
+                          spill_path=str(spill))
+    flush = batcher._flush
+    batcher._flush = lambda batch: batches.append(len(batch)) or flush(batch)
+    try:
+        batcher.start()
+        wait_for(lambda: batcher.status()["replaying"] == 0)
+
+        assert max(batches) <= 10
+        assert batcher.stats["recovered"] == 50  # Both segments, without the torn line
+        assert stored(database) == 45  # Replays are idempotent
+        assert _segments(f"{spill}.2") == []
+        assert len(_segments(f"{spill}.3")) == 1
+        assert _segments(spill)[-1].name == "spill.seg-00000004"  # New sales go after the replayed segment
+
+        # The adopted slot is released once replayed
+        lock = ingest._lock_slot(f"{spill}.2")
+        assert lock is not None
+        lock.close()
+
+        batcher.submit(sales[59])
+        wait_for(lambda: stored(database) == 46)
+    finally:
+        batcher.stop()
+        running.close()
@@ -0,0 +1,106 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from webapp.models import Base, Sale, SalesRollup, SalesSketch, Sundae
+from webapp.partitions import ensure_partitions, partition_bounds, retire_partitions
+from webapp.rollups import maintain_rollups, rebuild_rollups
+from webapp.sketches import maintain_sketches, rebuild_sketches
+
+DAY = 86400
+JANUARY, FEBRUARY = partition_bounds(2024, 1), partition_bounds(2024, 2)
+
+
+def sales(start, count, sundae_id="classic", price=4.0):
+    return [
+        {"sale_id_pk": uuid.uuid4(), "sundae_id": sundae_id, "timestamp": start + i * 3 * 3600.0, "price": price}
+        for i in range(count)
+    ]
+
+
+def load(session, rows):
+    """Insert ``rows`` into sales and maintain the aggregates, as the loaders do."""
+    session.execute(insert(Sale.__table__), rows)
+    maintain_rollups(session, Sale, rows)
+    maintain_sketches(session, Sale, rows)
+
+
+def aggregates(session):
+    rollups = session.execute(select(func.sum(SalesRollup.volume), func.min(SalesRollup.bucket_start))).one()
+    sketches = session.execute(select(func.count(), func.min(SalesSketch.bucket_start))).one()
+    return tuple(rollups), tuple(sketches)
+
+
+def test_range_rebuild_only_recounts_overlapping_buckets(duckdb_engine):
+    Base.metadata.create_all(
+        duckdb_engine, tables=[Sundae.__table__, Sale.__table__, SalesRollup.__table__, SalesSketch.__table__]
+    )
+    january, february = sales(JANUARY[0], 100), sales(FEBRUARY[0], 50)
+    with Session(duckdb_engine) as session:
+        session.execute(insert(Sundae.__table__), [{"id": "classic", "name": "The Classic"}])
+        load(session, january + february)
+        session.commit()
+
+        # The January sales go away (as a detached partition would); its buckets must follow
+        session.execute(text("DELETE FROM sales WHERE timestamp < :end"), {"end": JANUARY[1]})
+        rebuild_rollups(session, *JANUARY)
+        rebuild_sketches(session, start=JANUARY[0], end=JANUARY[1])
+        session.commit()
+
+        (volume, first_rollup), (sketch_rows, first_sketch) = aggregates(session)
+        assert volume == 50 and first_rollup == FEBRUARY[0]
+        assert first_sketch == FEBRUARY[0]
+        assert sketch_rows == len({FEBRUARY[0] + (row["timestamp"] - FEBRUARY[0]) // DAY * DAY for row in february})
+
+
+def test_range_rebuild_keeps_sales_outside_the_range_in_shared_buckets(duckdb_engine, monkeypatch):
+    from webapp.config import settings
+
+    monkeypatch.setattr(settings, "SKETCH_BUCKET_SECONDS", 5 * DAY)  # A bucket straddles February 1st
+    Base.metadata.create_all(
+        duckdb_engine, tables=[Sundae.__table__, Sale.__table__, SalesRollup.__table__, SalesSketch.__table__]
+    )
+    with Session(duckdb_engine) as session:
+        session.execute(insert(Sundae.__table__), [{"id": "classic", "name": "The Classic"}])
+        load(session, sales(FEBRUARY[0] - 2 * DAY, 32))  # two days in January, two in February
+        session.execute(text("DELETE FROM sales WHERE timestamp < :end"), {"end": JANUARY[1]})
+        rebuild_sketches(session, start=JANUARY[0], end=JANUARY[1])
+        rows = session.execute(select(SalesSketch.price_sketch)).scalars().all()
+        assert session.execute(select(func.min(SalesSketch.bucket_start))).scalar() < JANUARY[1]
+        assert sum(sketch["n"] for sketch in rows) == session.execute(select(func.count()).select_from(Sale)).scalar()
+
+
+def test_retire_partitions_removes_rollups_and_sketches(postgres_engine):
+    with postgres_engine.begin() as connection:
+        Base.metadata.create_all(connection, tables=[Sundae.__table__, SalesRollup.__table__, SalesSketch.__table__])
+        connection.execute(
+            text(
+                """
+                CREATE TABLE sales (
+                    sale_id_pk UUID NOT NULL, sundae_id VARCHAR NOT NULL REFERENCES sundaes (id),
+                    timestamp FLOAT NOT NULL, price FLOAT NOT NULL, PRIMARY KEY (sale_id_pk, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+                """
+            )
+        )
+    with Session(postgres_engine) as session:
+        session.execute(insert(Sundae.__table__), [{"id": "classic", "name": "The Classic"}])
+        ensure_partitions(session, {(2024, 1), (2024, 2)}, months_ahead=0)
+        load(session, sales(JANUARY[0], 100) + sales(FEBRUARY[0], 50))
+        session.commit()
+
+        now = datetime(2024, 2, 15, tzinfo=timezone.utc).timestamp()
+        assert retire_partitions(session, keep_months=1, drop=True, now=now) == ["sales_y2024m01"]
+        session.commit()
+
+        (volume, first_rollup), (_, first_sketch) = aggregates(session)
+        assert volume == session.execute(select(func.count()).select_from(Sale)).scalar() == 50
+        assert first_rollup == first_sketch == FEBRUARY[0]
+
+
+def test_retire_partitions_always_keeps_the_current_month():
+    with pytest.raises(ValueError):
+        retire_partitions(None, keep_months=0)
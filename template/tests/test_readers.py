@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from webapp import readers
+from webapp.readers import iter_json_array
+
+
+class CountingStream(io.StringIO):
+    """Text stream recording how many characters the reader pulled."""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.pulled = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.pulled += len(chunk)
+        return chunk
+
+
+def test_decodes_records_across_chunk_boundaries(monkeypatch):
+    monkeypatch.setattr(readers, "CHUNK_SIZE", 7)
+    records = [{"id": i, "price": i + 0.25, "name": "sundae é" * (i % 3)} for i in range(50)]
+    assert list(iter_json_array(io.StringIO(json.dumps(records)))) == records
+
+
+def test_malformed_record_fails_fast_with_byte_offset(monkeypatch):
+    monkeypatch.setattr(readers, "CHUNK_SIZE", 256)
+    good = json.dumps({"id": "é", "price": 1.5})
+    bad = '{"id": "x", "price": 1.5 "extra": true}'
+    text = "[" + good + ", " + bad + ", " + ", ".join([good] * 5000) + "]"
+    stream = CountingStream(text)
+
+    decoded = iter_json_array(stream)
+    assert next(decoded) == {"id": "é", "price": 1.5}
+    with pytest.raises(ValueError) as error:
+        next(decoded)
+
+    start = len(("[" + good + ", ").encode("utf-8"))
+    assert f"starting at byte {start}" in str(error.value)
+    assert stream.pulled < 4 * 256  # the rest of the file was not buffered
+
+
+def test_truncated_file_is_reported():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"id": 1}, {"id": 2')))
+
+
+def test_long_strings_spanning_chunks_are_not_mistaken_for_errors(monkeypatch):
+    monkeypatch.setattr(readers, "CHUNK_SIZE", 16)
+    records = [{"description": "x" * 500, "n": 12345.678}, {"description": "y", "n": -1e-5}]
+    assert list(iter_json_array(io.StringIO(json.dumps(records)))) == records
+
+
+def test_fingerprint_changes_with_a_same_size_edit_in_the_middle(tmp_path):
+    path = tmp_path / "sales.ndjson"
+    content = bytearray(b"x" * (3 * readers.FINGERPRINT_BLOCK))
+    path.write_bytes(content)
+    before = readers.file_fingerprint(path)
+    assert readers.file_fingerprint(path) == before
+
+    content[len(content) // 2] = ord("y")  # Outside the first and last block
+    path.write_bytes(content)
+    assert readers.file_fingerprint(path) != before
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from webapp.routing import ReplicaRouter, connect_args, mark_write
+
+DOWN = "sqlite:////nonexistent-directory/replica.db"  # connect() fails
+
+
+@pytest.fixture
+def router_factory(sqlite_engine, tmp_path):
+    routers = []
+
+    def make(replica_urls, **kwargs):
+        kwargs.setdefault("health_interval", 60)
+        router = ReplicaRouter(
+            sqlite_engine, replica_urls, max_lag=10, write_marker=str(tmp_path / "last_write"), **kwargs
+        )
+        routers.append(router)
+        return router
+
+    yield make
+    for router in routers:
+        router.stop()
+        for replica in router.replicas:
+            replica.engine.dispose()
+
+
+def replica_urls(tmp_path, *names):
+    return [f"sqlite:///{tmp_path / f'{name}.db'}" for name in names]
+
+
+def test_reads_go_to_the_primary_without_replicas(router_factory, sqlite_engine):
+    assert router_factory([]).read_engine() is sqlite_engine
+
+
+def test_unhealthy_replicas_fall_back_to_the_primary(router_factory, sqlite_engine):
+    router = router_factory([DOWN])
+    router.check_replicas()
+    assert router.read_engine() is sqlite_engine
+    assert router.status()[0]["healthy"] is False and router.status()[0]["error"]
+
+
+def test_reads_rotate_over_healthy_replicas_only(router_factory, tmp_path):
+    router = router_factory(replica_urls(tmp_path, "a", "b") + [DOWN])
+    router.check_replicas()
+    engines = {router.read_engine() for _ in range(6)}
+    assert engines == {router.replicas[0].engine, router.replicas[1].engine}
+    with engines.pop().connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_read_your_writes_window_pins_reads_to_the_primary(router_factory, sqlite_engine, tmp_path):
+    router = router_factory(replica_urls(tmp_path, "a"), read_your_writes=0.3)
+    router.check_replicas()
+    assert router.read_engine() is router.replicas[0].engine
+
+    mark_write(router.write_marker)
+    assert router.read_engine() is sqlite_engine
+    time.sleep(0.4)
+    assert router.read_engine() is router.replicas[0].engine
+
+
+def test_health_checks_run_off_the_request_path(router_factory, tmp_path, monkeypatch):
+    router = router_factory(replica_urls(tmp_path, "a"), health_interval=0.05)
+    release = threading.Event()
+    checks = []
+
+    def slow_check(replica, max_lag):
+        checks.append(time.monotonic())
+        release.wait(5)  # A replica that takes long to answer
+        replica.healthy = True
+
+    monkeypatch.setattr(type(router.replicas[0]), "check", slow_check)
+    start = time.monotonic()
+    assert router.read_engine() is router.primary  # Not checked yet: the primary serves the read
+    assert time.monotonic() - start < 0.5
+    release.set()
+    deadline = time.monotonic() + 5
+    while router.read_engine() is router.primary and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert router.read_engine() is router.replicas[0].engine
+    assert checks
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("postgresql+psycopg2://u@h/db", {"connect_timeout": 2}),
+        ("postgresql+pg8000://u@h/db", {"timeout": 2}),
+        ("sqlite:///replica.db", {}),
+        ("duckdb:///replica.duckdb", {}),
+    ],
+)
+def test_connect_timeout_depends_on_the_driver(url, expected):
+    assert connect_args(url) == expected
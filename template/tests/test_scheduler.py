@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from webapp.scheduler import critical_path, run_graph
+
+# sales references sundaes and employees; shifts references employees
+GRAPH = {"sundaes": set(), "employees": set(), "sales": {"sundaes", "employees"}, "shifts": {"employees"}}
+
+
+def test_tasks_start_after_their_dependencies_and_independent_ones_overlap():
+    running, overlapped, lock = set(), [], threading.Lock()
+
+    def task(name):
+        def run():
+            with lock:
+                assert GRAPH[name].isdisjoint(running)
+                running.add(name)
+                overlapped.append(len(running) > 1)
+            time.sleep(0.05)
+            with lock:
+                running.discard(name)
+        return run
+
+    timings = run_graph({name: task(name) for name in GRAPH}, GRAPH, max_workers=4)
+
+    for name, dependencies in GRAPH.items():
+        assert all(timings[dependency][1] <= timings[name][0] for dependency in dependencies)
+    assert any(overlapped)  # sundaes and employees load at the same time
+
+
+def test_a_failure_stops_the_dependent_tasks_and_is_raised():
+    ran = []
+
+    def fail():
+        raise RuntimeError("bad file")
+
+    tasks = {name: (lambda name=name: ran.append(name)) for name in GRAPH}
+    tasks["employees"] = fail
+    with pytest.raises(RuntimeError, match="bad file"):
+        run_graph(tasks, GRAPH, max_workers=1)
+    assert "sales" not in ran and "shifts" not in ran
+
+
+def test_a_dependency_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        run_graph({"a": lambda: None, "b": lambda: None}, {"a": {"b"}, "b": {"a"}}, max_workers=2)
+
+
+def test_the_critical_path_is_the_longest_dependent_chain():
+    timings = {"sundaes": (0.0, 1.0), "employees": (0.0, 3.0), "sales": (3.0, 5.0), "shifts": (3.0, 3.5)}
+    assert critical_path(timings, GRAPH) == (["employees", "sales"], 5.0)
+    assert critical_path({}, GRAPH) == ([], 0.0)
@@ -0,0 +1,31 @@
+import json
+
+from sqlalchemy import text
+
+from webapp.backends import column_types
+from webapp.schema_policy import evolve_schema, infer_column_type, split_extras
+
+
+def test_column_types_are_inferred_from_sample_values():
+    assert [infer_column_type(value) for value in (3, 4.5, "red")] == ["INTEGER", "DOUBLE PRECISION", "TEXT"]
+
+
+def test_a_float_key_is_promoted_from_extras_once_dense(postgres_engine):
+    with postgres_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE sundaes (id text PRIMARY KEY)"))
+        # Rare at first: rating stays in extras
+        first = [{"id": f"s{i}", **({"rating": 4.5} if i == 0 else {})} for i in range(10)]
+        columns = evolve_schema(connection, "sundaes", first, threshold=0.5)
+        assert "rating" not in columns
+        connection.execute(
+            text("INSERT INTO sundaes (id, extras) VALUES (:id, CAST(:extras AS jsonb))"),
+            [{"id": row["id"], "extras": json.dumps(row.get("extras"))} for row in split_extras(first, columns)],
+        )
+
+        # Now every incoming record has it: the column is added and the stored values move out of extras
+        columns = evolve_schema(connection, "sundaes", [{"id": f"t{i}", "rating": 3.25} for i in range(20)],
+                                threshold=0.5)
+
+        assert "rating" in columns
+        assert str(column_types(connection, "sundaes")["rating"]) == "DOUBLE PRECISION"
+        assert connection.execute(text("SELECT rating, extras FROM sundaes WHERE id = 's0'")).one() == (4.5, {})
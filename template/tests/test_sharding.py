@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from api import queries
+from api.api import sharded_leaderboard
+from webapp.config import settings
+from webapp.models import Base, Sale, Sundae
+from webapp.rollups import window_buckets
+from webapp.sharding import SHARDED_MODELS, ShardSet, compare_totals, single_node_totals
+from webapp.sketches import kll_rank_error, summarize
+from webapp import sharding, writer
+
+pytest.importorskip("duckdb_engine")
+
+DAY = 86400
+START = 1_735_000_000 // DAY * DAY
+SUNDAES = [{"id": f"sundae-{i}", "name": f"Sundae {i}", "description": None} for i in range(8)]
+
+
+def synthetic_sales(count=1500, seed=11):
+    rng = random.Random(seed)
+    return [
+        {
+            "sale_id_pk": uuid.UUID(int=rng.getrandbits(128)),
+            "sundae_id": rng.choice(SUNDAES)["id"],
+            "timestamp": START + rng.random() * 10 * DAY,
+            "price": round(rng.lognormvariate(1.8, 0.4), 2),
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture(scope="module", params=["sundae_id", "sale_id_pk"])
+def loaded(request, tmp_path_factory):
+    """The same sales in a single DuckDB database and hash-sharded over three, loaded through commit_records."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        yield from _load(request.param, tmp_path_factory.mktemp("shards"), monkeypatch)
+
+
+def _load(key, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_WRITE_MARKER", str(tmp_path / "last_write"))
+    sales = synthetic_sales()
+    tables = [model.__mapper__.local_table for model in SHARDED_MODELS]
+
+    single = create_engine(f"duckdb:///{tmp_path / 'single.duckdb'}")
+    Base.metadata.create_all(single, tables=tables)
+    with Session(single) as session:
+        session.execute(insert(Sundae.__table__), SUNDAES)
+        writer.write_records(session, Sale, sales)
+        session.commit()
+
+    primary = create_engine(f"duckdb:///{tmp_path / 'primary.duckdb'}")
+    Base.metadata.create_all(primary, tables=tables)
+    shards = ShardSet([f"duckdb:///{tmp_path / f'shard-{i}.duckdb'}" for i in range(3)], key=key)
+    schema_calls = []
+    for name in ("create_schema", "sync_columns"):
+        method = getattr(shards, name)
+        monkeypatch.setattr(shards, name, lambda *args, _method=method, _name=name, **kwargs: (
+            schema_calls.append(_name), _method(*args, **kwargs))[1])
+    monkeypatch.setattr(writer, "get_shards", lambda: shards)
+    with Session(primary) as session:
+        writer.commit_records(session, Sundae, SUNDAES)
+        for start in range(0, len(sales), 300):
+            writer.commit_records(session, Sale, sales[start:start + 300])
+
+    yield single, shards, sales, schema_calls
+    shards.close()
+    single.dispose()
+    primary.dispose()
+
+
+def test_schema_work_runs_once_per_load(loaded):
+    _, shards, _, schema_calls = loaded
+    # Tables once, columns once per table, not once per batch of the five sales batches
+    assert schema_calls.count("create_schema") == 1
+    assert schema_calls.count("sync_columns") == 2
+
+
+def test_sales_totals_match_single_node(loaded):
+    single, shards, _, _ = loaded
+    expected = single_node_totals(single)
+    assert compare_totals(expected, shards.sales_totals()) == []
+    for sundae_id, totals in expected.items():
+        assert compare_totals({sundae_id: totals}, shards.sales_totals(sundae_id=sundae_id)) == []
+    assert sum(volume for volume, _ in expected.values()) == 1500
+
+
+@pytest.mark.parametrize("metric", ["revenue", "volume"])
+def test_leaderboard_matches_single_node(loaded, metric):
+    single, shards, _, _ = loaded
+    first_bucket, last_bucket = window_buckets(START + 7 * DAY, 3 * DAY)
+    params = {"first_bucket": first_bucket, "last_bucket": last_bucket, "n": 5}
+    with Session(single) as db:
+        expected = queries.run(db, f"leaderboard_{metric}", params).fetchall()
+        actual = sharded_leaderboard(shards, db, metric, first_bucket, last_bucket, 5)
+
+    def rows(leaders):
+        return [(row.sundae_id, row.sundae_name, int(row.volume), round(float(row.revenue), 6)) for row in leaders]
+
+    assert rows(actual) == rows(expected)
+
+
+def test_distribution_merges_match_single_node(loaded):
+    single, shards, sales, _ = loaded
+    # Window ends are inclusive of their bucket: 11 daily buckets cover the 10 days of sales
+    first_bucket, last_bucket = window_buckets(START + 10 * DAY, 11 * DAY, settings.SKETCH_BUCKET_SECONDS)
+    fractions = (0.5, 0.95)
+    for sundae in SUNDAES:
+        params = {"id": sundae["id"], "first_bucket": first_bucket, "last_bucket": last_bucket}
+        with single.connect() as connection:
+            expected = summarize(connection.execute(queries.SUNDAE_SKETCHES.statement, params).fetchall(), fractions)
+        merged = shards.gather(queries.SUNDAE_SKETCHES.statement, params, shards.sundae_shards(sundae["id"]))
+        actual = summarize(merged, fractions)
+
+        prices = sorted(sale["price"] for sale in sales if sale["sundae_id"] == sundae["id"])
+        assert actual["sales"] == expected["sales"] == len(prices)
+        assert (actual["price"]["min"], actual["price"]["max"]) == (prices[0], prices[-1])
+        # Both answers are within the sketch's rank error of the exact quantiles
+        error = kll_rank_error(200) + 1 / len(prices)
+        for fraction in fractions:
+            for summary in (expected, actual):
+                value = summary["price"]["quantiles"][f"p{fraction * 100:g}"]
+                rank = sum(price <= value for price in prices) / len(prices)
+                assert abs(rank - fraction) <= error
+
+
+def test_concurrent_first_calls_build_one_shard_set(tmp_path, monkeypatch):
+    built = []
+
+    class SlowShardSet(ShardSet):
+        def __init__(self, urls):
+            time.sleep(0.05)  # Widens the window in which a second caller would build its own set
+            super().__init__(urls)
+            built.append(self)
+
+    monkeypatch.setattr(sharding, "ShardSet", SlowShardSet)
+    monkeypatch.setattr(sharding, "_shards", None)
+    monkeypatch.setattr(settings, "SALES_SHARD_URLS", [f"duckdb:///{tmp_path / f'shard{i}.duckdb'}" for i in range(2)])
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sharding.get_shards())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and all(result is built[0] for result in results)
+    for engine in built[0].engines:
+        engine.dispose()
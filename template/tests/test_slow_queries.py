@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+from webapp.config import settings
+from webapp.slow_queries import EXPLAIN_STATEMENT, SlowQueryLog, admin_token_valid
+
+POSTGRES = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+
+class PreparedCursor:
+    """DBAPI cursor whose connection holds the given prepared statements."""
+
+    def __init__(self, prepared):
+        self.connection = self
+        self.prepared = prepared
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, parameters):
+        self.row = (self.prepared[parameters[0]],) if parameters[0] in self.prepared else None
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def explained(monkeypatch):
+    log = SlowQueryLog(threshold_ms=0, keep=5, explain_rate=1.0)
+    submitted = []
+    monkeypatch.setattr(log, "_explainer", SimpleNamespace(submit=lambda *args: submitted.append(args[3:])))
+    return log, submitted
+
+
+def test_executes_of_prepared_reads_are_explained_through_a_copy(explained):
+    log, submitted = explained
+    cursor = PreparedCursor({"sundae_by_id": "PREPARE sundae_by_id (text) AS SELECT * FROM sundaes WHERE id = $1"})
+    log.record(POSTGRES, "primary", "EXECUTE sundae_by_id(%(id)s)", {"id": "classic"}, 300, cursor=cursor)
+
+    assert submitted == [(
+        f"EXECUTE {EXPLAIN_STATEMENT}(%(id)s)",
+        {"id": "classic"},
+        f"PREPARE {EXPLAIN_STATEMENT} (text) AS SELECT * FROM sundaes WHERE id = $1",
+    )]
+
+
+@pytest.mark.parametrize("prepared", [
+    {"touch": "PREPARE touch (text) AS UPDATE sundaes SET name = $1"},
+    {},  # Not prepared on this connection
+])
+def test_executes_that_may_write_or_are_unknown_are_not_explained(explained, prepared):
+    log, submitted = explained
+    log.record(POSTGRES, "primary", "EXECUTE touch(%(name)s)", {"name": "x"}, 300, cursor=PreparedCursor(prepared))
+    assert submitted == [] and log.captured == 1
+
+
+def test_the_admin_token_is_required_and_unset_closes_the_endpoints(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_ADMIN_TOKEN", "")
+    assert not admin_token_valid("") and not admin_token_valid(None)
+    monkeypatch.setattr(settings, "SLOW_QUERY_ADMIN_TOKEN", "s3cret")
+    assert admin_token_valid("s3cret")
+    assert not admin_token_valid("wrong") and not admin_token_valid(None)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+TEMPLATE = Path(__file__).resolve().parent.parent
+
+pytest.importorskip("httpx")  # fastapi.testclient
+
+# Runs in a fresh interpreter: whatever an earlier test imported or created must not count
+STARTUP = """
+import api.database as database
+from fastapi.testclient import TestClient
+from api.api import app, data_versions, delta_hub
+
+with TestClient(app) as client:
+    assert database._engine is None, "the lifespan created the engine"
+    assert not delta_hub._started and not data_versions._started
+    client.get("/sundaes")
+    assert database._engine is not None
+    assert data_versions._started, "the first conditional GET starts the version listener"
+    assert not delta_hub._started, "the delta listener waits for a /sales/stream subscriber"
+assert database._engine is None, "shutdown disposes the engines"
+print("ok")
+"""
+
+
+def test_lifespan_creates_no_engine_until_a_request_needs_one(tmp_path):
+    pytest.importorskip("duckdb_engine")
+    env = dict(
+        os.environ,
+        DB_BACKEND="duckdb",
+        DUCKDB_PATH=str(tmp_path / "startup.duckdb"),
+        INGEST_SPILL_PATH=str(tmp_path / "spill.ndjson"),
+        DB_WRITE_MARKER=str(tmp_path / "last_write"),
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP], cwd=TEMPLATE, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.strip().endswith("ok")
+
+
+# The flags must come from .env (loaded with the settings), not from the environment at import time
+FLAGS = """
+import os
+import dotenv
+
+
+def load_dotenv(*args, **kwargs):  # Stands in for a .env file
+    os.environ.update(API_FAST_SERIALIZATION="false", API_PREPARED_STATEMENTS="false",
+                      API_COALESCE_REQUESTS="false", INGEST_MAX_BATCH="7", INGEST_MAX_DELAY_MS="50")
+    return True
+
+
+dotenv.load_dotenv = load_dotenv
+
+from api.api import sale_batcher
+from webapp.coalesce import single_flight
+from webapp.config import settings
+
+assert not settings.API_FAST_SERIALIZATION and not settings.API_PREPARED_STATEMENTS
+assert single_flight.status()["enabled"] is False
+assert (sale_batcher.max_batch, sale_batcher.max_delay) == (7, 0.05)
+print("ok")
+"""
+
+
+def test_api_flags_are_read_from_dotenv():
+    env = {key: value for key, value in os.environ.items() if not key.startswith(("API_", "INGEST_"))}
+    result = subprocess.run(
+        [sys.executable, "-c", FLAGS], cwd=TEMPLATE, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.strip().endswith("ok")
@@ -0,0 +1,112 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import insert, inspect, select
+from sqlalchemy.orm import Session
+
+from webapp.config import settings
+from webapp.models import Sale, Sundae
+from webapp.validation import (
+    BatchValidator, QuarantinedRecord, ensure_quarantine_table, quarantine, validate_and_quarantine,
+)
+
+
+def sale(**overrides):
+    return dict({"sale_id_pk": uuid.uuid4(), "sundae_id": "classic", "timestamp": 1_700_000_000.0, "price": 4.5},
+                **overrides)
+
+
+@pytest.fixture
+def session(sqlite_engine):
+    Sundae.__table__.create(sqlite_engine)
+    Sale.__table__.create(sqlite_engine)
+    with Session(sqlite_engine) as session:
+        session.execute(insert(Sundae.__table__), [{"id": "classic", "name": "Classic", "description": None}])
+        session.commit()
+        yield session
+
+
+def test_rejects_each_kind_of_invalid_row_with_its_reasons(session):
+    rows = [
+        sale(),
+        sale(sundae_id="no-such-sundae"),
+        sale(price=-1.0),
+        sale(price="4.50"),
+        {"sale_id_pk": uuid.uuid4(), "sundae_id": "classic", "price": True},
+    ]
+    valid, rejected = BatchValidator(session, Sale.__table__).validate(rows)
+
+    assert valid == [rows[0]]
+    assert [reasons for _, reasons in rejected] == [
+        ["unknown sundaes.id 'no-such-sundae'"],
+        ["'price' is below 0"],
+        ["'price' is not a valid float"],
+        ["missing required field 'timestamp'", "'price' is not a valid float"],
+    ]
+
+
+def test_referenced_keys_are_loaded_once_per_validator(session):
+    validator = BatchValidator(session, Sale.__table__)
+    statements = []
+    original = session.execute
+    session.execute = lambda *args, **kwargs: statements.append(args[0]) or original(*args, **kwargs)
+
+    for _ in range(3):
+        validator.validate([sale(), sale(sundae_id="no-such-sundae")])
+    assert len(statements) == 1
+
+
+def test_valid_batches_come_back_unchanged(session):
+    rows = [sale() for _ in range(3)]
+    valid, rejected = BatchValidator(session, Sale.__table__).validate(rows)
+    assert valid == rows and rejected == []
+
+
+@pytest.mark.parametrize("bad", [False, True])
+def test_a_generator_batch_is_read_once(session, bad):
+    rows = [sale() for _ in range(3)] + ([sale(price=-1.0)] if bad else [])
+    valid, rejected = BatchValidator(session, Sale.__table__).validate(row for row in rows)
+    assert valid == rows[:3]
+    assert [record for record, _ in rejected] == rows[3:]
+
+
+@pytest.mark.parametrize("target", ["table", "file", "both"])
+def test_quarantine_keeps_rejected_rows_with_their_reasons(session, tmp_path, monkeypatch, target):
+    monkeypatch.setattr(settings, "QUARANTINE_TO", target)
+    monkeypatch.setattr(settings, "QUARANTINE_PATH", str(tmp_path / "quarantine.ndjson"))
+    bad = sale(price=-2.0)
+    ensure_quarantine_table(session)
+
+    valid = validate_and_quarantine(session, Sale, [sale(), bad], source="sales.json")
+    session.commit()
+
+    assert len(valid) == 1
+    expected = {"table_name": "sales", "source": "sales.json", "reasons": ["'price' is below 0"]}
+    if target in ("table", "both"):
+        rows = session.execute(select(QuarantinedRecord)).mappings().all()
+        assert [{key: row[key] for key in expected} for row in rows] == [expected]
+        assert rows[0]["record"]["sale_id_pk"] == str(bad["sale_id_pk"])  # UUIDs are stored as text
+    else:
+        assert not inspect(session.connection()).has_table(QuarantinedRecord.name)
+    if target in ("file", "both"):
+        entries = [json.loads(line) for line in open(tmp_path / "quarantine.ndjson", encoding="utf-8")]
+        assert [{key: entry[key] for key in expected} for entry in entries] == [expected]
+    else:
+        assert not (tmp_path / "quarantine.ndjson").exists()
+
+
+def test_quarantined_rows_roll_back_with_the_load(session, monkeypatch):
+    monkeypatch.setattr(settings, "QUARANTINE_TO", "table")
+    ensure_quarantine_table(session)
+    quarantine(session, "sales", [(sale(price=-5.0), ["'price' is below 0"])], source="sales.json")
+    session.rollback()
+    assert inspect(session.connection()).has_table(QuarantinedRecord.name)  # The table outlives the rollback
+
+    quarantine(session, "sales", [(sale(price=-1.0), ["'price' is below 0"])], source="sales.json")
+    session.commit()
+    quarantine(session, "sales", [(sale(price=-5.0), ["'price' is below 0"])], source="sales.json")
+    session.rollback()
+
+    assert session.execute(select(QuarantinedRecord.c.record)).scalars().all()[0]["price"] == -1.0
+    assert len(session.execute(select(QuarantinedRecord.c.id)).all()) == 1
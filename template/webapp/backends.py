@@ -0,0 +1,216 @@
+"""
+Storage backends, selected with ``DB_BACKEND``.
+
+* ``postgres`` (default): a PostgreSQL server reached through psycopg2, configured by the ``DB_*`` variables.
+* ``duckdb``: an embedded, in-process columnar database stored in the file ``DUCKDB_PATH``
+  (``pip install duckdb duckdb-engine``). There is no server to run, and scans and aggregates
+  over sales run vectorized over columns. Loaders write through DuckDB's own CSV ``COPY``
+  instead of row-by-row INSERTs.
+
+The API and dashboard queries are plain SQL and run unchanged on both backends.
+PostgreSQL-only features switch off by dialect on DuckDB:
+- live deltas are delivered in-process instead of via LISTEN/NOTIFY;
+- prepared statements, partitioning and replicas are not used;
+- there is no JSONB/GIN, ``lock_timeout``, foreign-key deferral or EXPLAIN sampling.
+
+Table metadata on DuckDB is read from ``information_schema`` (``column_types``,
+``reflect_table``) rather than through SQLAlchemy reflection. duckdb-engine's
+inspector queries PostgreSQL catalogs (``pg_collation``, ``regclass``) that
+DuckDB does not emulate, and fails with SQLAlchemy 2.1.
+
+A DuckDB file can be opened for writing by one process at a time. Run the loaders, then serve
+with ``DUCKDB_READ_ONLY=true`` so that the API and dashboard processes can share the file.
+"""
+import csv
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import JSON, BigInteger, Boolean, Column, Date, DateTime, Float, Integer, LargeBinary, MetaData, String, Table
+from sqlalchemy import inspect, insert, text, update
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import URL
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+
+from webapp.config import settings
+
+NULL_MARKER = r"\N"  # How NULL is written in the CSV handed to COPY
+
+# SQLAlchemy types of the DuckDB column types the tables use (by base name, without length or precision)
+DUCKDB_TYPES = {
+    "VARCHAR": String, "DOUBLE": Float, "FLOAT": Float, "REAL": Float, "DECIMAL": Float,
+    "BIGINT": BigInteger, "INTEGER": Integer, "SMALLINT": Integer, "BOOLEAN": Boolean,
+    "JSON": JSON, "UUID": UUID, "TIMESTAMP": DateTime, "DATE": Date, "BLOB": LargeBinary,
+}
+
+
+@compiles(Float, "duckdb")
+def _duckdb_float(type_, compiler, **kw):
+    # DuckDB's FLOAT is 4 bytes, too coarse for Unix timestamps; PostgreSQL's FLOAT is already 8-byte
+    return "DOUBLE"
+
+
+def database_url():
+    """URL of the configured backend (environment variables are read when called)."""
+    if settings.DB_BACKEND == "duckdb":
+        return URL.create("duckdb", database=settings.DUCKDB_PATH)
+    return URL.create(
+        drivername="postgresql+psycopg2",
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+    )
+
+
+def engine_options():
+    """Extra ``create_engine`` arguments for the configured backend."""
+    if settings.DB_BACKEND == "duckdb":
+        return {"connect_args": {"read_only": settings.DUCKDB_READ_ONLY}}
+    return {}
+
+
+def default_schema():
+    return "main" if settings.DB_BACKEND == "duckdb" else "public"
+
+
+def is_duckdb(bind):
+    """Whether an engine, connection or session talks to DuckDB."""
+    if isinstance(bind, Session):
+        bind = bind.get_bind()
+    return bind.dialect.name == "duckdb"
+
+
+@contextmanager
+def _connected(bind):
+    """A connection of ``bind``: the session's or the given one, or a new one from an engine."""
+    if isinstance(bind, Session):
+        yield bind.connection()
+    elif isinstance(bind, Engine):
+        with bind.connect() as connection:
+            yield connection
+    else:
+        yield bind
+
+
+def column_types(bind, table_name, schema=None):
+    """
+    {column name: SQLAlchemy type} of an existing table, in column order; empty when it does not exist.
+
+    Args:
+        bind: Engine, connection or session.
+        table_name (str): Table to describe.
+        schema (str): Schema of the table (the current one by default).
+    """
+    if not is_duckdb(bind):
+        with _connected(bind) as connection:
+            try:
+                columns = inspect(connection).get_columns(table_name, schema=schema)
+            except NoSuchTableError:
+                return {}
+        return {column["name"]: column["type"] for column in columns}
+    query = text(
+        """
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_name = :table AND table_schema = COALESCE(:schema, current_schema())
+        ORDER BY ordinal_position
+        """
+    )
+    with _connected(bind) as connection:
+        rows = connection.execute(query, {"table": table_name, "schema": schema}).fetchall()
+    return {name: DUCKDB_TYPES.get(data_type.split("(")[0].upper(), String)() for name, data_type in rows}
+
+
+def reflect_table(bind, table_name, schema=None):
+    """The ``Table`` as it exists in the database (columns and primary key), e.g. after schema evolution."""
+    if not is_duckdb(bind):
+        with _connected(bind) as connection:
+            return Table(table_name, MetaData(schema=schema), autoload_with=connection)
+    query = text(
+        """
+        SELECT constraint_column_names FROM duckdb_constraints()
+        WHERE table_name = :table AND schema_name = COALESCE(:schema, current_schema())
+          AND constraint_type = 'PRIMARY KEY'
+        """
+    )
+    with _connected(bind) as connection:
+        primary_key = connection.execute(query, {"table": table_name, "schema": schema}).scalar() or []
+    columns = [
+        Column(name, type_, primary_key=name in primary_key)
+        for name, type_ in column_types(bind, table_name, schema).items()
+    ]
+    return Table(table_name, MetaData(schema=schema), *columns)
+
+
+def supports_row_locks(bind):
+    """SELECT ... FOR UPDATE; DuckDB has no row locks (concurrent writers conflict at commit instead)."""
+    return not is_duckdb(bind)
+
+
+def _csv_value(value):
+    if value is None:
+        return NULL_MARKER
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def copy_rows(connection, table, rows):
+    """
+    Bulk-insert dict ``rows`` (sharing one key set) into ``table`` with DuckDB's CSV COPY, in the
+    transaction of ``connection``. Python-side column defaults (e.g. generated UUID keys) are filled in.
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    defaults = [
+        column for column in table.columns
+        if column.name not in rows[0] and column.default is not None and (column.default.is_scalar or column.default.is_callable)
+    ]
+    quote = connection.dialect.identifier_preparer.quote
+    names = ", ".join(quote(name) for name in columns + [column.name for column in defaults])
+
+    handle, path = tempfile.mkstemp(suffix=".csv", prefix=f"{table.name}-")
+    try:
+        with os.fdopen(handle, "w", newline="", encoding="utf-8") as chunk:
+            writer = csv.writer(chunk)
+            for row in rows:
+                values = [_csv_value(row[name]) for name in columns]
+                values += [
+                    _csv_value(column.default.arg(None) if column.default.is_callable else column.default.arg)
+                    for column in defaults
+                ]
+                writer.writerow(values)
+        connection.exec_driver_sql(
+            f"COPY {quote(table.name)} ({names}) FROM '{path.replace(chr(39), chr(39) * 2)}' "
+            f"(FORMAT csv, HEADER false, NULLSTR '{NULL_MARKER}')"
+        )
+    finally:
+        os.unlink(path)
+
+
+def upsert(connection, table, key, values, update_values=None):
+    """
+    Insert the row of ``table`` identified by ``key`` ({primary key column: value}) with ``values``,
+    or update it with ``update_values`` (default ``values``) when it exists.
+    """
+    update_values = values if update_values is None else update_values
+    dialect = (connection.get_bind() if isinstance(connection, Session) else connection).dialect.name
+    if dialect in ("postgresql", "duckdb", "sqlite"):
+        # One atomic statement: with UPDATE-then-INSERT, two writers creating the same row both INSERT and one fails
+        statement = (sqlite_insert if dialect == "sqlite" else pg_insert)(table).values(**key, **values)
+        connection.execute(statement.on_conflict_do_update(index_elements=list(key), set_=update_values))
+        return
+    where = [table.c[name] == value for name, value in key.items()]
+    if connection.execute(update(table).where(*where).values(**update_values)).rowcount == 0:
+        connection.execute(insert(table).values(**key, **values))
@@ -0,0 +1,213 @@
+"""
+Durable checkpoints for chunked, resumable loads of large files.
+
+A load commits every ``LOAD_CHUNK_ROWS`` records. Each chunk's transaction also
+upserts a ``load_checkpoints`` row keyed by table, file fingerprint and shard,
+recording how many records of the file have been consumed (``record_index``)
+and how many rows were inserted (``rows_committed``). Rows and checkpoint
+commit or roll back together, so ``--resume`` continues after the last
+committed chunk without inserting anything twice.
+
+With sharded sales every shard commits its part of a chunk together with its
+own checkpoint. A resume starts from the shard furthest behind and skips the
+records that the other shards already hold.
+"""
+import threading
+import time
+from itertools import islice
+
+from sqlalchemy import BigInteger, Boolean, Column, Float, Integer, MetaData, String, Table, delete, select
+
+from webapp.backends import upsert
+from webapp.config import settings
+from webapp.data_versions import bump_versions
+from webapp.readers import file_fingerprint, iter_batches
+from webapp.records import iter_table_records
+from webapp.schema_policy import split_extras
+from webapp.validation import BatchValidator, ensure_quarantine_table, quarantine
+from webapp.writer import commit_records
+
+PRIMARY = -1  # ``shard`` value of checkpoints kept on the primary database
+
+_create_lock = threading.Lock()  # Concurrent table loads would otherwise race to create the table
+
+checkpoint_metadata = MetaData()
+LoadCheckpoints = Table(
+    "load_checkpoints",
+    checkpoint_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("fingerprint", String, primary_key=True),
+    Column("shard", Integer, primary_key=True, autoincrement=False),
+    Column("source", String, nullable=True),
+    Column("record_index", BigInteger, nullable=False),  # Records of the file consumed by committed chunks
+    Column("rows_committed", BigInteger, nullable=False),  # Rows those chunks inserted (here)
+    Column("complete", Boolean, nullable=False, default=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def _save(connection, key, source, record_index, rows_committed, complete=False):
+    values = {"source": source, "record_index": record_index, "rows_committed": rows_committed,
+              "complete": complete, "updated_at": time.time()}
+    upsert(connection, LoadCheckpoints, key, values)
+
+
+class Checkpointer:
+    """
+    Progress of one file being loaded into one table.
+
+    Args:
+        session (Session): Session on the primary database.
+        table_name (str): Target table.
+        source (Path): The file being loaded.
+        shards (ShardSet): Shards the table's rows are written to, if sharded.
+        resume (bool): Continue from the stored checkpoints; otherwise they are cleared and the load starts over.
+    """
+
+    def __init__(self, session, table_name, source, shards=None, resume=False):
+        self.table_name = table_name
+        self.source = str(source)
+        self.shards = shards
+        self.fingerprint = file_fingerprint(source)
+        self.done = {}  # shard -> records of the file it has committed
+        self.rows = {}  # shard -> rows it has committed
+        self.complete = False
+
+        key = (LoadCheckpoints.c.table_name == table_name) & (LoadCheckpoints.c.fingerprint == self.fingerprint)
+        with _create_lock:
+            LoadCheckpoints.create(bind=session.connection(), checkfirst=True)
+            session.commit()
+            if shards is not None:
+                for engine in shards.engines:
+                    LoadCheckpoints.create(bind=engine, checkfirst=True)
+
+        if not resume:
+            session.execute(delete(LoadCheckpoints).where(key))
+            if shards is not None:
+                for engine in shards.engines:
+                    with engine.begin() as connection:
+                        connection.execute(delete(LoadCheckpoints).where(key))
+            return
+
+        query = select(LoadCheckpoints.c.shard, LoadCheckpoints.c.record_index, LoadCheckpoints.c.rows_committed,
+                       LoadCheckpoints.c.complete).where(key)
+        rows = list(session.execute(query))
+        if shards is not None:
+            rows += [row for row in shards.gather(query, {}) if row[0] != PRIMARY]
+        for shard, record_index, rows_committed, complete in rows:
+            self.done[shard] = record_index
+            self.rows[shard] = rows_committed
+            self.complete = self.complete or (shard == PRIMARY and complete)
+
+    @property
+    def start(self):
+        """Index of the first record that some part of the database has not committed."""
+        if self.shards is None:
+            return self.done.get(PRIMARY, 0)
+        return min(self.done.get(shard, 0) for shard in range(len(self.shards)))
+
+    @property
+    def rows_committed(self):
+        if self.shards is None:
+            return self.rows.get(PRIMARY, 0)
+        return sum(rows for shard, rows in self.rows.items() if shard != PRIMARY)
+
+    def pending(self, index, record):
+        """Whether the record at ``index`` of the file still has to be written."""
+        if self.shards is None:
+            return index >= self.start
+        shard = self.shards.shard_of(record[self.shards.key])
+        return index >= self.done.get(shard, 0)
+
+    def saver(self, record_index):
+        """
+        ``checkpoint(session, shard, rows)`` for ``commit_records``: records that the chunk ending before
+        ``record_index`` is committed, inside the transaction committing ``rows`` of it (``shard`` None: primary).
+        """
+
+        def checkpoint(session, shard, rows):
+            shard = PRIMARY if shard is None else shard
+            self.done[shard] = record_index
+            self.rows[shard] = self.rows.get(shard, 0) + rows
+            key = {"table_name": self.table_name, "fingerprint": self.fingerprint, "shard": shard}
+            _save(session, key, self.source, record_index, self.rows[shard])
+
+        return checkpoint
+
+    def finish(self, session):
+        """Mark the file as completely loaded (a later ``--resume`` then skips it)."""
+        key = {"table_name": self.table_name, "fingerprint": self.fingerprint, "shard": PRIMARY}
+        _save(session, key, self.source, self.done.get(PRIMARY, self.start), self.rows.get(PRIMARY, 0), complete=True)
+        self.complete = True
+
+
+def load_in_chunks(session, model_class, file_path, detect_schema, shards=None, resume=False):
+    """
+    Load a file in checkpointed chunks of ``LOAD_CHUNK_ROWS`` records: validate and quarantine, evolve the
+    schema for new keys, then commit the chunk with its checkpoint through ``commit_records``.
+
+    Args:
+        session (Session): Session on the primary database.
+        model_class: Model of the target table.
+        file_path (Path): JSON, NDJSON or CSV file (optionally gzip/zstd compressed).
+        detect_schema (callable): ``detect_schema(model_class, records, load_size)`` returning the table's
+            columns, e.g. ``Database._detect_and_update_schema``.
+        shards (ShardSet): Shards the table's rows are written to, if sharded.
+        resume (bool): Continue after the last chunk committed from this (unchanged) file.
+
+    Returns:
+        int: Rows committed from the file, including those of earlier runs.
+    """
+    table_name = model_class.__tablename__
+    checkpoint = Checkpointer(session, table_name, file_path, shards=shards, resume=resume)
+    session.commit()
+    if checkpoint.complete:
+        print(f"✅ '{file_path.name}' was already loaded into '{table_name}' ({checkpoint.rows_committed} rows).")
+        return checkpoint.rows_committed
+    if checkpoint.start:
+        print(f"🔸 Resuming '{file_path.name}' at record {checkpoint.start} "
+              f"({checkpoint.rows_committed} rows already committed).")
+
+    # Rows failing required/type/range/foreign-key checks are quarantined; the rest are loaded
+    ensure_quarantine_table(session)
+    validator = BatchValidator(session, model_class.__mapper__.local_table)
+    columns, seen_keys = None, set()
+    index = start = checkpoint.start
+
+    # Compressed and JSON-array files cannot be seeked into, so committed records are decoded and skipped.
+    records = islice(iter_table_records(file_path, table_name), checkpoint.start, None)
+    try:
+        for chunk in iter_batches(records, settings.LOAD_CHUNK_ROWS):
+            end = index + len(chunk)
+            # Only drops records when the shards stopped at different points of the file
+            chunk = [record for i, record in enumerate(chunk, index) if checkpoint.pending(i, record)]
+            chunk, rejected = validator.validate(chunk)
+            quarantine(session, table_name, rejected, source=file_path.name)
+
+            new_keys = {key for record in chunk for key in record} - seen_keys
+            if columns is None or new_keys:
+                columns = detect_schema(model_class, chunk, load_size=len(chunk))
+                seen_keys |= new_keys
+            chunk = split_extras(chunk, columns)  # Keys that did not become columns go to extras
+
+            # The data version is bumped once for the file, not per chunk (one ETag change per load)
+            commit_records(session, model_class, chunk, checkpoint=checkpoint.saver(end), bump=False)
+            index = end
+            print(f"🔸 Committed records up to {end} of '{file_path.name}' ({checkpoint.rows_committed} rows).")
+    except BaseException:
+        session.rollback()
+        if index > start:
+            # The chunks committed before the failure are visible, so the API's validators must change too
+            bump_versions(session, [table_name])
+            session.commit()
+        raise
+
+    checkpoint.finish(session)
+    bump_versions(session, [table_name])
+    session.commit()
+    return checkpoint.rows_committed
+
+
+def reset_checkpoints(engine):
+    """Drop all checkpoints (the data they describe is being reset)."""
+    LoadCheckpoints.drop(bind=engine, checkfirst=True)
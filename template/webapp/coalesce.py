@@ -0,0 +1,147 @@
+"""
+Single-flight coalescing of identical concurrent read requests.
+
+When a dashboard with many viewers refreshes, the same ``GET /sundaes/{id}``
+arrives many times at once. The first request for a given endpoint and set of
+parameters (the leader) runs the endpoint. Identical requests arriving while it
+is still running wait for it and receive its result, or its exception, instead
+of running the same queries again. Nothing is cached: a request arriving after
+the leader has finished starts a new computation.
+
+Requests are coalesced on the event loop, before any worker thread is taken.
+The computation runs once in the threadpool, and every request sharing it,
+the leader included, awaits it as an asyncio future. A burst of identical
+requests therefore holds one worker thread rather than one per request, and a
+client that disconnects does not cancel the computation for the others. The
+waiting requests never use their database sessions, and sessions only check
+out a connection on first use, so they hold no pooled connection while
+waiting. Counters are served by ``GET /admin/coalescing`` (``API_COALESCE_REQUESTS`` turns coalescing off).
+"""
+import asyncio
+import copy
+import functools
+import threading
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from webapp.config import settings
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs one computation per key at a time and shares its outcome with the callers that asked meanwhile.
+
+    Args:
+        enabled (callable): Returns whether calls are coalesced; defaults to ``settings.API_COALESCE_REQUESTS``.
+
+    Counters (see ``status``):
+        requests: calls to ``do``; executions: computations actually run;
+        coalesced: calls answered by another call's computation; max_waiters: most callers sharing one computation.
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = enabled or (lambda: settings.API_COALESCE_REQUESTS)
+        self._lock = threading.Lock()  # Calls are made on the event loop; ``status`` is read from worker threads
+        self._calls = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_waiters = 0
+        self._routes = {}  # name -> [requests, coalesced]
+
+    async def do(self, key, compute):
+        """
+        Return ``compute()``, or the outcome of the identical computation already running for ``key``.
+
+        Args:
+            key (tuple): Hashable identity of the request; ``key[0]`` names the route in the counters.
+            compute (callable): Blocking computation, run in the threadpool for the first caller only.
+        """
+        with self._lock:
+            self.requests += 1
+            route = self._routes.setdefault(key[0], [0, 0])
+            route[0] += 1
+            call = self._calls.get(key)
+            if call is None:
+                # A task of its own, so cancelling any one caller leaves the computation to the others
+                call = self._calls[key] = _Call(asyncio.ensure_future(run_in_threadpool(compute)))
+                call.task.add_done_callback(functools.partial(self._finished, key, call))
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                route[1] += 1
+        return await asyncio.shield(call.task)
+
+    def _finished(self, key, call, task):
+        with self._lock:
+            del self._calls[key]  # Later requests start a fresh computation
+            self.max_waiters = max(self.max_waiters, call.waiters)
+            if not task.cancelled() and task.exception() is not None:
+                self.errors += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled(),
+                "requests": self.requests,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_ratio": round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+                "errors": self.errors,
+                "in_flight": len(self._calls),
+                "max_waiters": self.max_waiters,
+                "routes": {name: {"requests": r, "coalesced": c} for name, (r, c) in sorted(self._routes.items())},
+            }
+
+
+def _share(result):
+    """A response object per caller (Starlette may set headers on it); plain data is only read, so it is shared."""
+    if isinstance(result, Response):
+        result = copy.copy(result)
+        result.raw_headers = list(result.raw_headers)
+    return result
+
+
+def coalesced(name, flight=None):
+    """
+    Decorate a synchronous read endpoint so identical concurrent calls share one execution.
+
+    Calls are identical when their arguments are equal, database sessions comparing by the engine they are
+    bound to. The decorated endpoint is a coroutine that runs the original in the threadpool. FastAPI still
+    sees the endpoint's own signature, so dependencies and validation are unchanged.
+
+    Args:
+        name (str): Route name used in the key and the per-route counters.
+        flight (SingleFlight): Defaults to the module's ``single_flight``, switched by ``API_COALESCE_REQUESTS``.
+    """
+    def decorate(endpoint):
+        shared = flight or single_flight
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            if not shared.enabled():
+                return await run_in_threadpool(endpoint, *args, **kwargs)
+            # A session stands for the engine it reads from: calls served by different replicas are not shared
+            key = (
+                name,
+                tuple(arg.bind if isinstance(arg, Session) else arg for arg in args),
+                tuple(sorted((k, v.bind if isinstance(v, Session) else v) for k, v in kwargs.items())),
+            )
+            return _share(await shared.do(key, functools.partial(endpoint, *args, **kwargs)))
+        return wrapper
+    return decorate
+
+
+single_flight = SingleFlight()
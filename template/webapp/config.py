@@ -0,0 +1,152 @@
+from dotenv import load_dotenv
+import os
+import threading
+
+
+def _split(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def load_settings():
+    """
+    Read .env and the environment into a Settings object, once per process.
+    Importing this module does neither; the first attribute access on ``settings`` does.
+    """
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = _build_settings()
+    return _settings
+
+
+def _build_settings():
+    # Load environment variables from .env file
+    load_dotenv()
+
+    class Settings:
+        # Storage backend: postgres (default) or duckdb (embedded columnar file, see webapp/backends.py)
+        DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+        # DuckDB database file, and whether this process opens it read-only (lets API and dashboard share it)
+        DUCKDB_PATH = os.getenv("DUCKDB_PATH", "sundaes.duckdb")
+        DUCKDB_READ_ONLY = os.getenv("DUCKDB_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+        # Read replicas: comma-separated SQLAlchemy URLs; empty means every read goes to the primary
+        DB_REPLICA_URLS = _split(os.getenv("DB_REPLICA_URLS"))
+        # Seconds between replica health checks
+        DB_REPLICA_HEALTH_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_INTERVAL", "5"))
+        # Replicas lagging further behind than this (seconds) are treated as unhealthy
+        DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))
+        # After a load, route reads to the primary for this many seconds (0 disables read-your-writes)
+        DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "0"))
+        # File touched by the loaders after every commit. Only readers that see the same file get read-your-writes:
+        # processes on one host, or hosts sharing it on a network filesystem
+        DB_WRITE_MARKER = os.getenv("DB_WRITE_MARKER", "/tmp/sundae_db_last_write")
+
+        # Range-partition sales by UTC month (monthly) or not at all (none); applies when the tables are created
+        SALES_PARTITIONING = os.getenv("SALES_PARTITIONING", "none").lower()
+        # Sales shards: comma-separated SQLAlchemy URLs; empty keeps sales on the primary
+        SALES_SHARD_URLS = _split(os.getenv("SALES_SHARD_URLS"))
+        # Sales field hashed to pick a shard (e.g. sundae_id or store_id)
+        SALES_SHARD_KEY = os.getenv("SALES_SHARD_KEY", "sundae_id")
+
+        # Schema evolution: new keys present in at least this fraction of rows become real columns
+        SCHEMA_DENSE_THRESHOLD = float(os.getenv("SCHEMA_DENSE_THRESHOLD", "0.5"))
+        # JSONB column holding the sparser keys
+        SCHEMA_EXTRAS_COLUMN = os.getenv("SCHEMA_EXTRAS_COLUMN", "extras")
+        # GIN-index the extras column (speeds up extras ? 'key' and extras @> '{...}' filters and promotion)
+        SCHEMA_EXTRAS_GIN_INDEX = os.getenv("SCHEMA_EXTRAS_GIN_INDEX", "false").lower() in ("1", "true", "yes")
+        # Fail a schema change rather than wait longer than this for its table lock
+        SCHEMA_LOCK_TIMEOUT = os.getenv("SCHEMA_LOCK_TIMEOUT", "5s")
+
+        # Validation: where rejected rows go (table, file or both), and the file used for file quarantine
+        QUARANTINE_TO = os.getenv("QUARANTINE_TO", "table").lower()
+        QUARANTINE_PATH = os.getenv("QUARANTINE_PATH", "quarantine.ndjson")
+
+        # Resumable loads: records committed (with a checkpoint) per transaction
+        LOAD_CHUNK_ROWS = int(os.getenv("LOAD_CHUNK_ROWS", "50000"))
+        # Tables without a foreign-key dependency between them load concurrently, this many at once
+        LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "4"))
+        # Drop non-unique indexes (and foreign keys on PostgreSQL) during multi-table loads, rebuilding them after
+        LOAD_DEFER_CHECKS = os.getenv("LOAD_DEFER_CHECKS", "false").lower() in ("1", "true", "yes")
+
+        # Slow-query capture: statements at least this slow are recorded (GET /admin/slow-queries)
+        SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+        # Slowest (and most recent) statements kept in memory
+        SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "50"))
+        # Fraction of captured SELECTs re-run under EXPLAIN (ANALYZE, BUFFERS), and the time allowed for it
+        SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+        SLOW_QUERY_EXPLAIN_TIMEOUT = os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT", "10s")
+        # Token expected in the X-Admin-Token header of /admin/slow-queries; unset keeps the endpoints closed
+        SLOW_QUERY_ADMIN_TOKEN = os.getenv("SLOW_QUERY_ADMIN_TOKEN", "")
+        # Log every SQL statement (SQLAlchemy echo); noisy, off by default
+        SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+        # Sales sketches: bucket length (seconds) of the per-sundae price/distinct sketches
+        SKETCH_BUCKET_SECONDS = int(os.getenv("SKETCH_BUCKET_SECONDS", "86400"))
+        # Sales field counted by the distinct sketch; rows without it only feed the price sketch
+        SKETCH_DISTINCT_KEY = os.getenv("SKETCH_DISTINCT_KEY", "customer_id")
+        # KLL accuracy parameter: larger k means smaller quantile error and bigger sketches
+        SKETCH_KLL_K = int(os.getenv("SKETCH_KLL_K", "200"))
+        # HyperLogLog precision: 2**p one-byte registers, standard error 1.04 / sqrt(2**p)
+        SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "12"))
+
+        # Live updates: PostgreSQL NOTIFY channel carrying per-sundae sales deltas after each load
+        LIVE_DELTAS_CHANNEL = os.getenv("LIVE_DELTAS_CHANNEL", "sales_deltas")
+        # Seconds between keep-alive comments on idle live streams
+        LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+        # Events buffered per live subscriber; a subscriber that falls further behind is told to resync
+        LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1000"))
+
+        # Conditional GET: NOTIFY channel announcing data version bumps (see webapp/data_versions.py)
+        DATA_VERSIONS_CHANNEL = os.getenv("DATA_VERSIONS_CHANNEL", "data_versions")
+        # Seconds the API trusts its cached data versions without a notification (bounds staleness without NOTIFY)
+        DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "5"))
+        # Cache-Control sent with ETag'd responses, e.g. "public, max-age=60, stale-while-revalidate=300" behind a proxy
+        HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "public, no-cache")
+
+        # API: encode trusted rows straight to JSON bytes, skipping jsonable_encoder and response_model validation
+        API_FAST_SERIALIZATION = os.getenv("API_FAST_SERIALIZATION", "true").lower() in ("1", "true", "yes")
+        # API: PREPARE/EXECUTE the hot queries on PostgreSQL; disable behind a transaction-pooling proxy (PgBouncer)
+        API_PREPARED_STATEMENTS = os.getenv("API_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+        # Identical concurrent GET requests share one database computation (GET /admin/coalescing)
+        API_COALESCE_REQUESTS = os.getenv("API_COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+        # Sale ingestion (POST /sales): batch size, longest wait of a sale for its batch, and the queue bound
+        INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "1000"))
+        INGEST_MAX_DELAY_MS = float(os.getenv("INGEST_MAX_DELAY_MS", "200"))
+        INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "50000"))
+        # Spill file of acknowledged sales, fsynced before each reply (false survives a crash but not a power loss)
+        INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "/tmp/sundae_sales_ingest.ndjson")
+        INGEST_FSYNC = os.getenv("INGEST_FSYNC", "true").lower() in ("1", "true", "yes")
+        # Spill segment size before moving on to a new one
+        INGEST_SPILL_SEGMENT_BYTES = int(os.getenv("INGEST_SPILL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+
+        # Dashboard: base URL of the API (sundae details and the live sales stream)
+        API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8000")
+        # Dashboard: seconds between redraws of live totals (read from memory, no queries)
+        LIVE_REFRESH_SECONDS = float(os.getenv("LIVE_REFRESH_SECONDS", "2"))
+
+        # Dashboard: memory budget (bytes) of the rendered chart cache shared by all Streamlit sessions
+        CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    return Settings()
+
+
+class _LazySettings:
+    """Stands in for the Settings object until first use; reads and writes go to ``load_settings()``."""
+
+    def __getattr__(self, name):
+        return getattr(load_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(load_settings(), name, value)
+
+    def __delattr__(self, name):
+        delattr(load_settings(), name)
+
+
+settings = _LazySettings()
@@ -0,0 +1,114 @@
+"""
+Per-table data versions, bumped by every write that changes what the API serves.
+
+Each write to a table increments its row in ``data_versions``, in the
+transaction of the write itself. The loaders do this once per file, with the
+checkpoint that marks it complete (or after the last committed chunk when a
+load fails), so the chunks of a load in progress may be served under the
+previous validators. ``commit_records`` bumps every batch it is given unless
+told otherwise. The sale ingest does it per flushed batch. Warm starts and
+resets do it for the tables they clear. The API builds ``ETag`` and
+``Last-Modified`` validators from these versions (see ``api/conditional.py``).
+
+On PostgreSQL, every bump also sends a ``pg_notify`` on ``DATA_VERSIONS_CHANNEL``.
+The server delivers it only when the write commits, so API processes drop their
+cached versions as soon as new data is visible. Other databases have no
+LISTEN/NOTIFY. There, bumps made through a session of this process are handed
+to in-process listeners after the commit, and writes from other processes show
+up once the API's cached versions expire (``DATA_VERSION_TTL``).
+"""
+import json
+import threading
+import time
+
+from sqlalchemy import BigInteger, Column, Float, MetaData, String, Table, event, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from webapp.backends import upsert
+from webapp.config import settings
+
+_create_lock = threading.Lock()  # Concurrent table loads would otherwise race to create the table
+_ready = set()  # Databases (by URL) where the table is known to exist
+
+_local_listeners = []
+_local_lock = threading.Lock()
+
+version_metadata = MetaData()
+DataVersions = Table(
+    "data_versions",
+    version_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+    Column("updated_at", Float, nullable=False),  # Unix time of the last bump (Last-Modified)
+)
+
+
+def ensure_table(connection):
+    key = connection.engine.url.render_as_string(hide_password=False)
+    if key in _ready:
+        return
+    with _create_lock:
+        DataVersions.create(bind=connection, checkfirst=True)
+        _ready.add(key)
+
+
+def bump_versions(bind, table_names):
+    """
+    Increment the data version of ``table_names`` in the current transaction of ``bind``.
+
+    Args:
+        bind (Session or Connection): Session or connection on the primary database, before its commit.
+        table_names (iterable): Tables whose contents changed.
+    """
+    table_names = sorted(set(table_names))
+    if not table_names:
+        return
+    connection = bind.connection() if isinstance(bind, Session) else bind
+    ensure_table(connection)
+    now = time.time()
+    for name in table_names:
+        upsert(
+            connection, DataVersions, {"table_name": name},
+            {"version": 1, "updated_at": now}, {"version": DataVersions.c.version + 1, "updated_at": now},
+        )
+
+    message = {"tables": table_names, "at": now}
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": settings.DATA_VERSIONS_CHANNEL, "payload": json.dumps(message)},
+        )
+    elif isinstance(bind, Session):
+
+        def deliver(_session):
+            with _local_lock:
+                listeners = list(_local_listeners)
+            for listener in listeners:
+                listener(message)
+
+        event.listen(bind, "after_commit", deliver, once=True)
+
+
+def read_versions(connection):
+    """
+    {table_name: (version, updated_at)} of every versioned table; empty before the first bump.
+    """
+    try:
+        rows = connection.execute(select(DataVersions.c.table_name, DataVersions.c.version, DataVersions.c.updated_at))
+        return {name: (version, updated_at) for name, version, updated_at in rows}
+    except DBAPIError:
+        connection.rollback()  # No table yet: nothing has been loaded
+        return {}
+
+
+def add_local_listener(callback):
+    """Receive bumps committed by sessions of this process when the database has no LISTEN/NOTIFY."""
+    with _local_lock:
+        _local_listeners.append(callback)
+
+
+def remove_local_listener(callback):
+    with _local_lock:
+        if callback in _local_listeners:
+            _local_listeners.remove(callback)
@@ -4,95 +4,88 @@ from sqlalchemy import create_engine, text, inspect, Column, Float, String
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import Table, MetaData
 from dotenv import load_dotenv
+from webapp.backends import database_url, default_schema, engine_options, is_duckdb, reflect_table
 import os
 import json
 from pathlib import Path
 from webapp.models import Base, Sundae, Sale
+from webapp.schema_policy import evolve_schema
+from webapp.checkpoints import load_in_chunks, reset_checkpoints
+from webapp.data_versions import bump_versions
+from webapp.sharding import SHARDED_MODELS
+from webapp.scheduler import load_tables
+from webapp.warm_start import changed_sources, clear_tables, dependants, save_schema_fingerprint, schema_changed, schema_fingerprint
+from webapp.sharding import get_shards
 from datetime import datetime
 import uuid
 
 # Load environment variables
 load_dotenv()
 
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-
-DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# PostgreSQL from the DB_* variables, or the embedded DuckDB file (DB_BACKEND, see webapp/backends.py)
+DB_URL = database_url()
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, reset=True):
+        """
+        Args:
+            reset (bool): Drop and recreate the tables (and load checkpoints); False keeps the data,
+                e.g. to resume an interrupted load.
+        """
         print("🔹 Initializing the database connection...")
-        self.engine = create_engine(DB_URL, echo=False)
+        self.engine = create_engine(DB_URL, echo=False, **engine_options())
         self.session_factory = sessionmaker(bind=self.engine)
-        self.schema_name = "public"
+        self.schema_name = default_schema()
         print(f"🔹 Using schema '{self.schema_name}' for table creation...")
 
         # Create tables in the main schema
-        self.initialize_schema()
+        self.initialize_schema(reset=reset)
 
-    def initialize_schema(self):
-        """Create tables in the main schema."""
+    def initialize_schema(self, reset=True):
+        """Create tables in the main schema, dropping the existing ones first when ``reset``."""
         with self.engine.connect() as connection:
-            connection.execute(text(f"SET search_path TO {self.schema_name}"))
-            print(f"🔸 Search path set to schema '{self.schema_name}'.")
-            Base.metadata.drop_all(bind=self.engine)
+            if not is_duckdb(connection):
+                connection.execute(text(f"SET search_path TO {self.schema_name}"))
+                print(f"🔸 Search path set to schema '{self.schema_name}'.")
+            if reset:
+                Base.metadata.drop_all(bind=self.engine)
+                reset_checkpoints(self.engine)
             Base.metadata.create_all(bind=self.engine)
-            print(f"✅ Tables created successfully in schema '{self.schema_name}'!")
-
-    def _infer_column_type(self, value):
-        """Infer SQL column type based on a Python value."""
-        if isinstance(value, int):
-            return "INTEGER"
-        elif isinstance(value, float):
-            return "FLOAT"
-        elif isinstance(value, str):
-            return "TEXT"
-        else:
-            return "TEXT"
-
-    def _detect_and_update_schema(self, model_class, data_list):
-        """Detect new columns and update the table schema."""
+            if reset:
+                with self.engine.begin() as state:
+                    save_schema_fingerprint(state, schema_fingerprint(Base.metadata, self.engine.dialect))
+                    bump_versions(state, Base.metadata.tables)  # The API's cached responses are gone with the data
+            if get_shards() is not None:
+                get_shards().create_schema(reset=reset)
+                if reset:
+                    for engine in get_shards().engines:
+                        reset_checkpoints(engine)
+            print(f"✅ Tables {'created' if reset else 'ready'} in schema '{self.schema_name}'!")
+
+    def _detect_and_update_schema(self, model_class, data_list, load_size=None):
+        """
+        Apply the schema-evolution policy to the keys of ``data_list``: dense new keys are added as
+        columns in one ALTER TABLE, sparse ones are kept in the JSONB extras column.
+        Returns the table's real columns.
+        """
         print(f"🔹 Detecting and updating schema for table '{model_class.__tablename__}'...")
         with self.engine.connect() as connection:
-            connection.execute(text(f"SET search_path TO {self.schema_name}"))
-            inspector = inspect(connection)
-
-            existing_columns = {
-                col["name"] for col in inspector.get_columns(model_class.__tablename__, schema=self.schema_name)
-            }
-            print(f"🔸 Existing columns in '{model_class.__tablename__}': {existing_columns}")
-
-            all_keys = {key for record in data_list for key in record.keys()}
-            print(f"🔸 Detected columns from JSON: {all_keys}")
-
-            for key in all_keys:
-                if key not in existing_columns:
-                    sample_value = next(
-                        (record[key] for record in data_list if key in record and record[key] is not None), None
-                    )
-                    column_type = self._infer_column_type(sample_value)
-                    alter_query = (
-                        f"ALTER TABLE {self.schema_name}.{model_class.__tablename__} ADD COLUMN {key} {column_type}"
-                    )
-                    print(f"🔸 Adding column '{key}' of type '{column_type}' to table '{model_class.__tablename__}'.")
-                    connection.execute(text(alter_query))
-                    print(f"✅ Column '{key}' added to table '{model_class.__tablename__}'.")
-
+            if not is_duckdb(connection):
+                connection.execute(text(f"SET search_path TO {self.schema_name}"))
+            columns = evolve_schema(
+                connection, model_class.__tablename__, data_list, schema=self.schema_name, load_size=load_size
+            )
             connection.commit()  # Ensure the transaction is committed
             print(f"✅ Schema for '{model_class.__tablename__}' updated successfully.")
         self._reflect_table_schema(model_class)
+        return columns
 
     def _reflect_table_schema(self, model_class):
         """Reflect the table schema and update the ORM model."""
         print(f"🔹 Reflecting table schema for '{model_class.__tablename__}'...")
-        metadata = MetaData(schema=self.schema_name)
-        metadata.reflect(bind=self.engine)
-
-        table = metadata.tables[f"{self.schema_name}.{model_class.__tablename__}"]
+        # Only this table, and without the PostgreSQL catalogs on DuckDB (see webapp/backends.py)
+        table = reflect_table(self.engine, model_class.__tablename__, self.schema_name)
 
         for column in table.columns:
             if not hasattr(model_class, column.name):
@@ -102,23 +95,27 @@ class Database:
         model_class.__table__ = table
         print(f"✅ Model '{model_class.__name__}' synchronized with updated table schema.")
 
-    def load_bulk_data(self, file_path: Path, model_class):
-        """Load JSON data dynamically into the database."""
-        print(f"🔹 Loading bulk data from '{file_path.name}' into table '{model_class.__tablename__}'...")
-        session = self.session_factory()
-        try:
-            with open(file_path, "r") as f:
-                data_list = json.load(f)
-            print(f"🔸 Loaded {len(data_list)} records from '{file_path.name}'.")
-
-            self._detect_and_update_schema(model_class, data_list)
+    def load_bulk_data(self, file_path: Path, model_class, resume=False):
+        """
+        Load JSON, NDJSON or CSV data (optionally gzip/zstd compressed) dynamically into the database.
 
-            objects = [model_class(**record) for record in data_list]
-            print(f"🔸 Preparing to insert {len(objects)} records into '{model_class.__tablename__}'...")
+        Records are committed in chunks of ``LOAD_CHUNK_ROWS``, each together with a checkpoint of how far
+        into the file it reached, so an interrupted load does not start over.
 
-            session.bulk_save_objects(objects)
-            session.commit()
-            print(f"✅ Data from '{file_path.name}' loaded successfully into '{model_class.__tablename__}'!")
+        Args:
+            file_path (Path): File to load.
+            model_class: Model of the target table.
+            resume (bool): Continue after the last chunk committed from this (unchanged) file.
+        """
+        table_name = model_class.__tablename__
+        print(f"🔹 Loading bulk data from '{file_path.name}' into table '{table_name}'...")
+        session = self.session_factory()
+        try:
+            shards = get_shards() if table_name == Sale.__tablename__ else None
+            rows = load_in_chunks(session, model_class, file_path, self._detect_and_update_schema,
+                                  shards=shards, resume=resume)
+            print(f"🔸 {rows} rows of '{file_path.name}' are in '{table_name}'.")
+            print(f"✅ Data from '{file_path.name}' loaded successfully into '{table_name}'!")
         except Exception as e:
             session.rollback()
             print(f"❌ Failed to load data from '{file_path.name}': {e}")
@@ -126,6 +123,65 @@ class Database:
         finally:
             session.close()
 
+    def load_tables(self, sources, load=None, defer_checks=None, resume=False):
+        """
+        Load several files, each table as soon as the tables it references are loaded and independent
+        tables concurrently on their own connections (see webapp/scheduler.py).
+
+        Args:
+            sources (list): (file path, model class) pairs.
+            load (callable): ``load(file_path, model_class)``; defaults to ``load_bulk_data``.
+            defer_checks (bool): Rebuild indexes and foreign keys after loading (``LOAD_DEFER_CHECKS``).
+            resume (bool): Passed to ``load_bulk_data``.
+
+        Returns:
+            dict: The schedule report of ``load_tables``.
+        """
+        load = load or (lambda file_path, model_class: self.load_bulk_data(file_path, model_class, resume=resume))
+        return load_tables(load, sources, Base.metadata, engine=self.engine, defer_checks=defer_checks)
+
+    def warm_start(self, sources):
+        """
+        Load ``sources`` without redoing work an earlier run already committed.
+
+        The tables are reset only when the models' schema changed. Otherwise unchanged files are
+        skipped (or resumed if their load was interrupted), and only the tables whose file changed,
+        plus the tables depending on them, are cleared and reloaded.
+
+        Args:
+            sources (list): (file path, model class) pairs, referenced tables first.
+
+        Returns:
+            set: Names of the tables that were cleared and reloaded.
+        """
+        table_names = {model_class.__tablename__ for _, model_class in sources}
+        with self.engine.begin() as connection:
+            reset = schema_changed(connection, schema_fingerprint(Base.metadata, self.engine.dialect))
+        if reset:
+            print("🔸 Model schema changed: recreating the tables.")
+            self.initialize_schema(reset=True)
+            reload = table_names
+        else:
+            with self.engine.begin() as connection:
+                reload = dependants(Base.metadata, changed_sources(connection, sources))
+                clear_tables(connection, Base.metadata, reload)
+                bump_versions(connection, reload)
+            shards = get_shards()
+            if shards is not None and reload:
+                on_shards = {model.__tablename__ for model in SHARDED_MODELS} & reload
+                for engine in shards.engines:
+                    with engine.begin() as connection:
+                        clear_tables(connection, Base.metadata, on_shards)
+            print(f"🔸 Warm start: reloading {sorted(reload & table_names) or 'nothing'}.")
+
+        # Unchanged files resume from their checkpoint, which skips them when their load completed
+        load = lambda file_path, model_class: self.load_bulk_data(
+            file_path, model_class, resume=model_class.__tablename__ not in reload
+        )
+        # Not deferred: that would also rebuild the indexes of the tables kept as they are
+        self.load_tables(sources, load=load, defer_checks=False)
+        return reload & table_names
+
     def close(self):
         """Clean up the database session."""
         print(f"✅ Database session closed.")
@@ -0,0 +1,147 @@
+"""
+Level-of-detail downsampling of the sales time series for charts.
+
+The number of points sent to a chart is tied to its width in pixels, not to the
+number of sales in the visible range:
+
+* ranges with few sales are plotted as-is;
+* up to ``LTTB_ROW_LIMIT`` sales are fetched and reduced with
+  Largest-Triangle-Three-Buckets, which keeps the visual shape;
+* larger ranges are aggregated in the database into one min/max/revenue bucket
+  per pixel column, so at most ``width`` rows ever leave the database.
+"""
+from sqlalchemy import text
+
+POINTS_PER_PIXEL = 2  # min and max of each pixel column
+LTTB_ROW_LIMIT = 50_000  # above this, aggregate in SQL instead of fetching raw sales
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+
+    Args:
+        points (list): (x, y) pairs sorted by x.
+        threshold (int): Number of points to keep (first and last are always kept).
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(x for x, _ in next_bucket) / len(next_bucket)
+        avg_y = sum(y for _, y in next_bucket) / len(next_bucket)
+
+        # Keep the point of this bucket forming the largest triangle with the previous pick
+        ax, ay = points[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def _sundae_filter(sundae_id):
+    return " AND sundae_id = :sundae_id" if sundae_id else ""
+
+
+def range_query(sundae_id=None):
+    """Time extent and row count of the sales (optionally of one sundae)."""
+    return text(f"SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM sales WHERE 1 = 1{_sundae_filter(sundae_id)}")
+
+
+def count_query(sundae_id=None):
+    return text(
+        f"SELECT COUNT(*) FROM sales WHERE timestamp >= :start AND timestamp <= :end{_sundae_filter(sundae_id)}"
+    )
+
+
+def raw_query(sundae_id=None):
+    return text(
+        f"""
+        SELECT timestamp, price
+        FROM sales
+        WHERE timestamp >= :start AND timestamp <= :end{_sundae_filter(sundae_id)}
+        ORDER BY timestamp
+        """
+    )
+
+
+def pixel_buckets_query(sundae_id=None):
+    """
+    One row per pixel column: price min/max, sales volume and revenue.
+    Sales at exactly ``end`` would open bucket ``width``, one past the last column, so they are clamped into it.
+    """
+    return text(
+        f"""
+        SELECT LEAST(CAST(FLOOR((timestamp - :start) / :bucket_width) AS INTEGER), :width - 1) AS bucket,
+               MIN(price) AS min_price, MAX(price) AS max_price,
+               COUNT(*) AS volume, SUM(price) AS revenue
+        FROM sales
+        WHERE timestamp >= :start AND timestamp <= :end{_sundae_filter(sundae_id)}
+        GROUP BY 1
+        ORDER BY 1
+        """
+    )
+
+
+def merge_buckets(rows):
+    """Combine per-shard bucket rows: min of mins, max of maxes, sums of volume and revenue."""
+    merged = {}
+    for bucket, min_price, max_price, volume, revenue in rows:
+        current = merged.get(bucket)
+        if current is None:
+            merged[bucket] = [min_price, max_price, volume, revenue]
+        else:
+            current[0] = min(current[0], min_price)
+            current[1] = max(current[1], max_price)
+            current[2] += volume
+            current[3] += revenue
+    return [(bucket, *merged[bucket]) for bucket in sorted(merged)]
+
+
+def sales_series(run, start, end, width, sundae_id=None):
+    """
+    Price and revenue series for ``[start, end]`` sized for a chart ``width`` pixels wide.
+
+    Args:
+        run (callable): ``run(statement, params)`` returning result rows (a connection, or a shard gather).
+        start, end (float): Visible time range as Unix timestamps.
+        width (int): Chart width in pixels.
+        sundae_id (str): Optional sundae filter.
+
+    Returns:
+        dict: ``mode`` ("raw", "lttb" or "minmax"), ``rows`` (sales in range) and ``points``:
+        (timestamp, price) pairs, or (bucket_start, min_price, max_price, volume, revenue) tuples in minmax mode.
+    """
+    width = max(1, int(width))
+    max_points = width * POINTS_PER_PIXEL
+    params = {"start": start, "end": end}
+    if sundae_id:
+        params["sundae_id"] = sundae_id
+
+    rows = sum(row[0] for row in run(count_query(sundae_id), params))
+    if rows <= LTTB_ROW_LIMIT:
+        points = sorted((float(ts), float(price)) for ts, price in run(raw_query(sundae_id), params))
+        if len(points) <= max_points:
+            return {"mode": "raw", "rows": rows, "points": points}
+        return {"mode": "lttb", "rows": rows, "points": lttb(points, max_points)}
+
+    bucket_width = max((end - start) / width, 1e-9)
+    buckets = merge_buckets(run(pixel_buckets_query(sundae_id), dict(params, bucket_width=bucket_width, width=width)))
+    points = [
+        (start + bucket * bucket_width, float(min_price), float(max_price), int(volume), float(revenue))
+        for bucket, min_price, max_price, volume, revenue in buckets
+    ]
+    return {"mode": "minmax", "rows": rows, "points": points}
@@ -0,0 +1,128 @@
+"""
+Live per-sundae sales deltas, published when a load commits.
+
+Writers call ``publish_deltas`` inside the transaction that inserts the sales.
+On PostgreSQL this is a ``pg_notify`` on ``LIVE_DELTAS_CHANNEL``, which the
+server delivers to listeners only if and when the transaction commits. Other
+databases have no LISTEN/NOTIFY, so deltas are handed to in-process listeners
+after the session commits.
+
+Every notification carries the writing transaction's id, so a subscriber that
+reads a totals snapshot (``sales_snapshot``) can drop deltas the snapshot
+already contains (``visible_in_snapshot``).
+"""
+import json
+import threading
+import time
+
+from sqlalchemy import event, text
+
+from webapp.config import settings
+from webapp.models import Sale
+from webapp.sharding import SALES_TOTALS, merge_totals
+
+MAX_PAYLOAD_BYTES = 7000  # PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+
+_local_listeners = []
+_local_lock = threading.Lock()
+
+
+def sales_deltas(model_class, records):
+    """Per-sundae {sundae_id: [volume, revenue]} added by ``records``; empty for tables other than sales."""
+    deltas = {}
+    if model_class.__tablename__ != Sale.__tablename__:
+        return deltas
+    for row in records:
+        delta = deltas.setdefault(row["sundae_id"], [0, 0.0])
+        delta[0] += 1
+        delta[1] += float(row.get("price") or 0)
+    return deltas
+
+
+def _payloads(deltas, xid):
+    """Split ``deltas`` into JSON messages that fit a NOTIFY payload."""
+    chunk, size, at = {}, 0, time.time()
+    for sundae_id, delta in deltas.items():
+        entry = len(json.dumps({sundae_id: delta}))
+        if chunk and size + entry > MAX_PAYLOAD_BYTES:
+            yield json.dumps({"xid": xid, "at": at, "deltas": chunk})
+            chunk, size = {}, 0
+        chunk[sundae_id] = delta
+        size += entry
+    if chunk:
+        yield json.dumps({"xid": xid, "at": at, "deltas": chunk})
+
+
+def publish_deltas(session, deltas):
+    """
+    Announce ``deltas`` to live subscribers once the session's transaction commits.
+
+    Args:
+        session (Session): Session on the primary database, before ``commit()``.
+        deltas (dict): {sundae_id: [volume, revenue]}, e.g. from ``sales_deltas``.
+    """
+    if not deltas:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        xid = session.execute(text("SELECT pg_current_xact_id()::text")).scalar()
+        for payload in _payloads(deltas, xid):
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": settings.LIVE_DELTAS_CHANNEL, "payload": payload},
+            )
+        return
+
+    messages = [json.loads(payload) for payload in _payloads(deltas, None)]
+
+    def deliver(_session):
+        with _local_lock:
+            listeners = list(_local_listeners)
+        for message in messages:
+            for listener in listeners:
+                listener(message)
+
+    event.listen(session, "after_commit", deliver, once=True)
+
+
+def add_local_listener(callback):
+    """Receive deltas published in this process when the database has no LISTEN/NOTIFY."""
+    with _local_lock:
+        _local_listeners.append(callback)
+
+
+def remove_local_listener(callback):
+    with _local_lock:
+        if callback in _local_listeners:
+            _local_listeners.remove(callback)
+
+
+def sales_snapshot(engine, shards=None):
+    """
+    Current per-sundae totals and the snapshot they were read in.
+
+    Returns:
+        tuple: ({sundae_id: [volume, revenue]}, snapshot) where ``snapshot`` is PostgreSQL's
+        ``pg_current_snapshot()`` text, or None when deltas cannot be matched against it
+        (other databases, or sales on shards whose transactions are not the primary's).
+    """
+    if shards is not None:
+        return shards.sales_totals(), None
+    if engine.dialect.name != "postgresql":
+        with engine.connect() as connection:
+            return merge_totals(connection.execute(SALES_TOTALS)), None
+    # Both statements see one snapshot, so it tells exactly which commits the totals include
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        snapshot = connection.execute(text("SELECT pg_current_snapshot()::text")).scalar()
+        totals = merge_totals(connection.execute(SALES_TOTALS))
+    return totals, snapshot
+
+
+def visible_in_snapshot(xid, snapshot):
+    """Whether transaction ``xid`` had committed in ``snapshot`` (``xmin:xmax:xip,...``)."""
+    if xid is None or snapshot is None:
+        return False
+    xmin, xmax, running = snapshot.split(":")
+    xid = int(xid)
+    if xid < int(xmin):
+        return True
+    return xid < int(xmax) and str(xid) not in running.split(",")
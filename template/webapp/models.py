@@ -1,10 +1,14 @@
 import uuid
-from sqlalchemy import Column, String, Float, ForeignKey, Integer
+from sqlalchemy import JSON, BigInteger, Column, String, Float, ForeignKey, Integer, LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.dialects.postgresql import UUID
+from webapp.config import settings
 
 Base = declarative_base()
 
+# Monthly range partitioning of sales on timestamp (PostgreSQL only), managed by webapp/partitions.py
+SALES_PARTITIONED = settings.SALES_PARTITIONING == "monthly" and settings.DB_BACKEND == "postgres"
+
 
 class Sundae(Base):
     __tablename__ = "sundaes"
@@ -17,10 +21,12 @@ class Sundae(Base):
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"} if SALES_PARTITIONED else {}
 
     sale_id_pk = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     sundae_id = Column(String, ForeignKey("sundaes.id"), nullable=False)  # Foreign key to sundaes
-    timestamp = Column(Float, nullable=False)  # Unix timestamp as float
+    # Unix timestamp as float; part of the primary key when partitioned, as PostgreSQL requires
+    timestamp = Column(Float, nullable=False, primary_key=SALES_PARTITIONED)
     price = Column(Float, nullable=False)  # Price of the sale
 
 
@@ -32,3 +38,23 @@ class Employee(Base):
     role = Column(String, nullable=False)
     salary = Column(Float, nullable=False)
     hire_date = Column(String, nullable=False)
+
+
+class SalesRollup(Base):
+    """Per-hour, per-sundae sales pre-aggregate maintained by the loaders (see webapp/rollups.py)."""
+    __tablename__ = "sales_rollups"
+
+    bucket_start = Column(BigInteger, primary_key=True)  # Unix timestamp of the bucket start
+    sundae_id = Column(String, primary_key=True)
+    volume = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class SalesSketch(Base):
+    """Per-bucket, per-sundae price quantile and distinct-count sketches (see webapp/sketches.py)."""
+    __tablename__ = "sales_sketches"
+
+    bucket_start = Column(BigInteger, primary_key=True)  # Unix timestamp of the bucket start
+    sundae_id = Column(String, primary_key=True)
+    price_sketch = Column(JSON, nullable=True)  # Serialized KLL sketch
+    distinct_registers = Column(LargeBinary, nullable=True)  # HyperLogLog registers
@@ -0,0 +1,177 @@
+"""
+Monthly range partitions of the ``sales`` table (``SALES_PARTITIONING=monthly``).
+
+The loaders create partitions ahead of the data and insert each batch straight
+into its partition. Old months are retired by detaching or dropping whole
+partitions instead of running a large DELETE. The hourly rollups and the
+sketches of the retired months are removed in the same transaction:
+    python -m webapp.partitions ensure --months-ahead 3
+    python -m webapp.partitions retain --keep-months 12 [--drop]
+"""
+import argparse
+import re
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import column, insert, table, text
+
+from webapp.data_versions import bump_versions
+from webapp.models import Sale
+from webapp.rollups import rebuild_rollups
+from webapp.sketches import rebuild_sketches
+
+PARENT_TABLE = Sale.__tablename__
+MONTHS_AHEAD = 1  # empty partitions kept ready beyond the newest data
+
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_of(timestamp):
+    """(year, month) in UTC of a Unix timestamp."""
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return moment.year, moment.month
+
+
+def add_months(year, month, months):
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year, month):
+    return f"{PARENT_TABLE}_y{year:04d}m{month:02d}"
+
+
+def partition_bounds(year, month):
+    """Unix timestamp range [start, end) covered by a monthly partition."""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    next_year, next_month = add_months(year, month, 1)
+    end = datetime(next_year, next_month, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def existing_partitions(session):
+    """Names of the partitions currently attached to the sales table."""
+    rows = session.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:parent AS regclass)
+            """
+        ),
+        {"parent": PARENT_TABLE},
+    )
+    return {row[0] for row in rows}
+
+
+def ensure_partitions(session, months, months_ahead=MONTHS_AHEAD):
+    """
+    Create any missing partition for ``months`` (a set of (year, month)) plus
+    ``months_ahead`` months past the newest one. Returns the names created.
+    """
+    if not months:
+        return []
+    wanted = set(months)
+    newest = max(months)
+    for ahead in range(1, months_ahead + 1):
+        wanted.add(add_months(*newest, ahead))
+
+    existing = existing_partitions(session)
+    created = []
+    for year, month in sorted(wanted):
+        name = partition_name(year, month)
+        if name in existing:
+            continue
+        start, end = partition_bounds(year, month)
+        print(f"🔸 Creating partition '{name}' for [{start}, {end}).")
+        session.execute(
+            text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ({start}) TO ({end})")
+        )
+        created.append(name)
+    return created
+
+
+def route_records(records):
+    """Group sales records by the (year, month) partition they belong to."""
+    routed = {}
+    for record in records:
+        routed.setdefault(month_of(record["timestamp"]), []).append(record)
+    return routed
+
+
+def insert_partitioned(session, model_class, records):
+    """
+    Insert a sales batch directly into its monthly partitions, creating them first.
+    Writing to the partitions skips per-row tuple routing through the parent table.
+    """
+    routed = route_records(records)
+    ensure_partitions(session, set(routed))
+
+    columns = model_class.__mapper__.local_table.columns
+    for (year, month), rows in routed.items():
+        partition = table(partition_name(year, month), *[column(c.name, c.type) for c in columns])
+        groups = {}
+        for params in rows:
+            # Partition tables are addressed directly, so the ORM primary key default is applied here
+            params = dict(params, sale_id_pk=params.get("sale_id_pk") or uuid.uuid4())
+            groups.setdefault(tuple(params), []).append(params)
+        for group in groups.values():
+            session.execute(insert(partition), group)
+
+
+def retire_partitions(session, keep_months, drop=False, now=None):
+    """
+    Detach (and optionally drop) partitions that end before the last ``keep_months`` months.
+
+    ``sales_rollups`` and ``sales_sketches`` stop counting the retired sales: their buckets in the
+    retired months are recomputed from what is left in ``sales``, so the leaderboard and the
+    distributions cover the same history as the table. Returns the names retired.
+    """
+    if keep_months < 1:
+        raise ValueError(f"keep_months must be at least 1 (got {keep_months}): the current month is always kept.")
+    current = month_of(now if now is not None else datetime.now(timezone.utc).timestamp())
+    cutoff = add_months(*current, -keep_months + 1)
+
+    retired = []
+    for name in sorted(existing_partitions(session)):
+        match = _PARTITION_NAME.match(name)
+        if not match or (int(match.group(1)), int(match.group(2))) >= cutoff:
+            continue
+        print(f"🔸 Detaching partition '{name}'...")
+        session.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            print(f"🔸 Dropping partition '{name}'...")
+            session.execute(text(f"DROP TABLE {name}"))
+        start, end = partition_bounds(int(match.group(1)), int(match.group(2)))
+        rebuild_rollups(session, start, end)
+        rebuild_sketches(session, start=start, end=end)
+        retired.append(name)
+    if retired:
+        bump_versions(session, [PARENT_TABLE])
+    return retired
+
+
+if __name__ == "__main__":
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from webapp.database import DB_URL
+
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the sales table.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="Create partitions for this month and the next ones")
+    ensure_parser.add_argument("--months-ahead", type=int, default=3)
+    retain_parser = subparsers.add_parser("retain", help="Detach or drop partitions older than the retention")
+    retain_parser.add_argument("--keep-months", type=int, required=True)
+    retain_parser.add_argument("--drop", action="store_true", help="Drop detached partitions instead of keeping them")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    with Session(engine) as session, session.begin():
+        if args.command == "ensure":
+            current = month_of(datetime.now(timezone.utc).timestamp())
+            created = ensure_partitions(session, {current}, months_ahead=args.months_ahead)
+            print(f"✅ {len(created)} partition(s) created.")
+        else:
+            retired = retire_partitions(session, args.keep_months, drop=args.drop)
+            print(f"✅ {len(retired)} partition(s) {'dropped' if args.drop else 'detached'}.")
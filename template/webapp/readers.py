@@ -0,0 +1,292 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+from itertools import islice
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd input is optional
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+FORMAT_SUFFIXES = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+SUPPORTED_UPLOAD_TYPES = ["json", "ndjson", "jsonl", "csv", "gz", "zst"]
+
+CHUNK_SIZE = 1 << 16
+# Decode errors this close to the end of the buffer may come from a truncated number, literal or escape
+TRUNCATION_SLACK = 32
+FINGERPRINT_BLOCK = 1 << 20  # bytes hashed per read when fingerprinting a file
+
+_fingerprints = {}  # (path, size, mtime, inode) -> fingerprint: one process hashes an unchanged file once
+
+
+def file_fingerprint(path):
+    """
+    Identity of a source file: its size plus a SHA-256 of all of its bytes, read in 1 MiB blocks.
+    Any edit changes it, including a same-size rewrite in the middle of the file. Within a process the
+    hash is reused while the file keeps its size, modification time and inode.
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    fingerprint = _fingerprints.get(key)
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as source:
+            for block in iter(lambda: source.read(FINGERPRINT_BLOCK), b""):
+                digest.update(block)
+        fingerprint = _fingerprints[key] = f"{stat.st_size}:{digest.hexdigest()[:32]}"
+    return fingerprint
+
+
+def table_name_for(file_path):
+    """Derive the table name from a file name, ignoring every suffix (``sales.ndjson.gz`` -> ``sales``)."""
+    return Path(file_path).name.split(".")[0].lower()
+
+
+def detect_compression(file_path):
+    """Detect gzip/zstd compression from the magic bytes, falling back to the file suffix."""
+    with open(file_path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return COMPRESSION_SUFFIXES.get(Path(file_path).suffix.lower())
+
+
+def open_source(file_path):
+    """
+    Open a (possibly compressed) input file as a UTF-8 text stream.
+    Decompression is streamed, so the file is never expanded on disk or in memory.
+    """
+    compression = detect_compression(file_path)
+    if compression == "gzip":
+        return io.TextIOWrapper(gzip.open(file_path, "rb"), encoding="utf-8", newline="")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"Reading '{file_path}' requires the 'zstandard' package.")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8", newline="")
+    return open(file_path, "r", encoding="utf-8", newline="")
+
+
+def detect_format(file_path, stream):
+    """
+    Detect the record format of a file. The suffix (after stripping compression
+    suffixes) wins; otherwise the first non-blank character decides between a
+    JSON array, NDJSON and CSV.
+    """
+    suffixes = [s.lower() for s in Path(file_path).suffixes]
+    while suffixes and suffixes[-1] in COMPRESSION_SUFFIXES:
+        suffixes.pop()
+    fmt = FORMAT_SUFFIXES.get(suffixes[-1]) if suffixes else None
+    if fmt == "csv" or fmt == "ndjson":
+        return fmt
+
+    head = stream.peek() if hasattr(stream, "peek") else ""
+    first = head.lstrip()[:1]
+    if first == "[":
+        return "json"
+    if first == "{":
+        return "ndjson"
+    return fmt or "csv"
+
+
+def iter_json_array(stream):
+    """
+    Incrementally decode a top-level JSON array, yielding one element at a time.
+    Only a single chunk plus the current record are held in memory.
+
+    Raises:
+        ValueError: With the byte offset of the element, as soon as an element fails to decode
+            although enough input follows it, rather than buffering the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    consumed = 0  # UTF-8 bytes dropped from the front of ``buffer``
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buffer, pos, consumed, eof
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        consumed += len(buffer[:pos].encode("utf-8"))
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed.
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+
+        if pos >= len(buffer):
+            if started:
+                raise ValueError("Unexpected end of JSON array.")
+            return
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of records.")
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if not (eof or _malformed(e, buffer)):
+                fill()  # The element runs past the end of the buffer
+                continue
+            start = consumed + len(buffer[:pos].encode("utf-8"))
+            at = start + len(buffer[pos:e.pos].encode("utf-8"))
+            raise ValueError(f"Malformed JSON record starting at byte {start}: {e.msg} at byte {at}.") from e
+
+        # A value ending exactly at the buffer edge may be truncated (e.g. a number).
+        if end == len(buffer) and not eof:
+            fill()
+            continue
+
+        pos = end
+        yield record
+
+
+def _malformed(error, buffer):
+    """
+    Whether a decode error is in the data rather than caused by the buffer ending mid-element:
+    errors from a truncated element point at (or just before) the end of the buffer, or at the
+    start of a string that is still open.
+    """
+    return not error.msg.startswith("Unterminated string") and error.pos < len(buffer) - TRUNCATION_SLACK
+
+
+def iter_ndjson(stream):
+    """Decode newline-delimited JSON, one record per non-blank line."""
+    decoder = json.JSONDecoder()
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
+
+
+def _infer_csv_value(value):
+    """Convert a CSV cell to int/float when it looks numeric; empty cells become None."""
+    if value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def iter_csv(stream, column_types=None):
+    """
+    Decode CSV rows into dicts.
+
+    Args:
+        stream: Text stream positioned at the header row.
+        column_types (dict): Optional column name -> callable (e.g. ``float``) hints.
+            Columns without a hint are inferred per value.
+    """
+    column_types = column_types or {}
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    converters = [column_types.get(name) for name in header]
+    for row in reader:
+        if not row:
+            continue
+        record = {}
+        for name, convert, value in zip(header, converters, row):
+            if value == "":
+                record[name] = None
+            elif convert is not None:
+                record[name] = convert(value)
+            else:
+                record[name] = _infer_csv_value(value)
+        yield record
+
+
+def iter_records(file_path, fmt=None, column_types=None):
+    """
+    Stream records from a JSON array, NDJSON or CSV file, optionally gzip/zstd compressed.
+
+    Args:
+        file_path (str | Path): Path to the input file.
+        fmt (str): Force a format ("json", "ndjson" or "csv") instead of detecting it.
+        column_types (dict): CSV column type hints, see ``iter_csv``.
+
+    Yields:
+        dict: One record at a time.
+    """
+    with open_source(file_path) as stream:
+        buffered = _PeekableText(stream)
+        fmt = fmt or detect_format(file_path, buffered)
+        if fmt == "json":
+            yield from iter_json_array(buffered)
+        elif fmt == "ndjson":
+            yield from iter_ndjson(buffered)
+        elif fmt == "csv":
+            yield from iter_csv(buffered, column_types)
+        else:
+            raise ValueError(f"Unsupported input format '{fmt}'.")
+
+
+def iter_batches(records, batch_size):
+    """Group an iterable of records into lists of at most ``batch_size`` items."""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class _PeekableText:
+    """Text stream wrapper that lets format detection look ahead without consuming input."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._head = stream.read(CHUNK_SIZE)
+
+    def peek(self):
+        return self._head
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                data, self._head = self._head + self._stream.read(), ""
+                return data
+            data, self._head = self._head[:size], self._head[size:]
+            if len(data) < size:
+                data += self._stream.read(size - len(data))
+            return data
+        return self._stream.read(size)
+
+    def __iter__(self):
+        if self._head:
+            head, self._head = self._head, ""
+            lines = io.StringIO(head + self._stream.readline()).readlines()
+            yield from lines
+        yield from self._stream
@@ -0,0 +1,39 @@
+from sqlalchemy import insert
+from webapp.readers import iter_batches, iter_records
+from webapp.backends import copy_rows, is_duckdb
+
+INSERT_BATCH_SIZE = 5000
+
+
+# CSV type hints for the known shapes (everything not listed stays inferred)
+CSV_COLUMN_TYPES = {
+    "sundaes": {"id": str, "name": str, "description": str},
+    "sales": {"sundae_id": str, "timestamp": float, "price": float},
+    "employees": {"id": str, "name": str, "role": str, "salary": float, "hire_date": str},
+}
+
+
+def iter_table_records(file_path, table_name, fmt=None):
+    """
+    Stream the records of ``file_path`` as dicts, with the CSV type hints of ``table_name`` when it has any.
+
+    Values are not converted or checked here; the batch validation stage does that for whole chunks.
+    """
+    yield from iter_records(file_path, fmt=fmt, column_types=CSV_COLUMN_TYPES.get(table_name))
+
+
+def insert_records(session, model_class, records, batch_size=INSERT_BATCH_SIZE):
+    """
+    Insert dict records with ORM bulk INSERT (executemany) batches, or with COPY on DuckDB.
+    Records are grouped by key set so rows with different optional columns never share a statement.
+    """
+    duckdb = is_duckdb(session.get_bind())
+    for batch in iter_batches(records, batch_size):
+        groups = {}
+        for record in batch:
+            groups.setdefault(tuple(record), []).append(record)
+        for rows in groups.values():
+            if duckdb:  # Row-by-row executemany is orders of magnitude slower there
+                copy_rows(session.connection(), model_class.__mapper__.local_table, rows)
+            else:
+                session.execute(insert(model_class), rows)
@@ -0,0 +1,144 @@
+"""
+Per-bucket sales pre-aggregates for time-windowed queries such as the leaderboard.
+
+Loaders call ``maintain_rollups`` in the same transaction as their inserts, so
+``sales_rollups`` always matches ``sales``. Rebuild from scratch with:
+    python -m webapp.rollups rebuild
+"""
+import argparse
+import math
+import re
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from webapp.backends import is_duckdb
+from webapp.models import Sale, SalesRollup
+
+BUCKET_SECONDS = 3600  # hourly buckets
+UPSERT_BATCH_ROWS = 5000  # rows per multi-row upsert statement on DuckDB
+
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+_WINDOW = re.compile(r"^(\d+)([mhdw])$")
+
+
+def bucket_start(timestamp, bucket_seconds=BUCKET_SECONDS):
+    """Start (Unix seconds) of the bucket containing ``timestamp``."""
+    return int(math.floor(timestamp / bucket_seconds)) * bucket_seconds
+
+
+def parse_window(window):
+    """Parse a window such as ``90m``, ``24h``, ``7d`` or ``2w`` into seconds."""
+    match = _WINDOW.match(window.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{window}'. Use e.g. '60m', '24h', '7d' or '1w'.")
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def window_buckets(end, window_seconds, bucket_seconds=BUCKET_SECONDS):
+    """
+    First and last bucket start covering the ``window_seconds`` before ``end``.
+    Windows are aligned to whole buckets, so edges are accurate to ``bucket_seconds``.
+    """
+    last = bucket_start(end, bucket_seconds)
+    buckets = max(1, math.ceil(window_seconds / bucket_seconds))
+    return last - (buckets - 1) * bucket_seconds, last
+
+
+def aggregate_sales(records):
+    """Fold sales records into {(bucket_start, sundae_id): [volume, revenue]} deltas."""
+    deltas = {}
+    for params in records:
+        key = (bucket_start(params["timestamp"]), params["sundae_id"])
+        delta = deltas.get(key)
+        if delta is None:
+            deltas[key] = [1, params["price"]]
+        else:
+            delta[0] += 1
+            delta[1] += params["price"]
+    return deltas
+
+
+def apply_deltas(session, deltas):
+    """Add volume/revenue deltas to ``sales_rollups`` with a batched upsert."""
+    if not deltas:
+        return
+    # Upserted in key order, as sales_sketches is locked, so concurrent loads cannot deadlock
+    rows = [
+        {"bucket_start": bucket, "sundae_id": sundae_id, "volume": volume, "revenue": revenue}
+        for (bucket, sundae_id), (volume, revenue) in sorted(deltas.items())
+    ]
+    stmt = pg_insert(SalesRollup.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bucket_start", "sundae_id"],
+        set_={
+            "volume": SalesRollup.__table__.c.volume + stmt.excluded.volume,
+            "revenue": SalesRollup.__table__.c.revenue + stmt.excluded.revenue,
+        },
+    )
+    if is_duckdb(session):
+        # duckdb-engine runs executemany row by row; a multi-row VALUES statement is one round trip
+        for start in range(0, len(rows), UPSERT_BATCH_ROWS):
+            session.execute(stmt.values(rows[start:start + UPSERT_BATCH_ROWS]))
+    else:
+        session.execute(stmt, rows)
+
+
+def maintain_rollups(session, model_class, records):
+    """
+    Update the pre-aggregates for a batch of freshly inserted records.
+    No-op for tables other than ``sales``. Returns the applied deltas.
+    """
+    if model_class.__tablename__ != Sale.__tablename__:
+        return {}
+    deltas = aggregate_sales(records)
+    apply_deltas(session, deltas)
+    return deltas
+
+
+def covering_buckets(start, end, bucket_seconds=BUCKET_SECONDS):
+    """[first bucket start, end of the last bucket) of the buckets overlapping the time range [start, end)."""
+    return bucket_start(start, bucket_seconds), -(-int(math.ceil(end)) // bucket_seconds) * bucket_seconds
+
+
+def rebuild_rollups(connection, start=None, end=None):
+    """
+    Recompute ``sales_rollups`` from the ``sales`` history.
+
+    With ``start`` and ``end``, only the buckets overlapping [start, end) are recomputed, e.g. after the
+    sales of that range were removed. Buckets that also cover sales outside the range keep those sales.
+    """
+    if start is None:
+        where, params = "", {}
+        connection.execute(text("DELETE FROM sales_rollups"))
+    else:
+        low, high = covering_buckets(start, end)
+        where, params = "WHERE timestamp >= :low AND timestamp < :high", {"low": low, "high": high}
+        connection.execute(text("DELETE FROM sales_rollups WHERE bucket_start >= :low AND bucket_start < :high"), params)
+    connection.execute(
+        text(
+            f"""
+            INSERT INTO sales_rollups (bucket_start, sundae_id, volume, revenue)
+            SELECT CAST(FLOOR(timestamp / :bucket) * :bucket AS BIGINT), sundae_id, COUNT(*), SUM(price)
+            FROM sales
+            {where}
+            GROUP BY 1, 2
+            """
+        ),
+        {"bucket": BUCKET_SECONDS, **params},
+    )
+
+
+if __name__ == "__main__":
+    from webapp.database import DB_URL
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Manage the sales pre-aggregates.")
+    parser.add_argument("command", choices=["rebuild"], help="'rebuild' recomputes sales_rollups from sales")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    SalesRollup.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as connection:
+        rebuild_rollups(connection)
+    print("✅ Sales rollups rebuilt.")
@@ -0,0 +1,222 @@
+"""
+Read/write routing between the primary database and read replicas.
+
+Writes (loaders, DDL) always use the primary engine. Reads ask
+``ReplicaRouter.read_engine()``, which returns a healthy replica in round-robin
+order, or the primary when no replica is configured or healthy, or when a load
+committed within the read-your-writes window.
+
+Replica health is checked by a background thread every
+``DB_REPLICA_HEALTH_INTERVAL`` seconds, so requests only read the cached state
+and never wait for a check (or for a connect timeout of a replica that is down).
+Each check also reads the replica's own ``data_versions``. Conditional GETs
+served by a replica take their validators from these versions rather than the
+primary's: a replica only moves forward, so the body it serves is never older
+than its validators.
+
+The read-your-writes window is based on a marker file (``DB_WRITE_MARKER``)
+that writers touch after every commit. It only covers writers and readers that
+see the same file, i.e. processes on one host, or hosts sharing the file on a
+network filesystem. Readers on other hosts are protected by the replica lag
+limit (``DB_REPLICA_MAX_LAG``) alone.
+
+Check replica health from the command line with:
+    python -m webapp.routing status
+"""
+import itertools
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+from webapp.config import settings
+from webapp.data_versions import read_versions
+
+
+CONNECT_TIMEOUT = 2  # seconds; a replica that does not answer in time is marked unhealthy
+
+# connect() argument holding the connect timeout, per DBAPI driver; other drivers keep their default
+CONNECT_TIMEOUT_ARGS = {
+    "psycopg2": "connect_timeout",
+    "psycopg": "connect_timeout",
+    "pg8000": "timeout",
+    "asyncpg": "timeout",
+    "pymysql": "connect_timeout",
+    "mysqldb": "connect_timeout",
+}
+
+# Replication lag in seconds (0 on a primary); other dialects have no lag to report
+LAG_QUERIES = {
+    "postgresql": """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """,
+}
+
+
+def connect_args(url, timeout=CONNECT_TIMEOUT):
+    """``connect_args`` bounding the connect time of ``url``'s driver, when the driver supports it."""
+    name = CONNECT_TIMEOUT_ARGS.get(make_url(url).get_driver_name())
+    return {name: timeout} if name else {}
+
+
+def mark_write(marker=None):
+    """Record that a write was just committed (loaders call this after each commit)."""
+    path = Path(marker or settings.DB_WRITE_MARKER)
+    try:
+        path.touch()
+    except OSError as e:
+        print(f"⚠ Could not update write marker '{path}': {e}")
+
+
+def last_write(marker=None):
+    """Unix time of the last committed write, or 0 when unknown."""
+    try:
+        return Path(marker or settings.DB_WRITE_MARKER).stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class Replica:
+    """A replica engine plus its cached health state."""
+
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_engine(url, pool_pre_ping=True, connect_args=connect_args(url))
+        self.healthy = False
+        self.checked_at = 0.0
+        self.lag = None
+        self.error = None
+        self.versions = None  # data_versions as of the last successful check
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        # A dropped connection takes the replica out of rotation until the next health check
+        if context.is_disconnect:
+            self.healthy = False
+
+    def check(self, max_lag):
+        """
+        Run a health check: the replica must answer and lag less than ``max_lag`` seconds.
+        Its data versions are read on the same connection.
+        """
+        try:
+            with self.engine.connect() as connection:
+                lag = connection.execute(text(LAG_QUERIES.get(self.engine.dialect.name, "SELECT 0"))).scalar()
+                self.versions = read_versions(connection)
+            self.lag = float(lag or 0)
+            self.healthy = self.lag <= max_lag
+            self.error = None if self.healthy else f"replication lag {self.lag:.1f}s"
+        except Exception as e:
+            self.healthy = False
+            self.error = str(e)
+        self.checked_at = time.monotonic()
+        return self.healthy
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for read-only work.
+
+    Args:
+        primary: Engine of the primary database.
+        replica_urls (list): SQLAlchemy URLs of the read replicas.
+        write_marker (str): Marker file of the read-your-writes window (``DB_WRITE_MARKER``).
+    """
+
+    def __init__(
+        self, primary, replica_urls=None, health_interval=None, max_lag=None, read_your_writes=None, write_marker=None
+    ):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in (settings.DB_REPLICA_URLS if replica_urls is None else replica_urls)]
+        self.health_interval = settings.DB_REPLICA_HEALTH_INTERVAL if health_interval is None else health_interval
+        self.max_lag = settings.DB_REPLICA_MAX_LAG if max_lag is None else max_lag
+        self.read_your_writes = (
+            settings.DB_READ_YOUR_WRITES_SECONDS if read_your_writes is None else read_your_writes
+        )
+        self.write_marker = write_marker
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stopping = threading.Event()
+
+    def check_replicas(self):
+        """Check every replica once (the monitor thread does this every ``health_interval`` seconds)."""
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+
+    def start(self):
+        """Start the background health checks; ``read_engine`` does this on first use."""
+        with self._lock:
+            if self._monitor is not None or not self.replicas:
+                return
+            self._stopping.clear()
+            self._monitor = threading.Thread(target=self._monitor_replicas, name="replica-health", daemon=True)
+            self._monitor.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            monitor.join(5)
+
+    def _monitor_replicas(self):
+        while not self._stopping.is_set():
+            self.check_replicas()
+            self._stopping.wait(self.health_interval)
+
+    def read_engine(self):
+        """Engine for the next read: a healthy replica, otherwise the primary. Never waits for a health check."""
+        replica = self.read_replica()
+        return self.primary if replica is None else replica.engine
+
+    def read_replica(self):
+        """The healthy replica serving the next read, or None when the primary serves it."""
+        if not self.replicas:
+            return None
+        if self._monitor is None:
+            self.start()  # Replicas count as unhealthy until their first check has answered
+        if self.read_your_writes and time.time() - last_write(self.write_marker) < self.read_your_writes:
+            return None
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            if replica.healthy:
+                return replica
+        return None
+
+    def status(self):
+        """Health snapshot of every replica as of its last check, e.g. for diagnostics."""
+        return [
+            {
+                "url": replica.engine.url.render_as_string(hide_password=True),
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag,
+                "error": replica.error,
+                "checked_seconds_ago": round(time.monotonic() - replica.checked_at, 1) if replica.checked_at else None,
+            }
+            for replica in self.replicas
+        ]
+
+
+if __name__ == "__main__":
+    import argparse
+    from webapp.database import DB_URL
+
+    parser = argparse.ArgumentParser(description="Inspect read-replica routing.")
+    parser.add_argument("command", choices=["status"])
+    parser.parse_args()
+
+    router = ReplicaRouter(create_engine(DB_URL))
+    router.check_replicas()
+    if not router.replicas:
+        print("🔸 No replicas configured (DB_REPLICA_URLS); all reads go to the primary.")
+    for replica in router.status():
+        state = "✅ healthy" if replica["healthy"] else f"❌ unhealthy ({replica['error']})"
+        print(f"{replica['url']}: {state}, lag={replica['lag_seconds']}")
@@ -0,0 +1,154 @@
+"""
+Schema-evolution policy for records with keys the table does not have yet.
+
+Rather than one ``ALTER TABLE ... ADD COLUMN`` per new key, the keys of a load
+are planned together:
+
+* dense keys (non-null in at least ``SCHEMA_DENSE_THRESHOLD`` of the table's
+  rows, counting the incoming batch) become real columns, all added by a single
+  ALTER TABLE, so the ACCESS EXCLUSIVE lock is taken once per load;
+* sparse, long-tail keys go into one JSONB ``extras`` column (optionally GIN
+  indexed for ``extras ? 'key'`` and ``extras @> ...`` lookups);
+* a key already kept in ``extras`` is promoted to a real column once its
+  density crosses the threshold: the column is added and its values are moved
+  out of ``extras`` in the same transaction.
+"""
+from collections import Counter
+
+from sqlalchemy import text
+
+from webapp.backends import column_types
+from webapp.config import settings
+
+def infer_column_type(value):
+    """SQL column type for a Python value (INTEGER, DOUBLE PRECISION or TEXT), also used in promotion casts."""
+    if isinstance(value, int):
+        return "INTEGER"
+    elif isinstance(value, float):
+        return "DOUBLE PRECISION"  # Spelled out: FLOAT is 4 bytes on DuckDB
+    return "TEXT"
+
+
+def key_counts(records):
+    """How many records have a non-null value for each key, plus a sample value per key."""
+    counts, samples = Counter(), {}
+    for record in records:
+        for key, value in record.items():
+            if value is not None:
+                counts[key] += 1
+                samples.setdefault(key, value)
+    return counts, samples
+
+
+def _table_counts(connection, quote, table, extras, keys):
+    """Row count of ``table`` and, per key, how many rows carry it in ``extras`` (one scan)."""
+    filters = "".join(
+        f", COUNT(*) FILTER (WHERE {quote(extras)} ? :key_{i})" for i in range(len(keys))
+    )
+    row = connection.execute(
+        text(f"SELECT COUNT(*){filters} FROM {table}"), {f"key_{i}": key for i, key in enumerate(keys)}
+    ).fetchone()
+    return row[0], dict(zip(keys, row[1:]))
+
+
+def evolve_schema(connection, table_name, records, schema=None, threshold=None, load_size=None):
+    """
+    Add the dense new keys of ``records`` as columns and keep the sparse ones in ``extras``.
+
+    Args:
+        connection (Connection): Connection in the transaction that changes the schema.
+        table_name (str): Existing table the records are loaded into.
+        records (list): Dict records of the load.
+        schema (str): Schema of the table, if not on the search path.
+        threshold (float): Density at which a key becomes a column (``SCHEMA_DENSE_THRESHOLD``).
+        load_size (int): Records in the whole load (defaults to ``len(records)``).
+
+    Returns:
+        set: The table's real columns after the change; other keys belong in ``extras``.
+    """
+    threshold = settings.SCHEMA_DENSE_THRESHOLD if threshold is None else threshold
+    extras = settings.SCHEMA_EXTRAS_COLUMN
+    quote = connection.dialect.identifier_preparer.quote
+    postgres = connection.dialect.name == "postgresql"
+    table = f"{quote(schema)}.{quote(table_name)}" if schema else quote(table_name)
+
+    columns = set(column_types(connection, table_name, schema))
+    counts, samples = key_counts(records)
+    candidates = sorted(key for key in counts if key not in columns and key != extras)
+    if not candidates:
+        return columns
+
+    # Density over the whole table: rows already holding the key in extras plus the incoming batch
+    table_rows, in_extras = 0, {}
+    if postgres and extras in columns:
+        table_rows, in_extras = _table_counts(connection, quote, table, extras, candidates)
+    total = table_rows + (len(records) if load_size is None else load_size)
+    dense = [key for key in candidates if (in_extras.get(key, 0) + counts[key]) / total >= threshold]
+    sparse = [key for key in candidates if key not in dense]
+    promoted = [key for key in dense if in_extras.get(key, 0)]
+
+    clauses = [f"ADD COLUMN {quote(key)} {infer_column_type(samples[key])}" for key in dense]
+    if sparse and extras not in columns:
+        clauses.append(f"ADD COLUMN {quote(extras)} {'JSONB' if postgres else 'JSON'}")
+    if clauses:
+        if postgres:
+            # Give up instead of queueing every reader behind the ALTER's ACCESS EXCLUSIVE lock
+            connection.execute(text(f"SET LOCAL lock_timeout = '{settings.SCHEMA_LOCK_TIMEOUT}'"))
+            connection.execute(text(f"ALTER TABLE {table} {', '.join(clauses)}"))
+        else:
+            for clause in clauses:  # Other databases only take one ADD COLUMN per ALTER TABLE
+                connection.execute(text(f"ALTER TABLE {table} {clause}"))
+        print(f"🔸 Schema for '{table_name}': {len(dense)} new column(s) {dense}, {len(sparse)} key(s) kept in '{extras}'.")
+
+    if promoted:
+        assignments = ", ".join(
+            f"{quote(key)} = CAST({quote(extras)} ->> :key_{i} AS {infer_column_type(samples[key])})"
+            for i, key in enumerate(promoted)
+        )
+        removals = "".join(f" - CAST(:key_{i} AS text)" for i in range(len(promoted)))
+        params = {f"key_{i}": key for i, key in enumerate(promoted)}
+        connection.execute(
+            text(
+                f"UPDATE {table} SET {assignments}, {quote(extras)} = {quote(extras)}{removals} "
+                f"WHERE {quote(extras)} ?| CAST(:keys AS text[])"
+            ),
+            dict(params, keys=promoted),
+        )
+        print(f"✅ Promoted {promoted} from '{extras}' to columns of '{table_name}'.")
+
+    if postgres and settings.SCHEMA_EXTRAS_GIN_INDEX and (sparse or extras in columns):
+        connection.execute(
+            text(f"CREATE INDEX IF NOT EXISTS {quote(f'ix_{table_name}_{extras}')} ON {table} USING GIN ({quote(extras)})")
+        )
+    return columns | set(dense) | ({extras} if sparse else set())
+
+
+def split_extras(records, columns):
+    """
+    Move the keys of records that are not real ``columns`` into the ``extras`` object.
+    Records that already fit the table are returned unchanged.
+    """
+    extras_column = settings.SCHEMA_EXTRAS_COLUMN
+    split = []
+    for record in records:
+        if all(key in columns for key in record):
+            split.append(record)
+            continue
+        row, extras = {}, dict(record.get(extras_column) or {})
+        for key, value in record.items():
+            if key in columns and key != extras_column:
+                row[key] = value
+            elif key != extras_column and value is not None:
+                extras[key] = value
+        if extras and extras_column in columns:
+            row[extras_column] = extras
+        split.append(row)
+    return split
+
+
+def group_by_keys(records):
+    """Group records by key set, so rows with different optional fields never share an INSERT."""
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(record), []).append(record)
+    return groups.values()
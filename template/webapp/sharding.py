@@ -0,0 +1,287 @@
+"""
+Hash-sharded sales storage (``SALES_SHARD_URLS``) with scatter-gather aggregation.
+
+Sales rows are distributed by a stable hash of ``SALES_SHARD_KEY`` (sundae_id by
+default) across the shard databases. Sundaes are small and are broadcast to every
+shard so each one can enforce its foreign key. Aggregates run on every shard in
+parallel and the partial sums are merged in the application.
+
+Compare the sharded results with a single-node database holding the same data:
+    python -m webapp.sharding verify --single-node-url postgresql://.../sundaes
+"""
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import sessionmaker
+
+from webapp.backends import column_types
+from webapp.config import settings
+from webapp.models import Base, Sale, SalesRollup, SalesSketch, Sundae
+from webapp.slow_queries import slow_queries
+
+# Tables every shard holds: sundaes are broadcast, sales and their rollups/sketches are hash-distributed
+SHARDED_MODELS = (Sundae, Sale, SalesRollup, SalesSketch)
+
+# Partial sums per sundae; shard-local GROUP BY, merged by ShardSet
+SALES_TOTALS = text(
+    """
+    SELECT sundae_id, COUNT(*) AS volume, COALESCE(SUM(price), 0) AS revenue
+    FROM sales
+    GROUP BY sundae_id
+    """
+)
+SUNDAE_SALES_TOTALS = text(
+    """
+    SELECT sundae_id, COUNT(*) AS volume, COALESCE(SUM(price), 0) AS revenue
+    FROM sales
+    WHERE sundae_id = :id
+    GROUP BY sundae_id
+    """
+)
+WINDOW_TOTALS = text(
+    """
+    SELECT sundae_id, SUM(volume) AS volume, SUM(revenue) AS revenue
+    FROM sales_rollups
+    WHERE bucket_start BETWEEN :first_bucket AND :last_bucket
+    GROUP BY sundae_id
+    """
+)
+
+
+def merge_totals(rows):
+    """Merge (sundae_id, volume, revenue) partial sums into {sundae_id: [volume, revenue]}."""
+    totals = {}
+    for sundae_id, volume, revenue in rows:
+        total = totals.setdefault(sundae_id, [0, 0.0])
+        total[0] += int(volume)
+        total[1] += float(revenue)
+    return totals
+
+
+class ShardSet:
+    """
+    The configured sales shards.
+
+    Args:
+        urls (list): SQLAlchemy URLs, one per shard. Their order defines the hash ring, so keep it stable.
+        key (str): Sales field hashed to choose a shard.
+    """
+
+    def __init__(self, urls, key=None):
+        self.engines = [create_engine(url, pool_pre_ping=True) for url in urls]
+        self.session_factories = [sessionmaker(bind=engine) for engine in self.engines]
+        self.key = key or settings.SALES_SHARD_KEY
+        # One worker per shard, kept for the life of the set; scatter-gather runs on every request
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.engines)), thread_name_prefix="shard")
+        self._synced = {}  # table name -> column names known to exist on every shard
+        self._schema_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_of(self, value):
+        """Shard index for a key value (crc32, stable across processes unlike hash())."""
+        return zlib.crc32(str(value).encode("utf-8")) % len(self.engines)
+
+    def _map(self, fn, indexes=None):
+        """Run ``fn(index)`` on the given shards in parallel and return the results in order."""
+        indexes = list(range(len(self.engines))) if indexes is None else list(indexes)
+        if len(indexes) == 1:
+            return [fn(indexes[0])]  # No hand-off for single-shard lookups
+        return list(self._pool.map(fn, indexes))
+
+    def close(self):
+        """Stop the worker threads and close every shard's pooled connections."""
+        self._pool.shutdown(wait=True)
+        for engine in self.engines:
+            engine.dispose()
+
+    def ensure_schema(self, model_class):
+        """
+        Make sure every shard has the tables and the current columns of ``model_class``.
+        The shards are only contacted the first time and whenever the model gained columns, not for every batch.
+        """
+        table = model_class.__mapper__.local_table
+        columns = frozenset(table.columns.keys())
+        if self._synced.get(table.name) == columns:
+            return
+        with self._schema_lock:
+            if self._synced.get(table.name) == columns:
+                return
+            if not self._synced:
+                self.create_schema()
+            self.sync_columns(model_class)
+            self._synced[table.name] = columns
+
+    def create_schema(self, reset=False):
+        """Create the sundaes, sales, rollup and sketch tables on every shard, dropping them first when ``reset``."""
+        tables = [model.__mapper__.local_table for model in SHARDED_MODELS]
+
+        def create(i):
+            if reset:
+                Base.metadata.drop_all(self.engines[i], tables=tables)
+            Base.metadata.create_all(self.engines[i], tables=tables)
+
+        self._map(create)
+        self._synced.clear()
+
+    def sync_columns(self, model_class):
+        """Add columns the primary gained through schema evolution to every shard."""
+        table = model_class.__mapper__.local_table
+
+        def sync(i):
+            engine = self.engines[i]
+            existing = set(column_types(engine, table.name))
+            missing = [col for col in table.columns if col.name not in existing]
+            if missing:
+                clauses = ", ".join(f"ADD COLUMN {col.name} {col.type.compile(engine.dialect)}" for col in missing)
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table.name} {clauses}"))
+
+        self._map(sync)
+
+    def write(self, model_class, records, write_batch, before_commit=None):
+        """
+        Hash-distribute ``records`` and write every shard's share in parallel.
+        Each shard commits its own transaction; there is no cross-shard atomicity.
+
+        Args:
+            write_batch (callable): ``write_batch(session, model_class, records)``, e.g. ``write_records``.
+            before_commit (callable): ``before_commit(session, shard, rows)``, run in each shard's
+                transaction after its share is written (e.g. a load checkpoint).
+
+        Returns:
+            list: What ``write_batch`` returned for each shard.
+        """
+        routed = {}
+        for record in records:
+            routed.setdefault(self.shard_of(record[self.key]), []).append(record)
+
+        def write(i):
+            with self.session_factories[i]() as session:
+                result = write_batch(session, model_class, routed[i])
+                if before_commit is not None:
+                    before_commit(session, i, len(routed[i]))
+                session.commit()
+            return len(routed[i]), result
+
+        written = self._map(write, sorted(routed))
+        counts = [count for count, _ in written]
+        print(f"🔸 Wrote {sum(counts)} records across {len(counts)} shard(s): {dict(zip(sorted(routed), counts))}.")
+        return [result for _, result in written]
+
+    def broadcast(self, model_class, records):
+        """Upsert ``records`` (a small dimension table such as sundaes) into every shard."""
+        table = model_class.__mapper__.local_table
+        primary_keys = [col.name for col in table.primary_key.columns]
+        rows = list(records)
+        if not rows:
+            return
+
+        def upsert(i):
+            with self.engines[i].begin() as connection:
+                groups = {}
+                for row in rows:
+                    groups.setdefault(tuple(row), []).append(row)
+                for group in groups.values():
+                    stmt = pg_insert(table)
+                    updates = {key: stmt.excluded[key] for key in group[0] if key not in primary_keys}
+                    stmt = stmt.on_conflict_do_update(index_elements=primary_keys, set_=updates) if updates else (
+                        stmt.on_conflict_do_nothing(index_elements=primary_keys)
+                    )
+                    connection.execute(stmt, group)
+
+        self._map(upsert)
+
+    def gather(self, statement, params=None, indexes=None):
+        """Scatter ``statement`` to the shards and return all result rows."""
+
+        def run(i):
+            with self.engines[i].connect() as connection:
+                return connection.execute(statement, params or {}).fetchall()
+
+        return [row for rows in self._map(run, indexes) for row in rows]
+
+    def sundae_shards(self, sundae_id):
+        """Shards that can hold sales of ``sundae_id``: only its own one when sharding by sundae_id."""
+        return [self.shard_of(sundae_id)] if self.key == "sundae_id" else None
+
+    def sales_totals(self, sundae_id=None):
+        """Volume and revenue per sundae, merged from per-shard partial sums."""
+        if sundae_id is None:
+            return merge_totals(self.gather(SALES_TOTALS))
+        return merge_totals(self.gather(SUNDAE_SALES_TOTALS, {"id": sundae_id}, self.sundae_shards(sundae_id)))
+
+    def window_totals(self, first_bucket, last_bucket):
+        """Volume and revenue per sundae over a bucket range of the shard-local rollups."""
+        return merge_totals(
+            self.gather(WINDOW_TOTALS, {"first_bucket": first_bucket, "last_bucket": last_bucket})
+        )
+
+
+_shards = None
+_shards_lock = threading.Lock()
+
+
+def get_shards():
+    """The configured ShardSet, or None when sales are not sharded."""
+    global _shards
+    if _shards is None and settings.SALES_SHARD_URLS:
+        with _shards_lock:  # Concurrent first requests must not each build (and leak) a set of engines
+            if _shards is None:
+                shards = ShardSet(settings.SALES_SHARD_URLS)
+                for i, engine in enumerate(shards.engines):
+                    slow_queries.attach(engine, name=f"shard-{i}")
+                _shards = shards
+    return _shards
+
+
+def single_node_totals(engine):
+    """Reference volume/revenue per sundae computed on one database."""
+    with engine.connect() as connection:
+        return merge_totals(connection.execute(SALES_TOTALS).fetchall())
+
+
+def compare_totals(expected, actual, tolerance=1e-6):
+    """List of human-readable differences between two totals mappings (empty when they match)."""
+    differences = []
+    for sundae_id in sorted(set(expected) | set(actual)):
+        exp = expected.get(sundae_id, [0, 0.0])
+        act = actual.get(sundae_id, [0, 0.0])
+        if exp[0] != act[0] or abs(exp[1] - act[1]) > tolerance * max(1.0, abs(exp[1])):
+            differences.append(f"{sundae_id}: single-node {exp} != sharded {act}")
+    return differences
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage and verify the sales shards.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("init", help="Create the tables on every shard")
+    verify_parser = subparsers.add_parser("verify", help="Compare scatter-gather totals with a single node")
+    verify_parser.add_argument("--single-node-url", required=True, help="Database holding the same sales unsharded")
+    args = parser.parse_args()
+
+    shards = get_shards()
+    if shards is None:
+        raise SystemExit("❌ SALES_SHARD_URLS is not set.")
+
+    if args.command == "init":
+        shards.create_schema()
+        print(f"✅ Schema created on {len(shards)} shard(s).")
+    else:
+        expected = single_node_totals(create_engine(args.single_node_url))
+        actual = shards.sales_totals()
+        differences = compare_totals(expected, actual)
+        per_sundae = [compare_totals({k: v}, shards.sales_totals(sundae_id=k)) for k, v in expected.items()]
+        differences += [d for diff in per_sundae for d in diff]
+        if differences:
+            print("❌ Sharded totals differ from the single-node output:")
+            for difference in differences:
+                print(f"   {difference}")
+            raise SystemExit(1)
+        print(f"✅ {len(expected)} sundae totals match the single-node output across {len(shards)} shard(s).")
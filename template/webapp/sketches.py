@@ -0,0 +1,349 @@
+"""
+Mergeable per-sundae sketches of the sales stream: price quantiles and distinct counts.
+
+Loaders call ``maintain_sketches`` in the same transaction as their inserts. Each
+``sales_sketches`` row holds, for one sundae and one bucket (a day by default):
+
+* a KLL sketch of the sale prices. With k=200, quantiles are within about
+  ±1.65% normalized rank of the exact answer (99% confidence), e.g. the reported
+  p95 is an actual price between the exact p93.35 and p96.65.
+* HyperLogLog registers of ``SKETCH_DISTINCT_KEY`` (e.g. customer_id). With
+  precision 12 (4 KiB), the relative standard error of a count is 1.04/sqrt(4096) ≈ 1.6%.
+
+Both merge without loss of accuracy guarantees, so any range of buckets (and any
+set of shards) can be combined at query time. Rebuild from scratch with:
+    python -m webapp.sketches rebuild
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+
+from sqlalchemy import bindparam, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from webapp.backends import supports_row_locks
+from webapp.config import settings
+from webapp.models import Sale, SalesSketch
+from webapp.rollups import bucket_start, covering_buckets
+
+_random = random.Random()
+
+
+def kll_rank_error(k):
+    """
+    Normalized rank error (99% confidence) of a KLL sketch with parameter ``k``.
+    Uses the Apache DataSketches bound for the conservative (PMF) case: 1.65% at k=200.
+    """
+    return 2.446 / k ** 0.9433
+
+
+def hll_relative_error(precision):
+    """Relative standard error of a HyperLogLog estimate with 2**precision registers."""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Values enter level 0; a full level is sorted and every other item (random
+    offset) is promoted to the next level with twice the weight. Level capacities
+    shrink geometrically (factor 2/3) below the top, so the sketch keeps
+    O(k) items however many values it has seen.
+    """
+
+    def __init__(self, k=None):
+        self.k = k or settings.SKETCH_KLL_K
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.levels = [[]]
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _add_level(self):
+        self.levels.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value):
+        """Add one value."""
+        self.n += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.levels[0].append(value)
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        while self._size >= self._max_size:
+            for level, items in enumerate(self.levels):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self._add_level()
+                items.sort()
+                # An odd item out stays behind so the total weight is preserved exactly
+                keep = [items.pop(_random.randrange(len(items)))] if len(items) % 2 else []
+                promoted = items[_random.getrandbits(1)::2]
+                self.levels[level + 1].extend(promoted)
+                self.levels[level] = keep
+                self._size -= len(items) - len(promoted)
+                break
+
+    def merge(self, other):
+        """Fold ``other`` into this sketch."""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self._add_level()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._size = sum(len(items) for items in self.levels)
+        self._compress()
+        return self
+
+    def quantiles(self, fractions):
+        """Approximate values at the given fractions (0..1), or Nones when the sketch is empty."""
+        if self.n == 0:
+            return [None for _ in fractions]
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * total
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+        return results
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.n, sketch.min, sketch.max = data["n"], data["min"], data["max"]
+        sketch.levels = [list(items) for items in data["levels"]] or [[]]
+        sketch._size = sum(len(items) for items in sketch.levels)
+        sketch._max_size = sum(sketch._capacity(level) for level in range(len(sketch.levels)))
+        return sketch
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**precision one-byte registers (64-bit blake2b hashes)."""
+
+    def __init__(self, precision=None, registers=None):
+        if registers is not None:
+            precision = int(math.log2(len(registers)))
+        self.precision = precision or settings.SKETCH_HLL_PRECISION
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << self.precision)
+
+    def add(self, value):
+        """Add one key (any value; its string form is hashed)."""
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Fold ``other`` (same precision) into this counter."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLog precision {other.precision} into {self.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        """Approximate number of distinct keys added."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting over the empty registers
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+
+def fold_sales(records, bucket_seconds=None, distinct_key=None):
+    """Fold sales records into {(bucket_start, sundae_id): [KLLSketch, HyperLogLog or None]}."""
+    bucket_seconds = bucket_seconds or settings.SKETCH_BUCKET_SECONDS
+    distinct_key = distinct_key or settings.SKETCH_DISTINCT_KEY
+    folded = {}
+    for params in records:
+        key = (bucket_start(params["timestamp"], bucket_seconds), params["sundae_id"])
+        entry = folded.get(key)
+        if entry is None:
+            entry = folded[key] = [KLLSketch(), None]
+        entry[0].update(params["price"])
+        value = params.get(distinct_key)
+        if value is not None:
+            if entry[1] is None:
+                entry[1] = HyperLogLog()
+            entry[1].add(value)
+    return folded
+
+
+def merge_row(entry, price_sketch, distinct_registers):
+    """Merge a stored (price_sketch, distinct_registers) pair into a folded [kll, hll] entry."""
+    if isinstance(price_sketch, str):
+        # Raw text() queries return JSON columns undecoded on some drivers
+        price_sketch = json.loads(price_sketch)
+    if price_sketch:
+        entry[0].merge(KLLSketch.from_dict(price_sketch))
+    if distinct_registers:
+        stored = HyperLogLog(registers=distinct_registers)
+        entry[1] = stored if entry[1] is None else entry[1].merge(stored)
+    return entry
+
+
+def apply_sketches(session, folded):
+    """Merge folded sketches into ``sales_sketches`` (read-merge-write under row locks)."""
+    if not folded:
+        return
+    table = SalesSketch.__table__
+    # One lock order for every loader (key order, inserts included), so overlapping batches wait instead of deadlocking
+    keys = sorted(folded)
+
+    # Create missing rows first so that concurrent loaders serialize on the row locks below
+    session.execute(
+        pg_insert(table).on_conflict_do_nothing(index_elements=["bucket_start", "sundae_id"]),
+        [{"bucket_start": bucket, "sundae_id": sundae_id} for bucket, sundae_id in keys],
+    )
+    query = select(table.c.bucket_start, table.c.sundae_id, table.c.price_sketch, table.c.distinct_registers).where(
+        tuple_(table.c.bucket_start, table.c.sundae_id).in_(keys)
+    ).order_by(table.c.bucket_start, table.c.sundae_id)
+    if supports_row_locks(session.get_bind()):
+        query = query.with_for_update()
+    stored = session.execute(query)
+    for bucket, sundae_id, price_sketch, distinct_registers in stored:
+        merge_row(folded[(bucket, sundae_id)], price_sketch, distinct_registers)
+
+    session.execute(
+        update(table)
+        .where(table.c.bucket_start == bindparam("b_bucket_start"), table.c.sundae_id == bindparam("b_sundae_id"))
+        .values(price_sketch=bindparam("price_sketch"), distinct_registers=bindparam("distinct_registers")),
+        [
+            {
+                "b_bucket_start": bucket,
+                "b_sundae_id": sundae_id,
+                "price_sketch": kll.to_dict(),
+                "distinct_registers": bytes(hll.registers) if hll is not None else None,
+            }
+            for (bucket, sundae_id), (kll, hll) in ((key, folded[key]) for key in keys)
+        ],
+    )
+
+
+def maintain_sketches(session, model_class, records):
+    """
+    Update the sketches for a batch of freshly inserted records.
+    No-op for tables other than ``sales``. Returns the folded batch sketches.
+    """
+    if model_class.__tablename__ != Sale.__tablename__:
+        return {}
+    folded = fold_sales(records)
+    apply_sketches(session, folded)
+    return folded
+
+
+def summarize(rows, fractions=(0.5, 0.95)):
+    """
+    Merge stored sketch rows (bucket_start, price_sketch, distinct_registers) into a distribution summary.
+    """
+    price = KLLSketch()
+    distinct = None
+    days = []
+    for bucket, price_sketch, distinct_registers in rows:
+        entry = merge_row([KLLSketch(), None], price_sketch, distinct_registers)
+        price.merge(entry[0])
+        if entry[1] is not None:
+            days.append({"bucket_start": bucket, "estimate": round(entry[1].estimate())})
+            distinct = entry[1] if distinct is None else distinct.merge(entry[1])
+
+    values = price.quantiles(fractions)
+    return {
+        "sales": price.n,
+        "price": {
+            "min": price.min,
+            "max": price.max,
+            "quantiles": {f"p{fraction * 100:g}": value for fraction, value in zip(fractions, values)},
+            "rank_error": round(kll_rank_error(price.k), 4),
+        },
+        "distinct": {
+            "key": settings.SKETCH_DISTINCT_KEY,
+            "total": round(distinct.estimate()) if distinct is not None else None,
+            "per_bucket": days,
+            "relative_error": round(
+                hll_relative_error(distinct.precision if distinct is not None else settings.SKETCH_HLL_PRECISION), 4
+            ),
+        },
+    }
+
+
+def rebuild_sketches(session, chunk_size=50_000, start=None, end=None):
+    """
+    Recompute ``sales_sketches`` from the ``sales`` history.
+
+    With ``start`` and ``end``, only the buckets overlapping [start, end) are recomputed (see ``rebuild_rollups``).
+    """
+    if start is None:
+        where, params = "", {}
+        session.execute(text("DELETE FROM sales_sketches"))
+    else:
+        low, high = covering_buckets(start, end, settings.SKETCH_BUCKET_SECONDS)
+        where, params = "WHERE timestamp >= :low AND timestamp < :high", {"low": low, "high": high}
+        session.execute(text("DELETE FROM sales_sketches WHERE bucket_start >= :low AND bucket_start < :high"), params)
+    columns = [column.name for column in Sale.__mapper__.local_table.columns]
+    wanted = ["sundae_id", "timestamp", "price"] + [name for name in (settings.SKETCH_DISTINCT_KEY,) if name in columns]
+    result = session.execute(text(f"SELECT {', '.join(wanted)} FROM sales {where}"), params).mappings()
+
+    folded = {}
+    for chunk in iter(lambda: result.fetchmany(chunk_size), []):
+        for key, entry in fold_sales(chunk).items():
+            if key in folded:
+                folded[key][0].merge(entry[0])
+                if entry[1] is not None:
+                    folded[key][1] = entry[1] if folded[key][1] is None else folded[key][1].merge(entry[1])
+            else:
+                folded[key] = entry
+    apply_sketches(session, folded)
+    return len(folded)
+
+
+if __name__ == "__main__":
+    from webapp.database import DB_URL
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    parser = argparse.ArgumentParser(description="Manage the sales sketches.")
+    parser.add_argument("command", choices=["rebuild"], help="'rebuild' recomputes sales_sketches from sales")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    SalesSketch.__table__.create(bind=engine, checkfirst=True)
+    with Session(engine) as session, session.begin():
+        buckets = rebuild_sketches(session)
+    print(f"✅ Sales sketches rebuilt ({buckets} sundae buckets).")
@@ -0,0 +1,215 @@
+"""
+Slow-query capture for diagnosing slow endpoints and dashboards.
+
+Cursor events on each attached engine time every statement. Statements slower
+than ``SLOW_QUERY_MS`` are recorded with their parameters and duration. The
+``SLOW_QUERY_KEEP`` slowest ones are kept, and so are the most recent ones, so
+memory stays bounded however long the process runs. For a ``SLOW_QUERY_EXPLAIN_RATE``
+fraction of the captured SELECTs on PostgreSQL, a background thread re-runs the
+statement under ``EXPLAIN (ANALYZE, BUFFERS)`` on its own connection, in a
+transaction that is rolled back. The plan is attached to the record, and the
+request that was slow is not delayed further. An ``EXECUTE`` of a prepared
+statement (the API's hot queries) is explained by preparing a copy of its
+``PREPARE`` on the explaining connection. The records are served by
+``GET /admin/slow-queries``, to callers sending ``SLOW_QUERY_ADMIN_TOKEN``.
+
+This replaces ``echo=True``: echoing logs every statement, while this keeps only
+the statements worth looking at (``SQL_ECHO`` still turns echoing on).
+"""
+import heapq
+import hmac
+import itertools
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, text
+
+from webapp.config import settings
+
+PARAMETERS_LIMIT = 500  # characters of the parameters' repr kept per statement
+# Only plain reads are re-executed by EXPLAIN ANALYZE; anything that could write is left alone
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|EXECUTE)\b", re.IGNORECASE)
+EXECUTE = re.compile(r"^\s*EXECUTE\s+(\w+)", re.IGNORECASE)
+PREPARE = re.compile(r"^\s*PREPARE\s+\w+(\s*\([^)]*\))?\s+AS\s+", re.IGNORECASE)
+EXPLAIN_STATEMENT = "slow_query_explain"  # Name of the explained copy, apart from the connection's own statements
+WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|ALTER|CREATE|DROP|NEXTVAL|SETVAL|FOR\s+UPDATE)\b", re.IGNORECASE)
+
+
+class SlowQueryLog:
+    """
+    The slowest and the most recent statements over the threshold, across the attached engines.
+
+    Args:
+        threshold_ms (float): Statements taking at least this long are recorded (``SLOW_QUERY_MS``).
+        keep (int): Records kept in each of the worst and recent lists (``SLOW_QUERY_KEEP``).
+        explain_rate (float): Fraction of recorded SELECTs that get an EXPLAIN plan (``SLOW_QUERY_EXPLAIN_RATE``).
+    """
+
+    def __init__(self, threshold_ms=None, keep=None, explain_rate=None):
+        # Unset values are read from settings on use, so the module-level log does not load them at import
+        self._threshold_ms = threshold_ms
+        self._keep = keep
+        self._explain_rate = explain_rate
+        self.captured = 0
+        self._worst = []  # min-heap of (duration, sequence, record): the root is the first to go
+        self._recent = deque()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._engines = []
+
+    @property
+    def threshold_ms(self):
+        return settings.SLOW_QUERY_MS if self._threshold_ms is None else self._threshold_ms
+
+    @property
+    def keep(self):
+        return self._keep or settings.SLOW_QUERY_KEEP
+
+    @property
+    def explain_rate(self):
+        return settings.SLOW_QUERY_EXPLAIN_RATE if self._explain_rate is None else self._explain_rate
+
+    def attach(self, engine, name=None):
+        """Time the statements of ``engine`` (idempotent)."""
+        if any(attached is engine for attached, _ in self._engines):
+            return engine
+        name = name or engine.url.render_as_string(hide_password=True)
+        self._engines.append((engine, name))
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["slow_query_start"].pop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms and not conn.info.get("slow_query_explaining"):
+                self.record(engine, name, statement, parameters, elapsed_ms, executemany, cursor=cursor)
+
+        @event.listens_for(engine, "handle_error")
+        def failed(context):
+            starts = context.connection.info.get("slow_query_start") if context.connection is not None else None
+            if starts:
+                starts.pop()  # after_cursor_execute does not run for a failed statement
+
+        return engine
+
+    def record(self, engine, name, statement, parameters, elapsed_ms, executemany=False, cursor=None):
+        """
+        Keep one slow statement and maybe schedule its EXPLAIN.
+
+        ``cursor`` is the DBAPI cursor that ran the statement; an ``EXECUTE`` is only explained when the
+        ``PREPARE`` behind it can be read from that cursor's connection.
+        """
+        entry = {
+            "statement": statement.strip(),
+            "parameters": _truncate(repr(parameters[:3] if executemany else parameters)),
+            "executemany": executemany,
+            "rows": len(parameters) if executemany else None,
+            "duration_ms": round(elapsed_ms, 2),
+            "at": time.time(),
+            "engine": name,
+            "plan": None,
+        }
+        with self._lock:
+            self.captured += 1
+            self._recent.append(entry)
+            if len(self._recent) > self.keep:
+                self._recent.popleft()
+            item = (elapsed_ms, next(self._sequence), entry)
+            if len(self._worst) < self.keep:
+                heapq.heappush(self._worst, item)
+            elif elapsed_ms > self._worst[0][0]:
+                heapq.heapreplace(self._worst, item)
+        if (
+            engine.dialect.name != "postgresql"
+            or executemany
+            or not EXPLAINABLE.match(statement)
+            or random.random() >= self.explain_rate
+        ):
+            return
+        prepared = None
+        executed = EXECUTE.match(statement)
+        if executed:
+            prepared = _prepared_statement(cursor, executed.group(1)) if cursor is not None else None
+            header = PREPARE.match(prepared) if prepared else None
+            body = prepared[header.end():] if header else ""
+            if not re.match(r"\s*(SELECT|WITH)\b", body, re.IGNORECASE) or WRITES.search(body) or ";" in body:
+                return
+            prepared = f"PREPARE {EXPLAIN_STATEMENT}{header.group(1) or ''} AS {body}"
+            statement = EXECUTE.sub(f"EXECUTE {EXPLAIN_STATEMENT}", statement, count=1)
+        elif WRITES.search(statement):
+            return
+        self._explainer.submit(self._explain, engine, entry, statement, parameters, prepared)
+
+    def _explain(self, engine, entry, statement, parameters, prepared=None):
+        try:
+            with engine.connect() as connection:
+                connection.info["slow_query_explaining"] = True
+                try:
+                    connection.execute(text(f"SET LOCAL statement_timeout = '{settings.SLOW_QUERY_EXPLAIN_TIMEOUT}'"))
+                    if prepared is not None:
+                        connection.exec_driver_sql(prepared)
+                    rows = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters).fetchall()
+                finally:
+                    connection.info.pop("slow_query_explaining", None)
+                    connection.rollback()
+                    if prepared is not None:
+                        # Prepared statements outlive the rollback; the pooled connection must not keep the copy
+                        connection.exec_driver_sql(f"DEALLOCATE {EXPLAIN_STATEMENT}")
+                        connection.commit()
+            entry["plan"] = "\n".join(row[0] for row in rows)
+        except Exception as e:
+            entry["plan"] = f"EXPLAIN failed: {e}"
+
+    def worst(self):
+        """The slowest recorded statements, slowest first."""
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._worst, key=lambda item: (-item[0], item[1]))]
+
+    def recent(self):
+        """The most recently recorded statements, newest first."""
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def clear(self):
+        with self._lock:
+            self._worst.clear()
+            self._recent.clear()
+            self.captured = 0
+
+
+def _prepared_statement(cursor, name):
+    """The ``PREPARE`` text of ``name`` on the connection of ``cursor``, or None."""
+    try:
+        lookup = cursor.connection.cursor()  # A raw DBAPI cursor: not timed, and no engine events
+        try:
+            lookup.execute("SELECT statement FROM pg_prepared_statements WHERE name = %s", (name.lower(),))
+            row = lookup.fetchone()
+        finally:
+            lookup.close()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+
+def admin_token_valid(token):
+    """
+    Whether ``token`` is ``SLOW_QUERY_ADMIN_TOKEN``. The captured statements hold query parameters, so
+    the slow-query endpoints are closed until the setting is configured.
+    """
+    expected = settings.SLOW_QUERY_ADMIN_TOKEN
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def _truncate(value):
+    return value if len(value) <= PARAMETERS_LIMIT else value[:PARAMETERS_LIMIT] + "..."
+
+
+slow_queries = SlowQueryLog()
@@ -0,0 +1,205 @@
+"""
+Pre-insert validation of whole batches, with a quarantine for the rows that fail.
+
+Checks run column by column over a batch rather than row by row against the
+database:
+
+* required fields: NOT NULL columns without a default must be present;
+* types: values must fit the column's Python type (numbers for Float, ...);
+* ranges: ``RANGES`` per table, e.g. a sale price cannot be negative;
+* foreign keys: the batch's distinct values are compared with an in-memory set
+  of the referenced keys, loaded with one query per load.
+
+Rows that fail are written with their reasons to the ``quarantined_records``
+table and/or an NDJSON file (``QUARANTINE_TO``), and the rest of the file loads
+in one pass instead of the whole load being rolled back.
+"""
+import json
+import threading
+import time
+
+from sqlalchemy import JSON, Column, Float, Integer, MetaData, Sequence, String, Table, insert, select
+
+from webapp.config import settings
+
+# Inclusive (min, max) bounds per table and column; None leaves a side open
+RANGES = {
+    "sales": {"price": (0, None), "timestamp": (0, None)},
+    "employees": {"salary": (0, None)},
+}
+
+_create_lock = threading.Lock()  # Tables loading concurrently may quarantine their first rows at once
+
+# Kept out of the models' metadata, so resetting the schema does not drop the quarantine
+quarantine_metadata = MetaData()
+QuarantinedRecord = Table(
+    "quarantined_records",
+    quarantine_metadata,
+    # An explicit sequence rather than SERIAL, which DuckDB does not have
+    Column("id", Integer, Sequence("quarantined_records_id_seq"), primary_key=True),
+    Column("table_name", String, nullable=False, index=True),
+    Column("source", String, nullable=True),  # File the record came from
+    Column("record", JSON, nullable=False),
+    Column("reasons", JSON, nullable=False),
+    Column("quarantined_at", Float, nullable=False),
+)
+
+
+def _type_check(python_type):
+    """Predicate for values of a column type; None when the type is not checked."""
+    if python_type is float:
+        return lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+    if python_type is int:
+        return lambda value: isinstance(value, int) and not isinstance(value, bool)
+    if python_type is str:
+        return lambda value: isinstance(value, str)
+    return None
+
+
+class BatchValidator:
+    """
+    Validates batches of records for one table.
+
+    Args:
+        connection: Connection or session used once per referenced table to load its keys.
+        table (Table): Target table (e.g. ``model_class.__table__``).
+    """
+
+    def __init__(self, connection, table):
+        self.connection = connection
+        self.table = table
+        self.required = [
+            column.name
+            for column in table.columns
+            if not column.nullable
+            and column.default is None
+            and column.server_default is None
+            and column.autoincrement is not True
+        ]
+        self.types = {}
+        for column in table.columns:
+            try:
+                check = _type_check(column.type.python_type)
+            except NotImplementedError:
+                check = None
+            if check is not None:
+                self.types[column.name] = (check, column.type.python_type.__name__)
+        self.ranges = RANGES.get(table.name, {})
+        self.foreign_keys = {
+            column.name: next(iter(column.foreign_keys)).column for column in table.columns if column.foreign_keys
+        }
+        self._known = {}
+
+    def known_keys(self, column_name):
+        """The referenced table's keys for a foreign-key column, loaded on first use."""
+        if column_name not in self._known:
+            referenced = self.foreign_keys[column_name]
+            self._known[column_name] = set(self.connection.execute(select(referenced).distinct()).scalars())
+        return self._known[column_name]
+
+    def validate(self, records):
+        """
+        Split a batch into rows that can be inserted and rejected ones.
+
+        Returns:
+            tuple: (valid records, [(record, [reason, ...]), ...])
+        """
+        rows = list(records)
+        reasons = {}
+
+        def reject(indexes, reason):
+            for i in indexes:
+                reasons.setdefault(i, []).append(reason)
+
+        for name in self.required:
+            reject((i for i, row in enumerate(rows) if row.get(name) is None), f"missing required field '{name}'")
+
+        for name, (check, type_name) in self.types.items():
+            reject(
+                (i for i, row in enumerate(rows) if row.get(name) is not None and not check(row[name])),
+                f"'{name}' is not a valid {type_name}",
+            )
+
+        for name, (low, high) in self.ranges.items():
+            check = self.types.get(name, (lambda value: True,))[0]
+            values = [(i, row.get(name)) for i, row in enumerate(rows)]
+            values = [(i, value) for i, value in values if value is not None and check(value)]
+            if low is not None:
+                reject((i for i, value in values if value < low), f"'{name}' is below {low}")
+            if high is not None:
+                reject((i for i, value in values if value > high), f"'{name}' is above {high}")
+
+        for name in self.foreign_keys:
+            # Set difference over the batch's distinct values; only rows holding an unknown key are visited
+            unknown = {row.get(name) for row in rows} - self.known_keys(name) - {None}
+            if unknown:
+                referenced = self.foreign_keys[name]
+                for i, row in enumerate(rows):
+                    if row.get(name) in unknown:
+                        reject((i,), f"unknown {referenced.table.name}.{referenced.name} '{row[name]}'")
+
+        if not reasons:
+            return rows, []
+        valid = [row for i, row in enumerate(rows) if i not in reasons]
+        rejected = [(rows[i], reasons[i]) for i in sorted(reasons)]
+        return valid, rejected
+
+
+def ensure_quarantine_table(session):
+    """
+    Create the quarantine table, when rejected rows go to it, in its own committed transaction.
+
+    Called before a load starts, so the DDL neither joins nor rolls back with a chunk's transaction and
+    concurrent loads do not race to create the table mid-load.
+
+    Args:
+        session (Session): Session on the primary database; its transaction is committed.
+    """
+    if settings.QUARANTINE_TO in ("table", "both"):
+        with _create_lock:
+            QuarantinedRecord.create(bind=session.connection(), checkfirst=True)
+            session.commit()
+
+
+def quarantine(connection, table_name, rejected, source=None):
+    """
+    Keep rejected rows with their reasons (``QUARANTINE_TO``: table, file or both).
+
+    Args:
+        connection: Connection or session; the rows join its transaction. The table must exist
+            (``ensure_quarantine_table``).
+        table_name (str): Table the rows were meant for.
+        rejected (list): (record, reasons) pairs from ``BatchValidator.validate``.
+        source (str): File the rows came from.
+    """
+    if not rejected:
+        return
+    now = time.time()
+    entries = [
+        {
+            "table_name": table_name,
+            "source": source,
+            # Round-trip through JSON so UUIDs and other non-JSON values are stored as text
+            "record": json.loads(json.dumps(record, default=str)),
+            "reasons": reasons,
+            "quarantined_at": now,
+        }
+        for record, reasons in rejected
+    ]
+    if settings.QUARANTINE_TO in ("table", "both"):
+        connection.execute(insert(QuarantinedRecord), entries)  # Created up front by ensure_quarantine_table
+    if settings.QUARANTINE_TO in ("file", "both"):
+        with open(settings.QUARANTINE_PATH, "a", encoding="utf-8") as quarantine_file:
+            quarantine_file.writelines(json.dumps(entry) + "\n" for entry in entries)
+    print(f"⚠ Quarantined {len(entries)} invalid record(s) for '{table_name}' from '{source}'.")
+
+
+def validate_and_quarantine(connection, model_class, records, source=None):
+    """
+    Validate ``records`` for ``model_class``, quarantine the rejected ones and return the valid ones
+    (after ``ensure_quarantine_table``).
+    """
+    # The mapped table keeps the model's defaults; __table__ may have been swapped for a reflected copy
+    valid, rejected = BatchValidator(connection, model_class.__mapper__.local_table).validate(records)
+    quarantine(connection, model_class.__tablename__, rejected, source)
+    return valid
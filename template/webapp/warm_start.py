@@ -0,0 +1,116 @@
+"""
+Warm start: reload only the tables whose inputs changed.
+
+Two fingerprints decide what a run has to do:
+
+* the model schema, i.e. the DDL of ``Base.metadata``, kept in ``schema_state``.
+  If it differs from the stored one, the tables are dropped and recreated as
+  before, and every file is loaded;
+* each source file, kept in the load checkpoints (see ``webapp/checkpoints.py``).
+  A file whose fingerprint already has a complete checkpoint is skipped. One with
+  a partial checkpoint is resumed. A new or changed file is reloaded.
+
+Reloading a table first clears it, together with the tables that reference it
+(sales for sundaes) and the tables derived from it (rollups and sketches for
+sales). Those dependants are then reloaded even if their own files are unchanged.
+"""
+import hashlib
+import time
+
+from sqlalchemy import Column, Float, MetaData, String, Table, delete, exists, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from webapp.backends import upsert
+from webapp.checkpoints import LoadCheckpoints, file_fingerprint
+from webapp.models import Sale, SalesRollup, SalesSketch
+
+# Tables written as a side effect of loading another table, so cleared along with it
+DERIVED_TABLES = {Sale.__tablename__: (SalesRollup.__tablename__, SalesSketch.__tablename__)}
+
+state_metadata = MetaData()
+SchemaState = Table(
+    "schema_state",
+    state_metadata,
+    Column("name", String, primary_key=True),
+    Column("fingerprint", String, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def schema_fingerprint(metadata, dialect):
+    """SHA-256 of the CREATE TABLE and CREATE INDEX statements of ``metadata`` for ``dialect``."""
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()[:32]
+
+
+def schema_changed(connection, fingerprint, name="models"):
+    """Whether ``fingerprint`` differs from the stored schema fingerprint (or none is stored yet)."""
+    SchemaState.create(bind=connection, checkfirst=True)
+    stored = connection.execute(select(SchemaState.c.fingerprint).where(SchemaState.c.name == name)).scalar()
+    return stored != fingerprint
+
+
+def save_schema_fingerprint(connection, fingerprint, name="models"):
+    """Store the fingerprint of the schema the tables were just created with."""
+    SchemaState.create(bind=connection, checkfirst=True)
+    values = {"fingerprint": fingerprint, "updated_at": time.time()}
+    upsert(connection, SchemaState, {"name": name}, values)
+
+
+def dependants(metadata, table_names):
+    """``table_names`` plus every table that references them (transitively) or is derived from them."""
+    result = set(table_names)
+    while True:
+        grown = set(result)
+        for table in metadata.sorted_tables:
+            if any(key.column.table.name in result for key in table.foreign_keys):
+                grown.add(table.name)
+        for name in result:
+            grown.update(DERIVED_TABLES.get(name, ()))
+        if grown == result:
+            return result
+        result = grown
+
+
+def changed_sources(connection, sources):
+    """
+    The tables of ``sources`` whose file has no checkpoint (complete or not) for its current fingerprint.
+
+    Args:
+        connection: Connection to the primary database.
+        sources (list): (file path, model class) pairs.
+    """
+    LoadCheckpoints.create(bind=connection, checkfirst=True)
+    changed = set()
+    for file_path, model_class in sources:
+        known = connection.execute(
+            select(
+                exists().where(
+                    LoadCheckpoints.c.table_name == model_class.__tablename__,
+                    LoadCheckpoints.c.fingerprint == file_fingerprint(file_path),
+                )
+            )
+        ).scalar()
+        if not known:
+            changed.add(model_class.__tablename__)
+    return changed
+
+
+def clear_tables(connection, metadata, table_names):
+    """Empty ``table_names`` (one TRUNCATE on PostgreSQL, so referencing tables are cleared in the same statement)."""
+    tables = [table for table in reversed(metadata.sorted_tables) if table.name in table_names]
+    if not tables:
+        return
+    if connection.dialect.name == "postgresql":
+        quote = connection.dialect.identifier_preparer.quote
+        connection.execute(text(f"TRUNCATE TABLE {', '.join(quote(table.name) for table in tables)}"))
+    else:
+        for table in tables:  # Referencing tables first
+            connection.execute(delete(table))
+    # The checkpoints of the cleared tables no longer describe their contents
+    LoadCheckpoints.create(bind=connection, checkfirst=True)
+    connection.execute(delete(LoadCheckpoints).where(LoadCheckpoints.c.table_name.in_([t.name for t in tables])))
@@ -0,0 +1,90 @@
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from webapp.models import SALES_PARTITIONED, Sale, Sundae
+from webapp.partitions import ensure_partitions, insert_partitioned, route_records
+from webapp.records import insert_records
+from webapp.rollups import maintain_rollups
+from webapp.sketches import maintain_sketches
+from webapp.data_versions import bump_versions
+from webapp.live import publish_deltas, sales_deltas
+from webapp.routing import mark_write
+from webapp.sharding import get_shards
+
+
+def write_records(session, model_class, records):
+    """
+    Insert a batch of records and maintain everything derived from it in the same transaction.
+
+    Args:
+        session (Session): Session whose transaction the batch joins.
+        model_class: ORM model of the target table.
+        records (list): Dict records.
+    """
+    if SALES_PARTITIONED and model_class.__tablename__ == Sale.__tablename__:
+        insert_partitioned(session, model_class, records)
+    else:
+        insert_records(session, model_class, records)
+    maintain_rollups(session, model_class, records)
+    maintain_sketches(session, model_class, records)
+
+
+def write_new_records(session, model_class, records):
+    """
+    Idempotent variant of ``write_records`` for sources that may replay rows (e.g. the sale ingest spill).
+
+    Rows whose primary key already exists are skipped with ON CONFLICT DO NOTHING, and the derived
+    tables are only maintained for the rows actually inserted. Returns the inserted rows' parameters.
+    """
+    table = model_class.__mapper__.local_table
+    keys = [column.name for column in table.primary_key.columns]
+    rows = list(records)
+    if not rows:
+        return []
+    if SALES_PARTITIONED and model_class.__tablename__ == Sale.__tablename__:
+        ensure_partitions(session, set(route_records(rows)))
+
+    stmt = pg_insert(table).on_conflict_do_nothing(index_elements=keys).returning(*[table.c[key] for key in keys])
+    inserted = {tuple(row) for row in session.execute(stmt, rows)}
+    new_rows = [row for row in rows if tuple(row[key] for key in keys) in inserted]
+    maintain_rollups(session, model_class, new_rows)
+    maintain_sketches(session, model_class, new_rows)
+    return new_rows
+
+
+def commit_records(session, model_class, records, checkpoint=None, bump=True):
+    """
+    Write a batch to wherever its table lives and commit it.
+
+    Sales go to their hash shards when ``SALES_SHARD_URLS`` is set (one transaction per shard)
+    and their per-sundae totals are published to live subscribers; sundaes are committed on the primary and then broadcast to the shards; everything else
+    is written and committed through ``session``.
+
+    Args:
+        checkpoint (callable): ``checkpoint(session, shard, rows)``, run inside every transaction that commits
+            part of the batch (``shard`` is None for the primary), e.g. ``Checkpointer.saver(...)``.
+        bump (bool): Bump the table's data version with the batch; False when the caller bumps it once for
+            several batches (``load_in_chunks``).
+    """
+    shards = get_shards()
+    if shards is not None and model_class.__tablename__ == Sale.__tablename__:
+        shards.ensure_schema(model_class)
+        shards.write(model_class, records, write_records, before_commit=checkpoint)
+        # Shards have committed; announce the totals change through the primary
+        publish_deltas(session, sales_deltas(model_class, records))
+        if checkpoint is not None:
+            checkpoint(session, None, 0)  # Progress marker on the primary; the rows live on the shards
+        if bump:
+            bump_versions(session, [model_class.__tablename__])
+        session.commit()
+    else:
+        write_records(session, model_class, records)
+        if checkpoint is not None:
+            checkpoint(session, None, len(records))  # Committed atomically with the rows
+        publish_deltas(session, sales_deltas(model_class, records))  # Delivered only if the commit succeeds
+        if bump:
+            bump_versions(session, [model_class.__tablename__])  # Invalidates the API's ETags for this table
+        session.commit()
+        if shards is not None and model_class.__tablename__ == Sundae.__tablename__:
+            shards.ensure_schema(model_class)
+            shards.broadcast(model_class, records)
+    mark_write()  # Opens the read-your-writes window for replica routing